@@ -0,0 +1,52 @@
+"""
+Micro-benchmarks for django_helpers. These are not part of the test suite,
+run them from the repository root, e.g.:
+
+    python -m benchmarks.active_path
+
+benchmarks.suite runs every helper and compares the results with a
+baseline saved locally.
+"""
+import timeit
+
+
+def setup_django():
+    # Importing the test settings configures django
+    from django_helpers.tests import settings  # noqa
+    from django.db import connections
+
+    # Keep the benchmark tables in memory rather than in the test settings'
+    # test_db file
+    connections.databases['default']['NAME'] = ':memory:'
+
+
+def bench(name, func, number=10000, repeat=5):
+    """
+    Prints and returns the best ops/sec of func over a few repeats.
+    """
+    best = min(timeit.repeat(func, number=number, repeat=repeat))
+    ops = number / best
+    print('{:<50} {:>12,.0f} ops/sec'.format(name, ops))
+    return ops
+
+
+class tables(object):
+    """
+    Context manager that creates the tables for the test models and drops
+    them again afterwards.
+    """
+
+    def __init__(self, *models):
+        self.models = models
+
+    def __enter__(self):
+        from django.db import connection
+        with connection.schema_editor() as editor:
+            for model in self.models:
+                editor.create_model(model)
+
+    def __exit__(self, *exc_info):
+        from django.db import connection
+        with connection.schema_editor() as editor:
+            for model in reversed(self.models):
+                editor.delete_model(model)
@@ -0,0 +1,60 @@
+"""
+Compares the compiled {% active_path %} tag against active_path registered
+as a plain simple_tag (the way it was registered before the compiled tag).
+"""
+from benchmarks import bench, setup_django
+
+setup_django()
+
+from django import template
+from django.conf.urls import include, url
+from django.template import Context, Engine
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.views.generic.base import View
+
+from django_helpers.builtins import active_path
+
+register = template.Library()
+register.simple_tag(takes_context=True, name='simple_active_path')(active_path)
+
+urlpatterns = [
+    url(r'^foo/', include([
+        url(r'^$', View.as_view(), name="view"),
+        url(r'^bar/$', View.as_view(), name="sub-view"),
+        url(r'^baz/(?P<id>[0-9]+)/$', View.as_view(), name="sub-view-id"),
+    ], namespace="namespace"))
+]
+
+CASES = [
+    ('raw path', '"/foo/"'),
+    ('namespace', '"namespace:"'),
+    ('url name', '"namespace:sub-view"'),
+    ('url name + kwargs', '"namespace:sub-view-id" id=10'),
+]
+
+
+def main():
+    engine = Engine(
+        builtins=['django_helpers.builtins'],
+        libraries={'bench': 'benchmarks.active_path'}
+    )
+    request = RequestFactory().get('/foo/baz/10/')
+
+    for name, args in CASES:
+        # 40 tags per render, roughly the size of a sidebar + top nav
+        simple = engine.from_string('{% load bench %}' + '{% simple_active_path ' + args + ' %}' * 40)
+        compiled = engine.from_string('{% active_path ' + args + ' %}' * 40)
+
+        def render(t):
+            context = Context({'request': request})
+            context.request = request
+            return lambda: t.render(context)
+
+        bench('simple_tag  ' + name, render(simple), number=200)
+        bench('compiled    ' + name, render(compiled), number=200)
+
+
+if __name__ == '__main__':
+    with override_settings(ROOT_URLCONF=__name__):
+        main()
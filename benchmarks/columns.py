@@ -0,0 +1,62 @@
+"""
+Renders a 5,000 row table with a filter per cell and with the columns
+pre-formatted by format_column, and times the column formatters against
+formatting the values one by one.
+"""
+import random
+
+from benchmarks import bench, setup_django
+
+setup_django()
+
+from django.template import Template, Context
+
+from django_helpers.builtins import currency, percentage, humanize_time
+from django_helpers.formatting import (
+    format_currency_column,
+    format_percentage_column,
+    format_duration_column
+)
+
+
+def main():
+    random.seed(0)
+    rows = [
+        {'price': random.uniform(-1000, 100000), 'share': random.random(), 'age': random.randrange(100000)}
+        for _ in range(5000)
+    ]
+    prices = [row['price'] for row in rows]
+    shares = [row['share'] for row in rows]
+    ages = [row['age'] for row in rows]
+
+    cases = [
+        ('currency, one by one', lambda: [currency(v) for v in prices]),
+        ('currency, column', lambda: format_currency_column(prices)),
+        ('percentage, one by one', lambda: [percentage(v) for v in shares]),
+        ('percentage, column', lambda: format_percentage_column(shares)),
+        ('humanize_time, one by one', lambda: [humanize_time(v) for v in ages]),
+        ('humanize_time, column', lambda: format_duration_column(ages)),
+    ]
+
+    try:
+        import numpy
+    except ImportError:
+        pass
+    else:
+        array = numpy.array(prices)
+        cases.append(('currency, numpy column', lambda: format_currency_column(array)))
+
+    for name, run in cases:
+        bench('{} x 5000'.format(name), run, number=5, repeat=3)
+
+    filters = Template('{% for row in rows %}{{ row.price|currency }}{% endfor %}')
+    columns = Template(
+        "{% format_column rows 'price' 'currency' as prices %}"
+        "{% for row, price in prices %}{{ price }}{% endfor %}"
+    )
+    context = Context({'rows': rows})
+    bench('template, currency filter per cell', lambda: filters.render(context), number=5, repeat=5)
+    bench('template, format_column', lambda: columns.render(context), number=5, repeat=5)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Compares the currency and percentage filters against the original
+Decimal/floatformat/intcomma implementations (format_currency_slow and
+floatformat) over a column of 5,000 values.
+"""
+import random
+from decimal import Decimal
+
+from benchmarks import bench, setup_django
+
+setup_django()
+
+from django.template.defaultfilters import floatformat
+
+from django_helpers.builtins import currency, intcurrency, percentage
+from django_helpers.formatting import format_currency_slow
+
+
+def main():
+    random.seed(0)
+    floats = [random.uniform(-100000, 1000000) for _ in range(5000)]
+    decimals = [Decimal('{:.2f}'.format(value)) for value in floats]
+    ints = [int(value) for value in floats]
+    fractions = [random.random() for _ in range(5000)]
+
+    cases = [
+        ('currency, floats', lambda: [currency(v) for v in floats]),
+        ('currency, floats (original)', lambda: [format_currency_slow(v) for v in floats]),
+        ('currency, Decimals', lambda: [currency(v) for v in decimals]),
+        ('currency, Decimals (original)', lambda: [format_currency_slow(v) for v in decimals]),
+        ('intcurrency, ints', lambda: [intcurrency(v) for v in ints]),
+        ('intcurrency, ints (original)', lambda: [format_currency_slow(v, True, False) for v in ints]),
+        ('percentage', lambda: [percentage(v) for v in fractions]),
+        ('percentage (original)', lambda: ['{}%'.format(floatformat(v * 100.0, 2)) for v in fractions]),
+    ]
+
+    for name, run in cases:
+        bench('{} x 5000'.format(name), run, number=5, repeat=3)
+
+
+if __name__ == '__main__':
+    main()
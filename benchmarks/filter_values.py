@@ -0,0 +1,62 @@
+"""
+Compares get_filter_value_list (and parse_filter_values with its options)
+against the original nested loop implementation for 10, 1k and 100k ids.
+"""
+from benchmarks import bench, setup_django
+
+setup_django()
+
+from django.http import QueryDict
+
+from django_helpers.filters import get_filter_value_list, parse_filter_values
+
+
+def original_get_filter_value_list(data, key, is_int=False):
+    raw_value = []
+    if isinstance(data, QueryDict):
+        raw_value = data.getlist(key, [])
+    elif not isinstance(data, (list, tuple)):
+        raw_value = data.split(',')
+    else:
+        raw_value = data
+
+    value = []
+    for v in raw_value:
+        if v:
+            for vv in v.split(','):
+                if vv:
+                    if is_int:
+                        try:
+                            value.append(int(vv))
+                        except ValueError:
+                            pass
+                    else:
+                        value.append(vv)
+
+    if not value or value == ['']:
+        value = None
+
+    return value
+
+
+def main():
+    for size in (10, 1000, 100000):
+        ids = ','.join(str(i) for i in range(size))
+        # Split over a few params like ?ids=1,2&ids=3,4
+        data = QueryDict('&'.join('ids=' + ids[i:i + 5000].strip(',') for i in range(0, len(ids), 5000)))
+        number = max(1, 100000 // size)
+
+        assert original_get_filter_value_list(data, 'ids', True) == get_filter_value_list(data, 'ids', True)
+
+        bench('original       {:>6} ids'.format(size), lambda: original_get_filter_value_list(data, 'ids', True), number)
+        bench('single pass    {:>6} ids'.format(size), lambda: get_filter_value_list(data, 'ids', True), number)
+        bench('unique + max   {:>6} ids'.format(size), lambda: parse_filter_values(
+            data, 'ids', is_int=True, unique=True, max_items=size), number)
+        bench('compact        {:>6} ids'.format(size), lambda: parse_filter_values(
+            data, 'ids', is_int=True, compact=True), number)
+
+    bench('range 1-100000', lambda: parse_filter_values('1-100000', 'ids', is_int=True, ranges=True), 10)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Fixtures for the benchmark suite: a URLconf with a nav tree, template
+sources and the rows for the SQLite tables. Everything is generated from a
+fixed seed so every run measures the same work.
+"""
+import datetime
+import random
+from decimal import Decimal
+
+from django.conf.urls import include, url
+from django.views.generic.base import View
+
+SECTIONS = ['catalog', 'orders', 'customers', 'reports', 'settings']
+PAGES = ['list', 'detail', 'edit', 'history']
+
+# /<section>/<page>/<id>/ named <section>:<page>
+urlpatterns = [
+    url(r'^{}/'.format(section), include([
+        url(r'^{}/(?P<id>[0-9]+)/$'.format(page), View.as_view(), name=page)
+        for page in PAGES
+    ], namespace=section))
+    for section in SECTIONS
+]
+
+# A top nav of the sections and a sidebar of the pages in every section
+NAV_TEMPLATE = ''.join(
+    '<a class="{{% active_path "{0}:" %}}" href="/{0}/">{0}</a>'.format(section) +
+    ''.join(
+        '<a class="{{% active_path "{0}:{1}" id=7 %}}" href="/{0}/{1}/7/">{1}</a>'.format(section, page)
+        for page in PAGES
+    )
+    for section in SECTIONS
+)
+
+# 200 links over 4 facets, each a toggle with its active state
+FACET_TEMPLATE = (
+    '{% for facet, values in facets %}'
+    '{% for value in values %}'
+    '<a class="{% active_query_by_key facet value %}" href="?{% query_toggle_by_key facet value %}">'
+    '{{ value }}</a>'
+    '{% endfor %}'
+    '{% endfor %}'
+)
+
+FACET_LINKS_TEMPLATE = (
+    '{% for facet, values in facets %}'
+    '{% query_toggle_links facet values as links %}'
+    '{% for value, query_string, active in links %}'
+    '<a class="{% if active %}active{% endif %}" href="?{{ query_string }}">{{ value }}</a>'
+    '{% endfor %}'
+    '{% endfor %}'
+)
+
+CACHED_FACET_TEMPLATE = (
+    "{% query_cache 'facets' 300 only 'color' 'size' 'brand' 'tags' %}" + FACET_TEMPLATE + '{% endquery_cache %}'
+)
+
+CURRENCY_TEMPLATE = (
+    '{% for row in rows %}<tr><td>{{ row.price|currency }}</td><td>{{ row.cost|intcurrency }}</td>'
+    '<td>{{ row.margin|percentage }}</td></tr>{% endfor %}'
+)
+
+CURRENCY_COLUMNS_TEMPLATE = (
+    "{% format_column rows 'price' 'currency' as prices %}"
+    '{% for row, price in prices %}<tr><td>{{ price }}</td></tr>{% endfor %}'
+)
+
+FACETS = [
+    ('color', ['color-{}'.format(i) for i in range(50)]),
+    ('size', ['size-{}'.format(i) for i in range(50)]),
+    ('brand', ['brand-{}'.format(i) for i in range(50)]),
+    ('tags', ['tag-{}'.format(i) for i in range(50)]),
+]
+
+FACET_QUERY = {
+    'color': ['color-3', 'color-17'],
+    'size': ['size-8'],
+    'tags': ['tag-1', 'tag-2', 'tag-40'],
+    'page': '3',
+    'sort': 'price',
+}
+
+WORDS = [
+    'red', 'blue', 'green', 'black', 'white', 'leather', 'canvas', 'running', 'walking',
+    'shoe', 'boot', 'sandal', 'jacket', 'coat', 'shirt', 'classic', 'sport', 'trail',
+]
+
+
+def currency_rows(count=10000):
+    rng = random.Random(0)
+    rows = []
+    for i in range(count):
+        price = rng.uniform(-5000, 250000)
+        rows.append({
+            'price': price,
+            'cost': int(price * 0.6),
+            'margin': rng.random(),
+            'elapsed': rng.randrange(1, 10 ** 7),
+        })
+    return rows
+
+
+def grid_rows(count=5000):
+    rng = random.Random(0)
+    start = datetime.date(2016, 1, 1)
+    return [
+        {
+            'id': i,
+            'name': 'Item <{}> & co'.format(i),
+            'price': Decimal('{:.2f}'.format(rng.uniform(0, 10000))),
+            'date': start + datetime.timedelta(days=i % 365),
+        }
+        for i in range(count)
+    ]
+
+
+def create_items(Item, Tag, count=20000, tag_count=50, tags_per_item=3):
+    """
+    Creates count items named from WORDS with tags_per_item of tag_count
+    tags each.
+    """
+    from django.db import transaction
+
+    rng = random.Random(0)
+    with transaction.atomic():
+        Tag.objects.bulk_create(
+            Tag(name='Tag {}'.format(i), slug='tag-{}'.format(i)) for i in range(tag_count)
+        )
+        Item.objects.bulk_create(
+            Item(name=' '.join(rng.sample(WORDS, 4)) + ' {}'.format(i), price=rng.randrange(3))
+            for i in range(count)
+        )
+
+        tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        Through = Item.tags.through
+        Through.objects.bulk_create(
+            Through(item_id=item_id, tag_id=tag_id)
+            for item_id in Item.objects.values_list('pk', flat=True)
+            for tag_id in rng.sample(tag_ids, tags_per_item)
+        )
@@ -0,0 +1,41 @@
+"""
+Compares rendering a 1,000 row currency table without the tag timing,
+with it installed but not recording and while recording.
+"""
+from benchmarks import bench, setup_django
+
+setup_django()
+
+from django.template import Context, Engine
+
+from django_helpers.instrumentation import install, uninstall, record_renders
+
+from benchmarks import fixtures
+
+
+def compile_template():
+    # A new engine, so the template is compiled with the tags as they are now
+    engine = Engine(builtins=['django_helpers.builtins'])
+    template = engine.from_string(fixtures.CURRENCY_TEMPLATE)
+    context = Context({'rows': fixtures.currency_rows(1000)})
+    return lambda: template.render(context)
+
+
+def main():
+    bench('currency table, not installed', compile_template(), number=20, repeat=3)
+
+    install()
+    try:
+        render = compile_template()
+        bench('currency table, installed', render, number=20, repeat=3)
+
+        def recorded():
+            with record_renders():
+                render()
+        bench('currency table, recording', recorded, number=20, repeat=3)
+    finally:
+        uninstall()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+"""
+Benchmarks every helper in builtins, filters and utils on realistic
+fixtures (see benchmarks.fixtures) against a SQLite database, with no
+network access. For every case it reports ops/sec and the peak memory
+allocated by one run, and compares them with the stored baseline:
+
+    python -m benchmarks.suite                 # compare with baseline.json
+    python -m benchmarks.suite --save          # store a new baseline
+    python -m benchmarks.suite --only filters  # only the matching cases
+
+Speeds are stored relative to a pure Python reference workload timed in
+the same run, which takes out how fast the machine is but not how noisy
+it is. The run fails (exit status 1) when a case is slower than the
+baseline relative to the reference, or allocates more, by more than
+--threshold (25% by default).
+
+baseline.json isn't committed: the ratios still shift between
+interpreters, CPUs and busy machines. Save a baseline locally, on a quiet
+machine, before making changes and compare with it afterwards.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+from collections import OrderedDict
+
+from benchmarks import setup_django, tables
+
+setup_django()
+
+from django.core.cache import cache
+from django.http import QueryDict
+from django.template import Context, Engine
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+import django_filters
+
+from django_helpers import builtins, utils
+from django_helpers.filters import (
+    DefaultFilterSet,
+    TagFilter,
+    SearchFilter,
+    IdListFilter,
+    parse_filter_values
+)
+from django_helpers.tests.models import Item, Tag
+
+from benchmarks import fixtures
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# (name, function returning the callable to time), in order
+CASES = []
+
+
+def case(name):
+    def register(setup):
+        CASES.append((name, setup))
+        return setup
+    return register
+
+
+def measure(func, repeat=3):
+    """
+    Returns the best ops/sec of func and the peak memory in KB allocated
+    by one call. The number of calls per timing is picked so a timing takes
+    at least 0.2 seconds.
+    """
+    func()
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(number=number, repeat=repeat))
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return number / best, peak / 1024.0
+
+
+def reference():
+    """
+    The workload every case is compared with: plain Python with no django
+    or database code, so it only measures the interpreter and the machine.
+    """
+    values = {}
+    for i in range(2000):
+        values['key {}'.format(i)] = [i, str(i), i * 0.5]
+    return sorted(values.items(), key=lambda item: item[1][1])
+
+
+def render(source, request=None, **context):
+    template = Engine.get_default().from_string(source)
+    context = Context(dict(context, request=request))
+    context.request = request
+    return lambda: template.render(context)
+
+
+def facet_request():
+    return RequestFactory().get('/catalog/list/7/', fixtures.FACET_QUERY)
+
+
+# builtins
+
+@case('builtins.active_path nav tree (25 links)')
+def active_path_nav():
+    return render(fixtures.NAV_TEMPLATE, RequestFactory().get('/catalog/edit/7/'))
+
+
+@case('builtins.query_toggle facet sidebar (200 links)')
+def query_toggle_sidebar():
+    return render(fixtures.FACET_TEMPLATE, facet_request(), facets=fixtures.FACETS)
+
+
+@case('builtins.query_toggle_links facet sidebar (200 links)')
+def query_toggle_links_sidebar():
+    return render(fixtures.FACET_LINKS_TEMPLATE, facet_request(), facets=fixtures.FACETS)
+
+
+@case('builtins.query_cache facet sidebar (200 links, cached)')
+def query_cache_sidebar():
+    cache.clear()
+    return render(fixtures.CACHED_FACET_TEMPLATE, facet_request(), facets=fixtures.FACETS)
+
+
+@case('builtins.query and query_key_exists')
+def query_tags():
+    return render(
+        '{% query page=4 %}{% query sort="name" page=None %}'
+        '{% query_key_exists "color" %}x{% endquery_key_exists %}' * 20,
+        facet_request()
+    )
+
+
+@case('builtins.currency table (10k rows template)')
+def currency_table():
+    return render(fixtures.CURRENCY_TEMPLATE, rows=fixtures.currency_rows())
+
+
+@case('builtins.format_column currency (10k rows template)')
+def currency_columns():
+    return render(fixtures.CURRENCY_COLUMNS_TEMPLATE, rows=fixtures.currency_rows())
+
+
+@case('builtins.currency (10k values)')
+def currency_values():
+    values = [row['price'] for row in fixtures.currency_rows()]
+    return lambda: [builtins.currency(v) for v in values]
+
+
+@case('builtins.percentage (10k values)')
+def percentage_values():
+    values = [row['margin'] for row in fixtures.currency_rows()]
+    return lambda: [builtins.percentage(v) for v in values]
+
+
+@case('builtins.humanize_time (10k values)')
+def humanize_time_values():
+    values = [row['elapsed'] for row in fixtures.currency_rows()]
+    return lambda: [builtins.humanize_time(v) for v in values]
+
+
+@case('builtins.to_json grid (5k rows)')
+def to_json_grid():
+    rows = fixtures.grid_rows()
+    return lambda: builtins.to_json(rows)
+
+
+# filters
+
+class ItemFilterSet(DefaultFilterSet):
+    tags = TagFilter(subquery=True)
+    search = SearchFilter(['name__icontains', 'tags__name__icontains'], exact=False)
+    id = IdListFilter()
+    price = django_filters.MultipleChoiceFilter(choices=[('0', '0'), ('1', '1'), ('2', '2')])
+
+    class Meta:
+        model = Item
+        fields = ['tags', 'search', 'id', 'price']
+
+
+def filtered(query_string):
+    data = QueryDict(query_string)
+    return lambda: list(ItemFilterSet(data, Item.objects.order_by('pk')).qs[:50])
+
+
+@case('filters.SearchFilter 3 terms over 20k items')
+def search_filter():
+    return filtered('search=red+leather+shoe')
+
+
+@case('filters.TagFilter 3 tags over 20k items')
+def tag_filter():
+    return filtered('tags=tag-1&tags=tag-2&tags=tag-3')
+
+
+@case('filters.IdListFilter 1k ids with ranges')
+def id_list_filter():
+    ids = list(Item.objects.order_by('pk').values_list('pk', flat=True)[:2000:2])
+    return filtered('id=' + ','.join(str(i) for i in ids))
+
+
+@case('filters.facet_counts price and tags')
+def facet_counts():
+    data = QueryDict('tags=tag-1&price=1')
+    return lambda: ItemFilterSet(data, Item.objects.all()).facet_counts('price', 'tags')
+
+
+@case('filters.DefaultFilterSet qs build (no query)')
+def filterset_build():
+    data = QueryDict('tags=tag-1&search=red+shoe&id=1,2,3,10-20&price=1&price=2')
+    return lambda: ItemFilterSet(data, Item.objects.all()).qs
+
+
+@case('filters.parse_filter_values 10k ids')
+def filter_values():
+    data = QueryDict('ids=' + ','.join(str(i) for i in range(10000)))
+    return lambda: parse_filter_values(data, 'ids', is_int=True, unique=True)
+
+
+# utils
+
+@case('utils.paginate page 50 of 20k items')
+def paginate_counted():
+    request = RequestFactory().get('/', {'page': 50})
+    return lambda: list(utils.paginate(request, Item.objects.order_by('pk'), 50))
+
+
+@case('utils.paginate count=False page 50 of 20k items')
+def paginate_uncounted():
+    request = RequestFactory().get('/', {'page': 50})
+    return lambda: list(utils.paginate(request, Item.objects.order_by('pk'), 50, count=False))
+
+
+@case('utils.paginate keyset page of 20k items')
+def paginate_keyset():
+    items = Item.objects.order_by('name', 'pk')
+    first = utils.paginate(RequestFactory().get('/'), items, 50, keyset=True)
+    request = RequestFactory().get('/', {'cursor': first.next_cursor})
+    return lambda: list(utils.paginate(request, items, 50, keyset=True))
+
+
+@case('utils.chunked_iterator 20k values')
+def chunked_iterator():
+    return lambda: sum(1 for _ in utils.chunked_iterator(Item.objects.all(), 2000, values_list=['name'], flat=True))
+
+
+@case('utils.QueryState urlencode')
+def query_state():
+    request = facet_request()
+
+    def run():
+        request._query_state_cache = None
+        state = utils.get_query_state(request)
+        for key, values in fixtures.FACETS:
+            state.urlencode({key: [values[0]]})
+    return run
+
+
+def run_cases(only=None):
+    """
+    Returns the ops/sec, the ops/sec relative to the reference workload and
+    the peak memory of every case, by name.
+    """
+    before = measure(reference, repeat=5)[0]
+
+    results = OrderedDict()
+    for name, setup in CASES:
+        if only and not any(pattern in name for pattern in only):
+            continue
+        ops, peak = measure(setup())
+        results[name] = {'ops': ops, 'peak_kb': round(peak, 1)}
+        print('{:<60} {:>12,.1f} ops/sec {:>10,.1f} KB'.format(name, ops, peak))
+        sys.stdout.flush()
+
+    # Timed before and after the cases, the best run is the least disturbed
+    reference_ops = max(before, measure(reference, repeat=5)[0])
+    print('{:<60} {:>12,.1f} ops/sec'.format('reference', reference_ops))
+    for result in results.values():
+        result['relative'] = round(result['ops'] / reference_ops, 6)
+        result['ops'] = round(result['ops'], 1)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints each case against the baseline and returns the names of the
+    cases that regressed by more than threshold.
+    """
+    regressions = []
+    print('\n{:<60} {:>10} {:>10}'.format('compared to baseline', 'ops/sec', 'memory'))
+    for name, result in results.items():
+        if 'relative' not in baseline.get(name, {}):
+            print('{:<60} {:>10}'.format(name, 'new'))
+            continue
+
+        speed = result['relative'] / baseline[name]['relative']
+        memory = (result['peak_kb'] + 1) / (baseline[name]['peak_kb'] + 1)
+        regressed = speed < 1 - threshold or memory > 1 + threshold
+        if regressed:
+            regressions.append(name)
+
+        print('{:<60} {:>9.0%} {:>10.0%}{}'.format(
+            name, speed, memory, '  REGRESSION' if regressed else ''
+        ))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--baseline', default=BASELINE, help='the baseline file')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='the fraction slower (or more memory) that fails')
+    parser.add_argument('--only', action='append', help='only run the cases containing this')
+    args = parser.parse_args(argv)
+
+    with override_settings(ROOT_URLCONF='benchmarks.fixtures'), tables(Tag, Item):
+        fixtures.create_items(Item, Tag)
+        results = run_cases(args.only)
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print('\nSaved the baseline to {}'.format(args.baseline))
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('\nNo baseline at {}, run with --save to store one'.format(args.baseline))
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print('\n{} case(s) regressed by more than {:.0%}'.format(len(regressions), args.threshold))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Compares the TagFilter query shapes on SQLite: the plain join (which needs a
+DISTINCT to drop the duplicate rows), the pk IN subquery and the conjoined
+GROUP BY ... HAVING subquery.
+"""
+import random
+
+from benchmarks import bench, setup_django, tables
+
+setup_django()
+
+from django.db import transaction
+
+from django_helpers.filters import DefaultFilterSet, TagFilter
+from django_helpers.tests.models import Item, Tag
+
+
+def filterset(**kwargs):
+    class ItemFilterSet(DefaultFilterSet):
+        tags = TagFilter(**kwargs)
+
+        class Meta:
+            model = Item
+            fields = ['tags']
+
+    return ItemFilterSet
+
+
+def main():
+    random.seed(0)
+    tags = [Tag.objects.create(name=str(i), slug='tag-{}'.format(i)) for i in range(50)]
+
+    with transaction.atomic():
+        Item.objects.bulk_create(Item(name='item {}'.format(i)) for i in range(5000))
+        Through = Item.tags.through
+        Through.objects.bulk_create(
+            Through(item_id=item_id, tag_id=tag.pk)
+            for item_id in Item.objects.values_list('pk', flat=True)
+            for tag in random.sample(tags, 5)
+        )
+
+    data = {'tags': ['tag-1', 'tag-2', 'tag-3']}
+    cases = [
+        ('join + distinct', filterset(), True),
+        ('subquery', filterset(subquery=True), False),
+        ('subquery, resolve_ids', filterset(subquery=True, resolve_ids=True), False),
+        ('conjoined', filterset(conjoined=True), False),
+        ('conjoined, resolve_ids', filterset(conjoined=True, resolve_ids=True), False),
+    ]
+
+    for name, FilterSet, distinct in cases:
+        def run():
+            qs = FilterSet(data, Item.objects.all()).qs
+            if distinct:
+                qs = qs.distinct()
+            return list(qs)
+
+        bench(name, run, number=20)
+
+
+if __name__ == '__main__':
+    with tables(Tag, Item):
+        main()
@@ -0,0 +1,55 @@
+"""
+Times to_json with each installed JSON backend on chart and grid sized
+payloads (rows of numbers, strings, Decimals and dates), and streaming the
+largest one with iter_dumps.
+"""
+import datetime
+import random
+from decimal import Decimal
+
+from benchmarks import bench, setup_django
+
+setup_django()
+
+from django_helpers.builtins import to_json
+from django_helpers.encoders import JSON_BACKENDS, iter_dumps
+
+
+def rows(count):
+    random.seed(0)
+    start = datetime.date(2016, 1, 1)
+    return [
+        {
+            'id': i,
+            'name': 'Item <{}> & co'.format(i),
+            'price': Decimal('{:.2f}'.format(random.uniform(0, 10000))),
+            'share': random.random(),
+            'date': start + datetime.timedelta(days=i % 365),
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    payloads = [
+        ('chart, 100 rows', rows(100), 500),
+        ('grid, 5,000 rows', rows(5000), 10),
+        ('export, 50,000 rows', rows(50000), 1),
+    ]
+    names = [name for name, backend in JSON_BACKENDS if backend is not None]
+
+    for payload_name, payload, number in payloads:
+        size = len(to_json(payload, 'json'))
+        for name in names:
+            bench('{} ({:,} bytes), {}'.format(payload_name, size, name),
+                  lambda: to_json(payload, name), number=number, repeat=3)
+
+    payload_name, payload, number = payloads[-1]
+    for name in names:
+        bench('{}, {} streamed'.format(payload_name, name),
+              lambda: sum(len(part) for part in iter_dumps(payload, backend=name)),
+              number=number, repeat=3)
+
+
+if __name__ == '__main__':
+    main()
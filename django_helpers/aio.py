@@ -0,0 +1,181 @@
+"""
+Async counterparts of the pagination and filterset helpers for async views.
+This module needs Python 3.5+ (async def) so it is kept apart from utils and
+filters.
+
+Queries run with the ORM's async methods when Django has them (4.1+), else
+with asgiref's sync_to_async when it is installed, else in the event loop's
+default executor. When the backend allows it (see can_run_concurrently) independent
+queries, e.g. the COUNT and the page, run at the same time on their own
+connections in the loop's default executor.
+"""
+import asyncio
+from collections import OrderedDict
+from functools import partial
+
+from django.core.paginator import Paginator, Page, EmptyPage
+from django.db import connections, close_old_connections
+from django.db.models.query import QuerySet
+
+from .utils import CachedCountPaginator, paginate
+
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:  # Django < 3.0
+    sync_to_async = None
+
+try:
+    from asyncio import get_running_loop
+except ImportError:  # Python < 3.7, the same inside a coroutine
+    from asyncio import get_event_loop as get_running_loop
+
+
+def can_run_concurrently(items):
+    """
+    Returns True when queries on items can run at the same time on separate
+    connections: items is a queryset, the database isn't SQLite (which
+    serializes access to the file) and there is no open transaction (the
+    other connections wouldn't see its changes).
+    """
+    if not isinstance(items, QuerySet):
+        return False
+    connection = connections[items.db]
+    return connection.vendor != 'sqlite' and not connection.in_atomic_block
+
+
+def call_in_thread(func, *args):
+    # Like a request, a worker thread's connection is closed once it's
+    # past its CONN_MAX_AGE
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+def in_atomic_block():
+    return any(connection.in_atomic_block for connection in connections.all())
+
+
+async def run_query(func, *args, concurrent=False):
+    """
+    Calls func(*args), which runs queries, without blocking the event loop.
+    With concurrent=True it runs in the loop's default executor, on that
+    thread's own connection, else with sync_to_async. Without asgiref it
+    runs in the executor too, unless a transaction is open: other
+    connections can't see its changes, so then it runs in this thread.
+    """
+    if concurrent:
+        return await get_running_loop().run_in_executor(None, partial(call_in_thread, func, *args))
+    if sync_to_async is not None:
+        return await sync_to_async(func, thread_sensitive=True)(*args)
+    if in_atomic_block():
+        return func(*args)
+    return await get_running_loop().run_in_executor(None, partial(call_in_thread, func, *args))
+
+
+async def acount(items, concurrent=False):
+    """
+    Returns the count of a queryset (or of a FilterSet's qs) or the length
+    of a sequence.
+    """
+    if hasattr(items, 'qs'):
+        items = await run_query(lambda: items.qs)
+    if not concurrent and hasattr(items, 'acount'):
+        return await items.acount()
+    if isinstance(items, QuerySet):
+        return await run_query(items.count, concurrent=concurrent)
+    return len(items)
+
+
+async def alist(items, concurrent=False):
+    """
+    Returns the rows of a queryset (or of a FilterSet's qs) as a list.
+    """
+    if hasattr(items, 'qs'):
+        items = await run_query(lambda: items.qs)
+    if not concurrent and hasattr(items, '__aiter__'):
+        return [row async for row in items]
+    return await run_query(list, items, concurrent=concurrent)
+
+
+async def gather(*coros, concurrent=False):
+    """
+    Awaits the coroutines together when concurrent, else one after the
+    other, and returns their results in order.
+    """
+    if concurrent:
+        return await asyncio.gather(*coros)
+    return [await coro for coro in coros]
+
+
+async def apaginate(request, items, page_size, count=True, concurrent=None):
+    """
+    Async version of paginate, items can also be a FilterSet. The COUNT
+    query and the query for the requested page run concurrently when
+    concurrent is True, None (the default) picks it with
+    can_run_concurrently. If the page turns out to be out of range the
+    last page is fetched afterwards, or the first with count=False.
+    """
+    if hasattr(items, 'qs'):
+        items = await run_query(lambda: items.qs)
+
+    if count is False:
+        return await run_query(partial(paginate, request, items, page_size, count=False))
+
+    if concurrent is None:
+        concurrent = can_run_concurrently(items)
+
+    if count is True:
+        paginator = Paginator(items, page_size)
+    else:
+        paginator = CachedCountPaginator(items, page_size, timeout=count)
+
+    try:
+        number = int(request.GET.get('page'))
+    except (TypeError, ValueError):
+        number = 1
+
+    # Accessing count caches it on the paginator, so the page numbers below
+    # don't run another query
+    total = run_query(lambda: paginator.count, concurrent=concurrent)
+    if number < 1:
+        total = await total
+        rows = None
+    else:
+        bottom = (number - 1) * page_size
+        total, rows = await gather(
+            total, alist(items[bottom:bottom + page_size], concurrent),
+            concurrent=concurrent
+        )
+
+    try:
+        number = paginator.validate_number(number)
+    except EmptyPage:
+        number = paginator.num_pages
+        rows = None
+
+    if rows is None:
+        bottom = (number - 1) * page_size
+        rows = await alist(items[bottom:bottom + page_size], concurrent)
+
+    return Page(rows, number, paginator)
+
+
+async def aevaluate(filterset, facets=(), concurrent=None):
+    """
+    Returns the results of a DefaultFilterSet as a list and its facet counts
+    (see DefaultFilterSet.facet_counts) for the named filters, running the
+    queries concurrently when the backend allows it.
+    """
+    qs = await run_query(lambda: filterset.qs)
+    if concurrent is None:
+        concurrent = can_run_concurrently(qs)
+
+    results = await gather(
+        alist(qs, concurrent),
+        *[run_query(filterset.get_facet, name, concurrent=concurrent) for name in facets],
+        concurrent=concurrent
+    )
+
+    return results[0], OrderedDict(zip(facets, results[1:]))
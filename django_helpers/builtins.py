@@ -1,11 +1,19 @@
-import json
-from decimal import Decimal, ROUND_HALF_UP
+from collections import OrderedDict
 
 from django import template
-from django.core.urlresolvers import resolve, Resolver404
-
-from django.template.defaultfilters import floatformat
-from django.contrib.humanize.templatetags.humanize import intcomma
+from django.core.cache import cache
+from django.template.library import parse_bits
+from django.utils.html import conditional_escape, format_html
+from django.utils.safestring import mark_safe
+
+from .encoders import dumps
+from .formatting import (
+    format_currency,
+    format_percentage,
+    format_duration,
+    COLUMN_FORMATTERS
+)
+from .utils import get_query_state, resolve_request, query_cache_key
 
 register = template.Library()
 
@@ -18,45 +26,159 @@ def get_item(dictionary, key):
     return dictionary.get(key)
 
 
-@register.simple_tag(takes_context=True)
 def active_path(context, path, exact=False, active_class="active", **kwargs):
     """
     This tag will return the active_class when the current route matches the
     path passed in. This is useful for marking menu items as active when a user
     is on that menu item's page.
     """
+    matcher = active_path_matcher(path, exact, kwargs)
+    return active_class if matcher(context['request']) else ''
 
-    is_match = False
 
-    try:
-        match = resolve(context['request'].path)
+def active_path_matcher(path, exact=False, kwargs=None):
+    """
+    Returns a function that takes a request and returns True when it matches
+    the path using the same rules as active_path. The path is a namespace
+    prefix ending in ':', a 'namespace:url_name' pair or a raw path prefix
+    and the branch for it is picked here once instead of on every call.
+    """
+    kwargs = [(k, str(v)) for k, v in (kwargs or {}).items()]
 
-        if path.endswith(':') and match.namespace.startswith(path[:-1]):
-            is_match = True
-        elif path == match.namespace + ':' + match.url_name:
-            is_match = True
-        else:
-            is_match = False
-
-        # check kwargs
-        if is_match:
-            for k, v in kwargs.items():
-                if k not in match.kwargs or str(match.kwargs[k]) != str(v):
-                    is_match = False
-
-    except Resolver404:
-        pass
-
-    if not is_match:
-        current_path = context['request'].path
-        if exact and path == current_path:
-            is_match = True
-        elif not exact and current_path.startswith(path):
-            is_match = True
-        else:
+    if exact:
+        def path_matches(request):
+            return request.path == path
+    else:
+        def path_matches(request):
+            return request.path.startswith(path)
+
+    if path.endswith(':'):
+        namespace = path[:-1]
+
+        def url_matches(match):
+            return match.namespace.startswith(namespace)
+    elif ':' in path:
+        def url_matches(match):
+            return path == match.namespace + ':' + match.url_name
+    else:
+        # A url name always contains a ':' so only the raw path can match and
+        # there is no need to resolve the request at all.
+        return path_matches
+
+    def matches(request):
+        # The match is cached on the request (see ResolverMatchMiddleware)
+        match = resolve_request(request)
+
+        if match is not None and url_matches(match):
+            for k, v in kwargs:
+                if k not in match.kwargs or str(match.kwargs[k]) != v:
+                    break
+            else:
+                return True
+
+        return path_matches(request)
+
+    return matches
+
+
+@register.tag('active_path')
+def do_active_path(parser, token):
+    """
+    Compiled version of active_path. It takes the same arguments as the
+    function (and supports "as varname") but literal arguments are parsed
+    once when the template is compiled, only variables are resolved when the
+    tag renders.
+    """
+    bits = token.split_contents()[1:]
+
+    target_var = None
+    if len(bits) >= 2 and bits[-2] == 'as':
+        target_var = bits[-1]
+        bits = bits[:-2]
+
+    args, kwargs = parse_bits(
+        parser, bits, ['context', 'path', 'exact', 'active_class'], None,
+        'kwargs', (False, 'active'), True, 'active_path'
+    )
+
+    return ActivePathNode(args, kwargs, target_var)
+
+
+class ActivePathNode(template.Node):
+    def __init__(self, args, kwargs, target_var):
+        kwargs = dict(kwargs)
+        for name, value in zip(['path', 'exact', 'active_class'], args):
+            kwargs[name] = value
+
+        self.path = kwargs.pop('path')
+        self.exact = kwargs.pop('exact', False)
+        self.active_class = kwargs.pop('active_class', 'active')
+        self.kwargs = kwargs
+        self.target_var = target_var
+
+        # Split out the arguments that must be resolved at render time
+        self.variables = {}
+        self.literals = {}
+        for name, value in kwargs.items():
+            if is_literal(value):
+                self.literals[name] = resolve_literal(value)
+            else:
+                self.variables[name] = value
+
+        for name in ('path', 'exact', 'active_class'):
+            value = getattr(self, name)
+            if isinstance(value, template.base.FilterExpression):
+                if is_literal(value):
+                    setattr(self, name, resolve_literal(value))
+                else:
+                    self.variables[name] = value
+
+        self.matcher = None
+        if not set(self.variables) - {'active_class'}:
+            self.matcher = active_path_matcher(self.path, self.exact, self.literals)
+
+    def render(self, context):
+        values = dict((name, value.resolve(context)) for name, value in self.variables.items())
+        active_class = values.pop('active_class', self.active_class)
+
+        matcher = self.matcher
+        if matcher is None:
+            path = values.pop('path', self.path)
+            exact = values.pop('exact', self.exact)
+            matcher = active_path_matcher(path, exact, dict(self.literals, **values))
+
+        output = active_class if matcher(context['request']) else ''
+
+        if self.target_var is not None:
+            context[self.target_var] = output
             return ''
+        if context.autoescape:
+            output = conditional_escape(output)
+        return output
+
+
+TEMPLATE_CONSTANTS = {'True': True, 'False': False, 'None': None}
+
+
+def is_literal(value):
+    """
+    Returns True when a compiled FilterExpression is a constant (a quoted
+    string, a number or True/False/None without any filters) that can be
+    resolved at compile time with resolve_literal.
+    """
+    if value.filters:
+        return False
+    if isinstance(value.var, template.Variable):
+        return value.var.literal is not None or value.var.var in TEMPLATE_CONSTANTS
+    return True
+
 
-    return active_class if is_match else ''
+def resolve_literal(value):
+    if isinstance(value.var, template.Variable):
+        if value.var.literal is not None:
+            return value.var.literal
+        return TEMPLATE_CONSTANTS[value.var.var]
+    return value.var
 
 
 @register.simple_tag(takes_context=True)
@@ -66,13 +188,11 @@ def active_query(context, active_class="active", **kwargs):
     the values passed into the kwargs. This is useful for making filters
     "active" when they exist in the url params.
     """
-    
-    query_dict = context['request'].GET.copy()
+    state = get_query_state(context['request'])
     for k, v in kwargs.items():
         v = str(v)
-        if k in query_dict:
-            items = query_dict.getlist(k)
-            if str(v) not in items:
+        if k in state:
+            if v not in state.getlist(k):
                 return ''
         elif v is not None:
             return ''
@@ -96,14 +216,11 @@ def query(context, **kwargs):
     with the values passed in as kwargs (if an existing parameter is not in the
     kwargs it will remain unchanged in the returned url).
     """
-    updated = context['request'].GET.copy()
+    changes = OrderedDict()
     for k, v in kwargs.items():
-        if v is None:
-            updated.pop(k, None)
-        else:
-            updated[k] = v
+        changes[k] = None if v is None else [v]
 
-    return updated.urlencode()
+    return get_query_state(context['request']).urlencode(changes)
 
 
 @register.simple_tag(takes_context=True)
@@ -124,20 +241,17 @@ def query_toggle(context, **kwargs):
     passed in as kwargs. If the value of a kwarg exists in the url params it will
     be removed, if it does not exist it will be added.
     """
-    updated = context['request'].GET.copy()
+    state = get_query_state(context['request'])
+    changes = OrderedDict()
     for k, v in kwargs.items():
         v = str(v)
-        if k in updated:
-            items = updated.getlist(k)
-            if v in items:
-                items.remove(v)
-                updated.setlist(k, items)
-            else:
-                items.append(v)
-                updated.setlist(k, items)
+        items = list(state.getlist(k))
+        if v in items:
+            items.remove(v)
         else:
-            updated[k] = v
-    return updated.urlencode()
+            items.append(v)
+        changes[k] = items
+    return state.urlencode(changes)
 
 
 @register.simple_tag(takes_context=True)
@@ -150,6 +264,42 @@ def query_toggle_by_key(context, key, value):
     return query_toggle(context, **kwargs)
 
 
+@register.simple_tag(takes_context=True)
+def query_toggle_links(context, key, values):
+    """
+    This tag will build the query_toggle url and the active_query state for
+    every value for a single key in one pass, e.g. for a facet sidebar. It
+    returns a list of (value, query string, is_active) tuples. Only the key's
+    own params are encoded per value, the rest of the query string is shared.
+
+        {% query_toggle_links "status" statuses as links %}
+        {% for value, query_string, is_active in links %}...{% endfor %}
+    """
+    state = get_query_state(context['request'])
+    before, after = state.urlencode_around(key)
+
+    current = [str(v) for v in state.getlist(key)]
+    encoded = dict((v, state.encode(key, [v])) for v in current)
+
+    links = []
+    for value in values:
+        v = str(value)
+        items = list(current)
+        is_active = v in items
+
+        if is_active:
+            items.remove(v)
+        else:
+            items.append(v)
+            if v not in encoded:
+                encoded[v] = state.encode(key, [v])
+
+        segments = [before, '&'.join(encoded[i] for i in items), after]
+        links.append((value, '&'.join(s for s in segments if s), is_active))
+
+    return links
+
+
 @register.tag()
 def query_key_exists(parser, token):
     nodelist = parser.parse(('endquery_key_exists',))
@@ -167,50 +317,91 @@ class QueryKeyExistsNode(template.Node):
 
     def render(self, context):
         key = self.key_variable.resolve(context)
-        if len(context.request.GET.getlist(key)) > 0:
+        if len(get_query_state(context.request).getlist(key)) > 0:
             return self.nodelist.render(context)
 
         return ''
 
 
-@register.filter()
-def percentage(value, decimal_places=2):
-    if value is None or value == "":
-        return ""
+@register.tag()
+def query_cache(parser, token):
+    """
+    Caches the block in the django cache for the params in request.GET, e.g.
 
-    return '{}%'.format(floatformat(value * 100.0, decimal_places))
+        {% query_cache 'facets' 300 only 'tags' 'price' vary request.user.pk %}
+            ...
+        {% endquery_cache %}
 
+    caches the block for 300 seconds (None caches it until it's
+    invalidated) per set of values of the tags and price params and per
+    user. Without only every param is part of the key. The params are
+    normalized, so the block has to look the same for the same params in
+    any order. invalidate_query_cache('facets') drops every cached copy.
+    """
+    nodelist = parser.parse(('endquery_cache',))
+    parser.delete_first_token()
 
-@register.filter()
-def currency(dollars, use_parentheses=True, include_cents=True, positive=False):
-    if dollars is None or dollars == "":
-        return ""
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            "'{}' takes at least a fragment name and a timeout".format(bits[0])
+        )
+
+    only = None
+    vary = []
+    current = None
+    for bit in bits[3:]:
+        if bit == 'only':
+            current = only = []
+        elif bit == 'vary':
+            current = vary
+        elif current is None:
+            raise template.TemplateSyntaxError(
+                "'{}' expected 'only' or 'vary', got '{}'".format(bits[0], bit)
+            )
+        else:
+            current.append(template.Variable(bit))
 
-    dollars = Decimal(dollars)
+    return QueryCacheNode(nodelist, template.Variable(bits[1]), template.Variable(bits[2]), only, vary)
 
-    if not include_cents:
-        whole_dollars = abs(int(dollars.quantize(0, ROUND_HALF_UP)))
-        cents = ""
-    else:
-        whole_dollars = abs(int(dollars))
-        cents = ("%0.2f" % dollars)[-3:]
 
-    formatter = "${}{}"
+class QueryCacheNode(template.Node):
+    def __init__(self, nodelist, name_variable, timeout_variable, only, vary):
+        self.nodelist = nodelist
+        self.name_variable = name_variable
+        self.timeout_variable = timeout_variable
+        self.only = only
+        self.vary = vary
+
+    def render(self, context):
+        name = self.name_variable.resolve(context)
+        only = None
+        if self.only is not None:
+            only = set(variable.resolve(context) for variable in self.only)
+        vary = [variable.resolve(context) for variable in self.vary]
+
+        key = query_cache_key(name, get_query_state(context['request']), only, vary)
+        content = cache.get(key)
+        if content is None:
+            content = self.nodelist.render(context)
+            cache.set(key, content, self.timeout_variable.resolve(context))
+
+        return content
+
+
+@register.filter()
+def percentage(value, decimal_places=2):
+    return format_percentage(value, decimal_places)
 
-    # Change formatter for negative numbers
-    if dollars < 0.0:
-        formatter = "${}{}"
-        if use_parentheses:
-            formatter = "(${}{})"
-        elif not positive:
-            formatter = "-${}{}"
 
-    return formatter.format(intcomma(whole_dollars), cents)
+@register.filter()
+def currency(dollars, use_parentheses=True, include_cents=True, positive=False):
+    return format_currency(dollars, use_parentheses, include_cents, positive)
 
 
 @register.filter()
 def intcurrency(dollars, use_parentheses=True):
-    return currency(
+    return format_currency(
         dollars,
         use_parentheses=use_parentheses,
         include_cents=False
@@ -219,41 +410,59 @@ def intcurrency(dollars, use_parentheses=True):
 
 @register.filter()
 def humanize_time(amount, units='seconds'):
+    return format_duration(amount, units)
 
-    if not amount:
-        return ""
 
-    if amount < 1 and units == 'seconds':
-        return "less than a second"
+@register.simple_tag()
+def format_column(rows, field, formatter, *args):
+    """
+    Formats a column of rows in one go before looping over them, which is
+    a lot faster for long tables than a filter per cell, e.g.
 
-    INTERVALS = [1, 60, 3600, 86400, 604800, 2419200, 29030400]
-    NAMES = [('second', 'seconds'),
-             ('minute', 'minutes'),
-             ('hour', 'hours'),
-             ('day', 'days'),
-             ('week', 'weeks'),
-             ('month', 'months'),
-             ('year', 'years')]
+        {% format_column items 'price' 'currency' as prices %}
+        {% for item, price in prices %}...{% endfor %}
 
-    result = []
+    Returns (row, formatted value) pairs. field is an attribute or a key of
+    the rows, or None when the rows are the values. formatter is one of
+    currency, intcurrency, percentage or humanize_time, any other
+    arguments are passed on like the filter's argument.
+    """
+    if formatter not in COLUMN_FORMATTERS:
+        raise template.TemplateSyntaxError('Unknown column formatter {!r}, use one of {}'.format(
+            formatter, ', '.join(sorted(COLUMN_FORMATTERS))
+        ))
+
+    rows = list(rows)
+    if field is None:
+        values = rows
+    elif rows and isinstance(rows[0], dict):
+        values = [row[field] for row in rows]
+    else:
+        values = [getattr(row, field) for row in rows]
 
-    unit = list(map(lambda a: a[1], NAMES)).index(units)
-    # Convert to seconds
-    amount *= INTERVALS[unit]
+    return list(zip(rows, COLUMN_FORMATTERS[formatter](values, *args)))
 
-    for i in range(len(NAMES) - 1, -1, -1):
-        a = int(amount / INTERVALS[i])
-        if a > 0:
-            result.append("{} {}".format(a, NAMES[i][1 % a]))
-            amount -= a * INTERVALS[i]
 
-    return ", ".join(result)
+@register.filter()
+def to_json(value, backend=None):
+    """
+    Returns value as JSON. Dates, times and Decimals are encoded like
+    DjangoJSONEncoder does. The fastest JSON library installed is used
+    unless one is named, e.g. {{ data|to_json:"json" }}, see
+    encoders.get_json_backend. The output is autoescaped like any other
+    value so it can go in an HTML attribute, use to_json_script to pass
+    data to JavaScript.
+    """
+    return dumps(value, backend)
 
 
 @register.filter()
-def to_json(value):
+def to_json_script(value, element_id):
     """
-    Mainly for debugging purposes
+    Returns value as JSON in a <script type="application/json"> block with
+    the id element_id, like json_script in later Django versions. Read it
+    with JSON.parse(document.getElementById(element_id).textContent).
     """
-
-    return json.dumps(value)
+    return format_html(
+        '<script id="{}" type="application/json">{}</script>', element_id, mark_safe(dumps(value))
+    )
@@ -0,0 +1,188 @@
+"""
+JSON encoding for embedding data in pages. The fastest installed library is
+used: orjson, then ujson, then the standard library. Values JSON doesn't
+have (dates, times, Decimals, UUIDs) are encoded like DjangoJSONEncoder
+does with every backend, except that ujson writes Decimals as numbers.
+ujson is only used from 5.x, before that it can't encode dates at all.
+
+The output is safe to put in a <script> block: <, >, & and the line and
+paragraph separators are escaped as \\uXXXX, which JSON parsers and
+JavaScript read back as the same characters.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.query import QuerySet
+from django.http import StreamingHttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+else:
+    # ujson takes a default for the types it can't encode from 5.x
+    try:
+        ujson.dumps(None, default=str)
+    except TypeError:
+        ujson = None
+
+# The characters escaped for script blocks, like Django's json_script
+HTML_ESCAPES = (
+    ('<', '\\u003c'),
+    ('>', '\\u003e'),
+    ('&', '\\u0026'),
+    ('\u2028', '\\u2028'),
+    ('\u2029', '\\u2029'),
+)
+
+django_default = DjangoJSONEncoder().default
+
+
+def escape_html(encoded):
+    for char, escaped in HTML_ESCAPES:
+        if char in encoded:
+            encoded = encoded.replace(char, escaped)
+    return encoded
+
+
+class JSONBackend(object):
+    """
+    Base class for the JSON encoders, dumps returns the JSON for a value as
+    a str.
+    """
+
+    name = None
+
+    def dumps(self, value):
+        raise NotImplementedError
+
+
+class StdlibJSONBackend(JSONBackend):
+    name = 'json'
+
+    def __init__(self, encoder=DjangoJSONEncoder):
+        self.encoder = encoder
+
+    def dumps(self, value):
+        return json.dumps(value, cls=self.encoder)
+
+
+class OrjsonBackend(JSONBackend):
+    """
+    orjson writes dates and times itself in a slightly different format,
+    they are passed through to DjangoJSONEncoder's default instead. Values
+    orjson can't encode but the standard library can (ints beyond 64 bits)
+    are encoded with the standard library.
+    """
+    name = 'orjson'
+
+    def __init__(self):
+        self.options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        self.fallback = StdlibJSONBackend()
+
+    def dumps(self, value):
+        try:
+            return orjson.dumps(value, default=django_default, option=self.options).decode('utf-8')
+        except TypeError:
+            # orjson.JSONEncodeError is a TypeError
+            return self.fallback.dumps(value)
+
+
+class UjsonBackend(JSONBackend):
+    """
+    Like OrjsonBackend values ujson can't encode are encoded with the
+    standard library.
+    """
+    name = 'ujson'
+
+    def __init__(self):
+        self.fallback = StdlibJSONBackend()
+
+    def dumps(self, value):
+        try:
+            return ujson.dumps(
+                value, ensure_ascii=False, escape_forward_slashes=False, default=django_default
+            )
+        except (TypeError, OverflowError):
+            return self.fallback.dumps(value)
+
+
+# The backends by name, in order of preference
+JSON_BACKENDS = [
+    ('orjson', OrjsonBackend if orjson is not None else None),
+    ('ujson', UjsonBackend if ujson is not None else None),
+    ('json', StdlibJSONBackend),
+]
+
+# The backend instances, by name
+json_backends = {}
+
+
+def get_json_backend(name=None):
+    """
+    Returns the named backend, by default the fastest one installed. name
+    can also be a JSONBackend instance, which is returned as is.
+    """
+    if isinstance(name, JSONBackend):
+        return name
+
+    if name not in json_backends:
+        for backend_name, backend in JSON_BACKENDS:
+            if backend is not None and (name is None or name == backend_name):
+                json_backends[name] = backend()
+                break
+        else:
+            raise ValueError('Unknown or not installed JSON backend {!r}'.format(name))
+
+    return json_backends[name]
+
+
+def dumps(value, backend=None):
+    """
+    Returns the JSON for value, escaped for script blocks.
+    """
+    return escape_html(get_json_backend(backend).dumps(value))
+
+
+def iter_dumps(value, chunk_size=1000, backend=None):
+    """
+    Yields the JSON for value in parts, escaped for script blocks. Lists,
+    tuples, querysets and other iterables (but not dicts or strings) are
+    encoded chunk_size items at a time so the whole value is never held
+    encoded in memory, querysets are read with iterator() so their rows
+    aren't cached either. Use values() or values_list() querysets, model
+    instances can't be encoded.
+    """
+    backend = get_json_backend(backend)
+
+    if isinstance(value, QuerySet):
+        value = value.iterator()
+    elif isinstance(value, (dict, str, bytes)) or not hasattr(value, '__iter__'):
+        yield escape_html(backend.dumps(value))
+        return
+
+    yield '['
+    chunk = []
+    separator = ''
+    for item in value:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield separator + escape_html(backend.dumps(chunk))[1:-1]
+            separator = ','
+            chunk = []
+    if chunk:
+        yield separator + escape_html(backend.dumps(chunk))[1:-1]
+    yield ']'
+
+
+def streaming_json_response(value, chunk_size=1000, backend=None, **kwargs):
+    """
+    Returns a StreamingHttpResponse of the JSON for value, see iter_dumps.
+    """
+    kwargs.setdefault('content_type', 'application/json')
+    return StreamingHttpResponse(iter_dumps(value, chunk_size, backend), **kwargs)
@@ -1,9 +1,49 @@
-from django.db.models import Q
+import hashlib
+import json
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections, OperationalError
+from django.db.models import Count, Q
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.http.request import QueryDict
+from django.utils.http import urlencode
 import django_filters
+from django_filters.fields import Lookup
+from django_filters.filterset import FilterSetMetaclass, STRICTNESS
+
+from .utils import queryset_key
+
+
+class DefaultFilterSetMetaclass(FilterSetMetaclass):
+    """
+    Connects the invalidation signals the filters of a filterset rely on
+    when the class is defined, so every process that imports it invalidates
+    the shared caches on a save, not only the ones that filled them.
+    """
+
+    def __new__(cls, name, bases, attrs):
+        new_class = super(DefaultFilterSetMetaclass, cls).__new__(cls, name, bases, attrs)
+
+        model = new_class._meta.model
+        if model is not None:
+            if getattr(getattr(new_class, 'Meta', None), 'cache_timeout', None):
+                connect_filter_ids_signals(model)
 
+            for filter_ in new_class.base_filters.values():
+                if isinstance(filter_, TagFilter) and filter_.resolve_ids:
+                    try:
+                        connect_tag_ids_signals(model._meta.get_field(filter_.tag_field).related_model)
+                    except FieldDoesNotExist:
+                        pass
 
-class DefaultFilterSet(django_filters.FilterSet):
+        return new_class
+
+
+class DefaultFilterSet(django_filters.FilterSet, metaclass=DefaultFilterSetMetaclass):
     def __init__(self, data=None, queryset=None, prefix=None, strict=None):
         
         if hasattr(self, 'Meta'):
@@ -21,18 +61,422 @@ class DefaultFilterSet(django_filters.FilterSet):
 
         super(DefaultFilterSet, self).__init__(data, queryset, prefix, strict)
 
+    @property
+    def qs(self):
+        """
+        With Meta.combine_filters the filters that can give a Q (see
+        filter_q) are applied in a single filter() call, so the queryset is
+        cloned once for them rather than once per filter. The conditions of
+        a single filter() call share their joins, which changes the meaning
+        of filters on the same multi-valued relation, so it is opt-in.
+
+        With Meta.profile (True, or 'explain' for the query plans too) the
+        filterset is profiled the first time qs is used and the report is
+        kept in profile_report, see profile.
+        """
+        profile = getattr(getattr(self, 'Meta', None), 'profile', False)
+        if profile and not hasattr(self, 'profile_report'):
+            self.profile(explain=profile == 'explain')
+
+        if hasattr(self, '_qs') or not getattr(getattr(self, 'Meta', None), 'combine_filters', False):
+            return super(DefaultFilterSet, self).qs
+
+        if not (self.is_bound and self.form.is_valid()):
+            return super(DefaultFilterSet, self).qs
+
+        condition, distinct, rest = self.combined_filters()
+
+        queryset, filters = self.queryset, self.filters
+        self.queryset = queryset.filter(condition)
+        if distinct:
+            self.queryset = self.queryset.distinct()
+        self.filters = rest
+        try:
+            return super(DefaultFilterSet, self).qs
+        finally:
+            self.queryset, self.filters = queryset, filters
+
+    def profile(self, explain=False, evaluate=True):
+        """
+        Returns a report of the lookups, build time and queries of every
+        active filter and of qs, see django_helpers.profiling. The report
+        is also kept in profile_report.
+        """
+        from .profiling import profile_filterset
+
+        # Set first since profiling builds qs
+        self.profile_report = None
+        self.profile_report = profile_filterset(self, explain, evaluate)
+        return self.profile_report
+
+    def combined_filters(self):
+        """
+        Returns the Q of the active filters that can be combined, whether
+        any of them needs distinct() and the filters that have to be applied
+        one by one.
+        """
+        condition = Q()
+        distinct = False
+        rest = OrderedDict()
+
+        for name, filter_ in self.filters.items():
+            value = self.form.cleaned_data[name]
+            q = filter_q(filter_, self._meta.model, value) if value is not None else None
+
+            if q is NotImplemented:
+                rest[name] = filter_
+            elif q is not None:
+                condition &= q
+                # TagFilter and friends don't use distinct in filter() either
+                distinct = distinct or (filter_.distinct and not hasattr(filter_, 'get_q'))
+
+        return condition, distinct, rest
+
+    @property
+    def cached_ids(self):
+        """
+        The primary keys of qs in order. When Meta.cache_timeout is set the
+        list is cached in the django cache for that many seconds, keyed on
+        the base queryset and the filter params (see filter_params) so every
+        request with the same filters shares it. Saving or deleting any row
+        of the model, or changing its many to many relations, invalidates
+        the cached lists for the model, the signals are connected when the
+        filterset class is defined.
+        """
+        if not hasattr(self, '_cached_ids'):
+            timeout = getattr(getattr(self, 'Meta', None), 'cache_timeout', None)
+            key = filter_ids_cache_key(self) if timeout else None
+
+            ids = cache.get(key) if key else None
+            if ids is None:
+                ids = list(self.qs.values_list('pk', flat=True))
+                if key:
+                    cache.set(key, ids, timeout)
+
+            self._cached_ids = ids
+
+        return self._cached_ids
+
+    def cached_results(self):
+        """
+        Returns the results as a CachedResults, a sequence over cached_ids
+        that only fetches the rows for the slice that is used. Pass it to
+        paginate instead of qs to page through the cached ids.
+        """
+        return CachedResults(self.queryset, self.cached_ids)
+
+    def faceted(self, *names):
+        """
+        Returns the filtered queryset and the facet counts (see
+        facet_counts) for the named filters.
+        """
+        return self.qs, self.facet_counts(*names)
+
+    def facet_counts(self, *names):
+        """
+        Returns the counts for every value of the named filters (e.g. a
+        MultipleChoiceFilter or a TagFilter) as {name: {value: count}}. The
+        counts for a filter have all the other active filters applied but not
+        the filter itself, so they are the number of results each value would
+        add. Each filter's counts are a single GROUP BY query.
+        """
+        return OrderedDict((name, self.get_facet(name)) for name in names)
+
+    def get_facet(self, name):
+        filter_ = self.filters[name]
+
+        if isinstance(filter_, TagFilter):
+            field = '{}__slug'.format(filter_.tag_field)
+        else:
+            field = filter_.name
+
+        rows = self.filtered_qs(exclude=[name]).order_by().values_list(field).annotate(
+            facet_count=Count('pk', distinct=True)
+        ).order_by(field)
+        counts = dict((str(value), count) for value, count in rows if value is not None)
+
+        choices = getattr(filter_.field, 'choices', None)
+        if choices is None:
+            return OrderedDict(sorted(counts.items()))
+
+        return OrderedDict(
+            (str(value), counts.get(str(value), 0)) for value, label in choices if value != ''
+        )
+
+    def filtered_qs(self, exclude=()):
+        """
+        Returns the queryset with all the filters except the ones named in
+        exclude applied (and without the ordering). Invalid data is handled
+        according to strict like qs does: no results, a ValidationError or,
+        with STRICTNESS.IGNORE, the filters with invalid values are skipped.
+        """
+        valid = self.is_bound and self.form.is_valid()
+        if self.is_bound and not valid:
+            if self.strict == STRICTNESS.RAISE_VALIDATION_ERROR:
+                raise ValidationError(self.form.errors)
+            elif bool(self.strict) == STRICTNESS.RETURN_NO_RESULTS:
+                return self.queryset.none()
+
+        qs = self.queryset.all()
+        for name, filter_ in self.filters.items():
+            if name in exclude:
+                continue
+
+            if valid:
+                value = self.form.cleaned_data[name]
+            else:
+                try:
+                    value = self.form.fields[name].clean(self.form[name].value())
+                except ValidationError:
+                    continue
+
+            if value is not None:
+                qs = filter_.filter(qs, value)
+
+        return qs
+
+
+def filter_q(filter_, model, value):
+    """
+    Returns the Q the filter would apply for the value, None when it would
+    not filter and NotImplemented when it can only be applied with its
+    filter() method. Filters can define get_q(model, value) to take part,
+    django_filters' Filter and MultipleChoiceFilter are handled here when
+    they're used as is.
+    """
+    if hasattr(filter_, 'get_q'):
+        return filter_.get_q(model, value)
+
+    if filter_.exclude or 'filter' in vars(filter_):
+        return NotImplemented
+
+    if type(filter_).filter is django_filters.MultipleChoiceFilter.filter:
+        value = value or ()
+        if filter_.conjoined or filter_.is_noop(None, value):
+            return NotImplemented
+        if not value:
+            return None
+
+        condition = Q()
+        for v in set(value):
+            condition |= Q(**{filter_.name: v})
+        return condition
+
+    if type(filter_).filter is django_filters.Filter.filter:
+        if isinstance(value, Lookup):
+            lookup = str(value.lookup_type)
+            value = value.value
+        else:
+            lookup = filter_.lookup_expr
+        if value in ([], (), {}, None, ''):
+            return None
+        return Q(**{'{}__{}'.format(filter_.name, lookup): value})
+
+    return NotImplemented
+
+
+class CachedResults(Sequence):
+    """
+    A sequence of the rows for a list of primary keys, slicing it fetches
+    only the rows for the slice (in the order of the ids). Rows deleted
+    since the ids were cached are skipped by slices and iteration, an index
+    of one raises IndexError.
+    """
+
+    def __init__(self, queryset, ids):
+        self.queryset = queryset
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            pk = self.ids[index]
+            objects = self.queryset.in_bulk([pk])
+            if pk not in objects:
+                raise IndexError('The row for id {!r} no longer exists'.format(pk))
+            return objects[pk]
+
+        ids = self.ids[index]
+        objects = self.queryset.in_bulk(ids)
+        return [objects[pk] for pk in ids if pk in objects]
+
+    def __iter__(self):
+        # Sequence's __iter__ would stop at the first missing row
+        return iter(self[:])
+
+
+def filter_params(filterset):
+    """
+    Returns the effective params of a filterset (its data with the defaults
+    merged in) as a sorted tuple of (name, values) pairs so the same filters
+    give the same params however they were sent. Only the filters and the
+    ordering are included and blank values are dropped.
+
+    Multi-valued filters (TagFilter, multiple choice filters and the filters
+    named in Meta.comma_separated, which are split on commas like
+    get_filter_value_list does) have their values de-duplicated and sorted.
+    Other filters only keep their last value since that's the one the form
+    uses.
+    """
+    comma_separated = getattr(getattr(filterset, 'Meta', None), 'comma_separated', ())
+
+    names = list(filterset.filters)
+    if filterset._meta.order_by:
+        names.append(filterset.order_by_field)
+
+    params = []
+    for name in names:
+        key = '{}-{}'.format(filterset.form_prefix, name) if filterset.form_prefix else name
+
+        if isinstance(filterset.data, QueryDict):
+            values = filterset.data.getlist(key)
+        else:
+            values = filterset.data.get(key, [])
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+
+        values = [str(v) for v in values if v not in ('', None)]
+        if name in comma_separated:
+            values = get_filter_value_list(values, key) or []
+        if not values:
+            continue
+
+        if name in comma_separated or is_multi_valued_filter(filterset.filters.get(name)):
+            values = sorted(set(values))
+        else:
+            values = values[-1:]
+
+        params.append((name, tuple(values)))
+
+    return tuple(sorted(params))
+
+
+def filter_state_key(filterset):
+    """
+    Returns a stable key for the filter state of a filterset: its
+    filter_params as a query string, e.g. 'o=name&status=active&status=paused'.
+    """
+    return urlencode(filter_params(filterset), doseq=True)
+
+
+def is_multi_valued_filter(filter_):
+    if filter_ is None:
+        return False
+    if isinstance(filter_, TagFilter):
+        return True
+    return getattr(filter_.field.widget, 'allow_multiple_selected', False)
+
+
+def filter_ids_cache_key(filterset):
+    """
+    Returns the cache key for a filterset's ids, None when the base queryset
+    can't be keyed.
+    """
+    qs_key = queryset_key(filterset.queryset)
+    if qs_key is None:
+        return None
+
+    model = filterset._meta.model
+    version = cache.get(filter_ids_version_key(model), 0)
+    key = repr((type(filterset).__module__, type(filterset).__name__, qs_key, filter_params(filterset)))
+
+    return 'django_helpers.filter_ids.{}.{}'.format(version, hashlib.md5(key.encode('utf-8')).hexdigest())
+
+
+def filter_ids_version_key(model):
+    return 'django_helpers.filter_ids_version.{}.{}'.format(model._meta.app_label, model._meta.model_name)
+
+
+# The models whose saves invalidate their cached id lists
+filter_ids_signals = set()
+
+
+def connect_filter_ids_signals(model):
+    if model in filter_ids_signals:
+        return
+
+    uid = filter_ids_version_key(model)
+    post_save.connect(invalidate_filter_ids, sender=model, dispatch_uid=uid)
+    post_delete.connect(invalidate_filter_ids, sender=model, dispatch_uid=uid)
+
+    # Adding or removing related rows (e.g. item.tags.add(tag)) doesn't save
+    # the model, so changes to its many to many fields invalidate it too
+    for field in model._meta.get_fields(include_hidden=True):
+        if not field.many_to_many:
+            continue
+        through = field.remote_field.through if field.concrete else field.through
+        if isinstance(through, type):
+            m2m_changed.connect(invalidate_filter_ids_m2m, sender=through,
+                                dispatch_uid=filter_ids_version_key(through))
+
+    filter_ids_signals.add(model)
+
+
+def invalidate_filter_ids(sender, **kwargs):
+    """
+    Invalidates every cached id list for a model by bumping its version.
+    """
+    key = filter_ids_version_key(sender)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def invalidate_filter_ids_m2m(sender, instance, action, model, **kwargs):
+    """
+    Invalidates the cached id lists of the models on either side of a
+    changed many to many relation.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    for changed in (type(instance), model):
+        if changed in filter_ids_signals:
+            invalidate_filter_ids(changed)
+
 
 class TagFilter(django_filters.Filter):
-    
+    """
+    Filters on tag slugs, by default rows with any of the tags match. With
+    conjoined=True only rows with all the tags match, this is done with a
+    single GROUP BY ... HAVING COUNT subquery. subquery=True matches any tag
+    with a pk IN subquery so a many to many tag field doesn't duplicate rows
+    and the results don't need a DISTINCT.
+
+    With resolve_ids=True the slugs are looked up in a cached slug to id map
+    for the tag model (see get_tag_ids) and the filter is on the tag ids, so
+    the query doesn't need to join the tag table just to match slugs. Unknown
+    slugs are looked up once in case the tag was added by another process,
+    the ones that still don't exist are remembered and return no results
+    without a query. The map is kept in
+    process unless use_cache=True, then it is in the django cache.
+    """
+
     def __init__(self, *args, **kwargs):
         # Get the action out of the kwargs
         self.tag_field = kwargs.pop('tag_field', 'tags')
+        self.conjoined = kwargs.pop('conjoined', False)
+        self.subquery = kwargs.pop('subquery', False)
+        self.resolve_ids = kwargs.pop('resolve_ids', False)
+        self.use_cache = kwargs.pop('use_cache', False)
 
         # Call the parent
         super(TagFilter, self).__init__(*args, **kwargs)
 
     def filter(self, qs, value):
-        
+        q = self.get_q(getattr(self, 'model', None) or qs.model, value)
+        if q is None:
+            return qs
+        return qs.filter(q)
+
+    def get_q(self, model, value):
+        """
+        Returns the Q for the filter, None when there is nothing to filter.
+        """
+
         # This is a really dumb thing we have to do to get
         # access to multiple values
         if isinstance(self.parent.data, QueryDict):
@@ -42,40 +486,387 @@ class TagFilter(django_filters.Filter):
             value = [value]
 
         if not value or value == ['']:
-            return qs
+            return None
+
+        if self.resolve_ids:
+            tag_model = model._meta.get_field(self.tag_field).related_model
+            ids = get_tag_ids(tag_model, value, self.use_cache)
+
+            # When matching all the tags one unknown slug is enough to
+            # match nothing. An empty __in matches nothing without a query.
+            if not ids or (self.conjoined and len(set(ids)) < len(set(value))):
+                return Q(pk__in=[])
+
+            kwargs = {
+                "{}__in".format(self.tag_field): ids
+            }
+        else:
+            kwargs = {
+                "{}__slug__in".format(self.tag_field): value
+            }
+
+        if self.conjoined:
+            matches = model._base_manager.filter(**kwargs).values('pk').annotate(
+                tag_count=Count(self.tag_field, distinct=True)
+            ).filter(tag_count=len(set(value))).values('pk')
+            return Q(pk__in=matches)
+        elif self.subquery:
+            return Q(pk__in=model._base_manager.filter(**kwargs).values('pk'))
+
+        return Q(**kwargs)
+
+
+# In process slug to id maps, by tag model
+tag_id_maps = {}
+
+# How long the slug to id maps are kept in the django cache (use_cache=True)
+TAG_ID_MAP_TIMEOUT = 60 * 60
+
+# How many unknown slugs a map remembers, they come from query strings
+MAX_TAG_ID_MISSES = 1000
+
+
+def get_tag_ids(tag_model, slugs, use_cache=False):
+    """
+    Returns the ids of the tags with the slugs, unknown slugs are skipped.
+    The full slug to id map for the tag model is loaded once and kept in
+    process (or in the django cache for TAG_ID_MAP_TIMEOUT seconds when
+    use_cache=True) until a tag is saved or deleted. Slugs missing from the
+    map are looked up once, the tags may have been created in another
+    process, and the ones that still don't exist are remembered (as None) so
+    they don't need another query. Tags renamed or deleted by another process
+    are only seen once the map is cleared or expires.
+    """
+    key = tag_id_map_key(tag_model)
+
+    # Connect before loading so a save while loading clears the map
+    connect_tag_ids_signals(tag_model)
+
+    if use_cache:
+        id_map = cache.get(key)
+    else:
+        id_map = tag_id_maps.get(key)
+
+    if id_map is None:
+        id_map = dict(tag_model._default_manager.values_list('slug', 'pk'))
+        add_tag_id_misses(id_map, slugs)
+        store_tag_id_map(key, id_map, use_cache)
+    else:
+        missing = set(slug for slug in slugs if slug not in id_map)
+        if missing:
+            id_map = dict(id_map)
+            id_map.update(tag_model._default_manager.filter(slug__in=missing).values_list('slug', 'pk'))
+            add_tag_id_misses(id_map, missing)
+            store_tag_id_map(key, id_map, use_cache)
+
+    return [id_map[slug] for slug in slugs if id_map.get(slug) is not None]
+
+
+def add_tag_id_misses(id_map, slugs):
+    misses = sum(1 for pk in id_map.values() if pk is None)
+    for slug in slugs:
+        if misses >= MAX_TAG_ID_MISSES:
+            break
+        if slug not in id_map:
+            id_map[slug] = None
+            misses += 1
+
+
+def store_tag_id_map(key, id_map, use_cache):
+    if use_cache:
+        cache.set(key, id_map, TAG_ID_MAP_TIMEOUT)
+    else:
+        tag_id_maps[key] = id_map
+
+
+# The tag models whose saves invalidate their maps
+tag_id_signals = set()
+
 
-        kwargs = {
-            "{}__slug__in".format(self.tag_field): value
-        }
-        return qs.filter(**kwargs)
+def connect_tag_ids_signals(tag_model):
+    if tag_model in tag_id_signals:
+        return
+
+    key = tag_id_map_key(tag_model)
+    post_save.connect(invalidate_tag_ids, sender=tag_model, dispatch_uid=key)
+    post_delete.connect(invalidate_tag_ids, sender=tag_model, dispatch_uid=key)
+    tag_id_signals.add(tag_model)
+
+
+def invalidate_tag_ids(sender, **kwargs):
+    key = tag_id_map_key(sender)
+    tag_id_maps.pop(key, None)
+    cache.delete(key)
+
+
+def tag_id_map_key(tag_model):
+    return 'django_helpers.tag_ids.{}.{}'.format(
+        tag_model._meta.app_label,
+        tag_model._meta.model_name
+    )
 
 
 class SearchFilter(django_filters.Filter):
-    
+    """
+    Filters rows where any of the search_fields lookups match the value, with
+    exact=False every word in the value has to match one of them.
+
+    The whole search is applied with a single filter() call. Lookups across
+    multi-valued relations (many to many or reverse foreign keys) are moved
+    into a pk IN subquery per term, so the outer query gets no extra joins
+    however many terms there are.
+
+    Pass a backend (see django_helpers.search) to search a full text index
+    instead of using the search_fields lookups.
+    """
+
     def __init__(self, search_fields, exact=True, *args, **kwargs):
         # Get the action out of the kwargs
         self.search_fields = search_fields
         self.exact = exact
+        self.backend = kwargs.pop('backend', None)
 
         # Call the parent
         super(SearchFilter, self).__init__(*args, **kwargs)
 
     def filter(self, qs, value):
-        
+
+        if not value:
+            return qs
+
         if self.exact:
             terms = [value]
         else:
             terms = value.split()
 
+        if self.backend is not None:
+            return self.backend.search(qs, terms, self)
+
+        return qs.filter(self.get_q(getattr(self, 'model', None) or qs.model, value))
+
+    def get_q(self, model, value):
+        """
+        Returns the Q for the search, None when there is nothing to search
+        and NotImplemented with a backend (which needs the queryset).
+        """
+        if not value:
+            return None
+        if self.backend is not None:
+            return NotImplemented
+
+        terms = [value] if self.exact else value.split()
+
+        fields = []
+        related_fields = []
+        for field in self.search_fields:
+            if is_multi_valued_lookup(model, field):
+                related_fields.append(field)
+            else:
+                fields.append(field)
+
+        search = Q()
         for term in terms:
-            filter = Q(**{self.search_fields[0]: term})
-            for field in self.search_fields[1:]:
-                filter |= Q(**{field: term})
+            term_filter = Q()
+            for field in fields:
+                term_filter |= Q(**{field: term})
 
-            if value and filter:
-                qs = qs.filter(filter)
-    
-        return qs
+            if related_fields:
+                related_filter = Q()
+                for field in related_fields:
+                    related_filter |= Q(**{field: term})
+                matches = model._base_manager.filter(related_filter).values('pk')
+                term_filter |= Q(pk__in=matches)
+
+            search &= term_filter
+
+        return search
+
+
+def is_multi_valued_lookup(model, lookup):
+    """
+    Returns True when a lookup (e.g. 'tags__name__icontains') follows a many
+    to many or reverse foreign key relation. Each filter() call on one of
+    these adds another join.
+    """
+    for name in lookup.split('__'):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+
+        if not field.is_relation:
+            return False
+        if field.many_to_many or field.one_to_many:
+            return True
+
+        model = field.related_model
+
+    return False
+
+
+class IdListFilter(django_filters.Filter):
+    """
+    Filters on a list of int ids parsed with parse_filter_values (so
+    '1,2,3', repeated params and, with ranges=True, 'a-b' ranges all work).
+    The shape of the query depends on the ids:
+
+    * runs of at least min_range consecutive ids become BETWEEN ranges
+    * up to max_in of the other ids are a plain IN
+    * more than that are passed as a single parameter, = ANY(array) on
+      PostgreSQL and IN (SELECT value FROM json_each(...)) on SQLite, to stay
+      under the bind variable limit and keep the plan simple. Other databases
+      get several IN lists of max_in ids.
+
+    The results are the same as name__in=ids whichever shape is used. Only
+    the first max_items ids are used, MAX_RANGE_ITEMS by default.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.max_in = kwargs.pop('max_in', 500)
+        self.min_range = kwargs.pop('min_range', 16)
+        self.ranges = kwargs.pop('ranges', False)
+        # A client can ask for any number of ids, with a single range or a
+        # long enough query string
+        self.max_items = kwargs.pop('max_items', MAX_RANGE_ITEMS)
+
+        # Call the parent
+        super(IdListFilter, self).__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        ids = self.get_ids(value)
+        if not ids:
+            return qs
+
+        ranges, singles = split_id_runs(ids, self.min_range)
+        if self.is_large(singles):
+            return self.filter_large(qs, ranges, singles)
+
+        return qs.filter(self.get_condition(ranges, singles))
+
+    def get_ids(self, value):
+
+        # Like TagFilter we need access to all the values
+        if isinstance(self.parent.data, QueryDict):
+            value = self.parent.data
+        elif isinstance(self.parent.data, dict):
+            value = self.parent.data.get(self.name, value)
+
+        ids = parse_filter_values(
+            value, self.name, is_int=True, ranges=self.ranges,
+            unique=True, max_items=self.max_items
+        )
+        return sorted(ids) if ids else None
+
+    def is_large(self, singles):
+        return len(singles) > self.max_in
+
+    def get_q(self, model, value):
+        """
+        Returns the Q for the ids, None when there are none and
+        NotImplemented when the list is large (see filter_large).
+        """
+        ids = self.get_ids(value)
+        if not ids:
+            return None
+
+        ranges, singles = split_id_runs(ids, self.min_range)
+        if self.is_large(singles):
+            return NotImplemented
+        return self.get_condition(ranges, singles)
+
+    def get_condition(self, ranges, singles):
+        condition = Q()
+        for start, end in ranges:
+            condition |= Q(**{'{}__range'.format(self.name): (start, end)})
+        for i in range(0, len(singles), self.max_in):
+            condition |= Q(**{'{}__in'.format(self.name): singles[i:i + self.max_in]})
+        return condition
+
+    def filter_large(self, qs, ranges, singles):
+        """
+        Filters on a big list of ids (and ranges) with a single parameter for
+        the ids where the database supports it. A name across a relation
+        (e.g. 'tags__id') filters on a pk subquery of the related model.
+        """
+        if '__' not in self.name:
+            qn = connections[qs.db].ops.quote_name
+            column = '{}.{}'.format(qn(qs.model._meta.db_table), qn(get_id_field(qs.model, self.name).column))
+            where, params = self.get_large_where(qs.db, column, ranges, singles)
+            return qs.extra(where=[where], params=params)
+
+        path, name = self.name.rsplit('__', 1)
+        model = qs.model
+        for part in path.split('__'):
+            model = model._meta.get_field(part).related_model
+
+        # The subquery's table gets an alias, so the column is unqualified
+        qn = connections[qs.db].ops.quote_name
+        where, params = self.get_large_where(qs.db, qn(get_id_field(model, name).column), ranges, singles)
+        matches = model._base_manager.using(qs.db).extra(where=[where], params=params).values('pk')
+        return qs.filter(**{'{}__in'.format(path): matches})
+
+    def get_large_where(self, using, column, ranges, singles):
+        connection = connections[using]
+
+        where = []
+        params = []
+        for start, end in ranges:
+            where.append('{} BETWEEN %s AND %s'.format(column))
+            params.extend([start, end])
+
+        if connection.vendor == 'postgresql':
+            where.append('{} = ANY(%s)'.format(column))
+            params.append(singles)
+        elif connection.vendor == 'sqlite' and sqlite_has_json(connection):
+            where.append('{} IN (SELECT value FROM json_each(%s))'.format(column))
+            params.append(json.dumps(singles))
+        else:
+            for i in range(0, len(singles), self.max_in):
+                chunk = singles[i:i + self.max_in]
+                where.append('{} IN ({})'.format(column, ', '.join(['%s'] * len(chunk))))
+                params.extend(chunk)
+
+        return '({})'.format(' OR '.join(where)), params
+
+
+def get_id_field(model, name):
+    return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
+
+def split_id_runs(ids, min_range):
+    """
+    Splits sorted unique ids into a list of (start, end) ranges for runs of at
+    least min_range consecutive ids and a list of the other ids.
+    """
+    ranges = []
+    singles = []
+
+    start = 0
+    for i in range(1, len(ids) + 1):
+        if i == len(ids) or ids[i] != ids[i - 1] + 1:
+            if i - start >= min_range:
+                ranges.append((ids[start], ids[i - 1]))
+            else:
+                singles.extend(ids[start:i])
+            start = i
+
+    return ranges, singles
+
+
+# Whether the JSON1 extension is available, by connection alias
+sqlite_json_support = {}
+
+
+def sqlite_has_json(connection):
+    if connection.alias not in sqlite_json_support:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT json('[]')")
+            sqlite_json_support[connection.alias] = True
+        except OperationalError:
+            sqlite_json_support[connection.alias] = False
+
+    return sqlite_json_support[connection.alias]
 
 
 def get_filter_value_list(data, key, is_int=False):
@@ -86,29 +877,147 @@ def get_filter_value_list(data, key, is_int=False):
     When is_int == True then all the values will be cast to an int. If the values
     are not ints they will be ignored (in order to avoid nasty excpetions in the api).
     """
+    return parse_filter_values(data, key, is_int=is_int)
+
+
+# The most values parse_filter_values returns with ranges=True by default,
+# a single 'a-b' range can stand for any number of them
+MAX_RANGE_ITEMS = 10000
+
+# The ints parse_filter_values keeps, the range of a 64-bit integer column
+MIN_INT = -2 ** 63
+MAX_INT = 2 ** 63 - 1
+
+
+def parse_filter_values(data, key, is_int=False, ranges=False, unique=False,
+                        max_items=None, compact=False):
+    """
+    The parser behind get_filter_value_list with some extra options for big
+    lists of ids. The values are split in a single pass over all of them.
+
+    ranges=True also accepts 'a-b' (inclusive) ranges of ints, unique=True
+    drops repeated values (keeping the first) and max_items stops once that
+    many values have been found, the rest are ignored. With ranges max_items
+    defaults to MAX_RANGE_ITEMS. With compact=True ints are returned as a
+    range when they are one consecutive run and as an array('q') otherwise,
+    a single 'a-b' range is returned as a range without being expanded.
+    Ints outside MIN_INT and MAX_INT can't be an id so they are ignored like
+    values that aren't ints. Returns None when there are no values.
+    """
+    if ranges and max_items is None:
+        max_items = MAX_RANGE_ITEMS
 
-    raw_value = []
     if isinstance(data, QueryDict):
         raw_value = data.getlist(key, [])
     elif not isinstance(data, (list, tuple)):
-        raw_value = data.split(',')
+        raw_value = [data]
     else:
         raw_value = data
 
+    try:
+        joined = ','.join(v for v in raw_value if v)
+    except TypeError:
+        joined = ','.join(str(v) for v in raw_value if v)
+
+    parts = joined.split(',')
+    if '' in parts:
+        parts = [v for v in parts if v]
+
+    if is_int and ranges and compact and len(parts) == 1:
+        bounds = parse_int_range(parts[0])
+        if bounds is not None:
+            start, end = bounds
+            if max_items <= 0 or end < start:
+                return None
+            return range(start, min(end, start + max_items - 1) + 1)
+
+    if is_int and not ranges:
+        try:
+            value = list(map(int, parts))
+            if value and (min(value) < MIN_INT or max(value) > MAX_INT):
+                raise ValueError
+        except ValueError:
+            value = list(iter_ints(parts, ranges=False))
+    elif is_int:
+        value = iter_ints(parts, ranges=True)
+    else:
+        value = parts
+
+    if unique or max_items is not None:
+        value = take_values(value, unique, max_items)
+    elif not isinstance(value, list):
+        value = list(value)
+
+    if not value:
+        return None
+
+    if is_int and compact:
+        if value[-1] - value[0] == len(value) - 1 and value == list(range(value[0], value[-1] + 1)):
+            return range(value[0], value[-1] + 1)
+        return array('q', value)
+
+    return value
+
+
+def iter_ints(parts, ranges=False):
+    """
+    Yields the ints in parts, skipping anything that isn't an int between
+    MIN_INT and MAX_INT. With ranges=True 'a-b' yields every int from a to b
+    in that range.
+    """
+    for part in parts:
+        try:
+            value = int(part)
+        except ValueError:
+            pass
+        else:
+            if MIN_INT <= value <= MAX_INT:
+                yield value
+            continue
+
+        bounds = parse_int_range(part) if ranges else None
+        if bounds is None:
+            continue  # If it's not an int ignore it nicely
+
+        for i in range(bounds[0], bounds[1] + 1):
+            yield i
+
+
+def parse_int_range(part):
+    """
+    Returns the (start, end) of an 'a-b' range clipped to MIN_INT and
+    MAX_INT, None when part isn't one.
+    """
+    # The search starts at 1 so a leading minus sign isn't a range
+    split = part.find('-', 1)
+    if split == -1:
+        return None
+
+    try:
+        return max(int(part[:split]), MIN_INT), min(int(part[split + 1:]), MAX_INT)
+    except ValueError:
+        return None
+
+
+def take_values(values, unique=False, max_items=None):
+    """
+    Returns a list of the values (an iterable), without repeats when unique
+    and with at most max_items of them. Only as much of values as is needed
+    is consumed so huge ranges aren't expanded.
+    """
+    if max_items is not None and max_items <= 0:
+        return []
+
     value = []
-    for v in raw_value:
-        if v:
-            for vv in v.split(','):
-                if vv:
-                    if is_int:
-                        try:
-                            value.append(int(vv))
-                        except ValueError:
-                            pass  # If it's not an int ignore it nicely
-                    else:
-                        value.append(vv)
+    seen = set()
+    for v in values:
+        if unique:
+            if v in seen:
+                continue
+            seen.add(v)
 
-    if not value or value == ['']:
-        value = None
+        value.append(v)
+        if max_items is not None and len(value) >= max_items:
+            break
 
     return value
@@ -0,0 +1,314 @@
+"""
+The formatting behind the currency, intcurrency, percentage and
+humanize_time filters, and column versions of them for tables.
+
+The filters used to go through Decimal, floatformat and humanize's intcomma
+(a recursive regex) for every value, which adds up in large tables. Ints,
+floats and Decimals now use the ',' format spec for the thousands and
+precomputed format strings, with the same output. Anything else, and sites
+with USE_L10N (where the separators come from the locale), still go through
+the original path.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from functools import partial
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template.defaultfilters import floatformat
+from django.contrib.humanize.templatetags.humanize import intcomma
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Format strings for currency amounts by how the sign is shown, the whole
+# dollars are filled in with thousands separators
+CURRENCY_FORMATS = {
+    'positive': '${:,}{}',
+    'parentheses': '(${:,}{})',
+    'minus': '-${:,}{}',
+}
+
+# The exponents to quantize percentages to, by decimal places
+PERCENTAGE_EXPONENTS = [Decimal(1)] + [Decimal(10) ** -p for p in range(1, 11)]
+
+# Larger values go through the original path, they would need more digits
+# than floats or the default decimal context have
+MAX_FAST_VALUE = 10 ** 15
+
+
+# Whether the fast path can be used, reading the settings on every call
+# would cost more than the formatting
+fast_formatting = {}
+
+
+def use_fast_formatting():
+    """
+    Returns True when the fast path gives the same output as floatformat
+    and intcomma, i.e. the separators don't come from the locale.
+    """
+    if 'enabled' not in fast_formatting:
+        fast_formatting['enabled'] = not settings.USE_L10N and settings.DECIMAL_SEPARATOR == '.'
+    return fast_formatting['enabled']
+
+
+@receiver(setting_changed)
+def reset_fast_formatting(setting, **kwargs):
+    if setting in ('USE_L10N', 'DECIMAL_SEPARATOR'):
+        fast_formatting.clear()
+
+
+def currency_format(negative, use_parentheses, positive):
+    if not negative or (positive and not use_parentheses):
+        return CURRENCY_FORMATS['positive']
+    if use_parentheses:
+        return CURRENCY_FORMATS['parentheses']
+    return CURRENCY_FORMATS['minus']
+
+
+def format_currency(dollars, use_parentheses=True, include_cents=True, positive=False):
+    """
+    Formats dollars as e.g. $1,234.50, see the currency filter.
+    """
+    if dollars is None or dollars == "":
+        return ""
+
+    value_type = type(dollars)
+    if value_type not in (int, float, Decimal) or not use_fast_formatting():
+        return format_currency_slow(dollars, use_parentheses, include_cents, positive)
+
+    # Comparing a Decimal nan raises, float nan and inf fail the range check
+    if value_type is Decimal and not dollars.is_finite():
+        return format_currency_slow(dollars, use_parentheses, include_cents, positive)
+    if not -MAX_FAST_VALUE < dollars < MAX_FAST_VALUE:
+        return format_currency_slow(dollars, use_parentheses, include_cents, positive)
+
+    negative = dollars < 0
+
+    if value_type is int:
+        whole_dollars = -dollars if negative else dollars
+        cents = '.00' if include_cents else ''
+
+    elif value_type is float:
+        amount = -dollars if negative else dollars
+        whole_dollars = int(amount)
+        if include_cents:
+            cents = ('%0.2f' % dollars)[-3:]
+        else:
+            # The same as quantizing the exact value with ROUND_HALF_UP,
+            # amount - whole_dollars is exact for floats this size
+            cents = ''
+            if amount - whole_dollars >= 0.5:
+                whole_dollars += 1
+
+    else:
+        if include_cents:
+            whole_dollars = abs(int(dollars))
+            cents = ('%0.2f' % dollars)[-3:]
+        else:
+            whole_dollars = abs(int(dollars.quantize(0, ROUND_HALF_UP)))
+            cents = ''
+
+    return currency_format(negative, use_parentheses, positive).format(whole_dollars, cents)
+
+
+def format_currency_slow(dollars, use_parentheses=True, include_cents=True, positive=False):
+    dollars = Decimal(dollars)
+
+    if not include_cents:
+        whole_dollars = abs(int(dollars.quantize(0, ROUND_HALF_UP)))
+        cents = ""
+    else:
+        whole_dollars = abs(int(dollars))
+        cents = ("%0.2f" % dollars)[-3:]
+
+    formatter = "${}{}"
+
+    # Change formatter for negative numbers
+    if dollars < 0.0:
+        formatter = "${}{}"
+        if use_parentheses:
+            formatter = "(${}{})"
+        elif not positive:
+            formatter = "-${}{}"
+
+    return formatter.format(intcomma(whole_dollars), cents)
+
+
+def format_percentage(value, decimal_places=2):
+    """
+    Formats a fraction as a percentage, e.g. 0.5 as 50.00%, see the
+    percentage filter.
+    """
+    if value is None or value == "":
+        return ""
+
+    value_type = type(value)
+    if value_type is int or value_type is float:
+        try:
+            places = int(decimal_places)
+        except (TypeError, ValueError):
+            places = -1
+
+        percent = value * 100.0
+        if (0 <= places < len(PERCENTAGE_EXPONENTS) and
+                -MAX_FAST_VALUE < percent < MAX_FAST_VALUE and use_fast_formatting()):
+            # floatformat rounds the shortest repr of the float (not its
+            # exact value) half up
+            rounded = Decimal(repr(percent)).quantize(
+                PERCENTAGE_EXPONENTS[places], ROUND_HALF_UP
+            )
+            return '{:f}%'.format(rounded)
+
+    return '{}%'.format(floatformat(value * 100.0, decimal_places))
+
+
+# The lengths of the units humanize_time uses in seconds and their names,
+# largest last
+TIME_INTERVALS = (1, 60, 3600, 86400, 604800, 2419200, 29030400)
+TIME_NAMES = (('second', 'seconds'),
+              ('minute', 'minutes'),
+              ('hour', 'hours'),
+              ('day', 'days'),
+              ('week', 'weeks'),
+              ('month', 'months'),
+              ('year', 'years'))
+TIME_UNITS = dict((plural, i) for i, (singular, plural) in enumerate(TIME_NAMES))
+TIME_STEPS = list(reversed(list(zip(TIME_INTERVALS, TIME_NAMES))))
+
+
+def time_unit_seconds(units):
+    try:
+        return TIME_INTERVALS[TIME_UNITS[units]]
+    except KeyError:
+        raise ValueError('Unknown units {!r}'.format(units))
+
+
+def format_duration(amount, units='seconds', unit_seconds=None):
+    """
+    Formats an amount of time as e.g. 1 minute, 40 seconds, see the
+    humanize_time filter. unit_seconds is the length of units in seconds,
+    pass it in when formatting a lot of values in the same units.
+    """
+    if not amount:
+        return ""
+
+    if amount < 1 and units == 'seconds':
+        return "less than a second"
+
+    # Convert to seconds
+    amount *= unit_seconds or time_unit_seconds(units)
+
+    result = []
+    for interval, names in TIME_STEPS:
+        a = int(amount / interval)
+        if a > 0:
+            result.append("{} {}".format(a, names[1 % a]))
+            amount -= a * interval
+
+    return ", ".join(result)
+
+
+def column_values(values):
+    """
+    Returns the values of a column as a sequence. NumPy arrays are
+    converted to a list of Python ints and floats, which the fast paths
+    handle (numpy's own scalar types would take the slow path).
+    """
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        return values.tolist()
+    return values
+
+
+def format_currency_column(values, use_parentheses=True, include_cents=True, positive=False):
+    """
+    Formats a whole column (a sequence or a NumPy array) like the currency
+    filter and returns the list of strings. The settings and format
+    strings are looked up once for the column rather than per value.
+    """
+    values = column_values(values)
+    if not use_fast_formatting():
+        return [format_currency(v, use_parentheses, include_cents, positive) for v in values]
+
+    positive_format = CURRENCY_FORMATS['positive'].format
+    negative_format = currency_format(True, use_parentheses, positive).format
+    int_cents = '.00' if include_cents else ''
+
+    result = []
+    append = result.append
+    for dollars in values:
+        value_type = type(dollars)
+
+        if value_type is float and -MAX_FAST_VALUE < dollars < MAX_FAST_VALUE:
+            if dollars < 0:
+                amount, formatter = -dollars, negative_format
+            else:
+                amount, formatter = dollars, positive_format
+            whole_dollars = int(amount)
+            if include_cents:
+                append(formatter(whole_dollars, ('%0.2f' % dollars)[-3:]))
+            else:
+                append(formatter(whole_dollars + (amount - whole_dollars >= 0.5), ''))
+
+        elif value_type is int and -MAX_FAST_VALUE < dollars < MAX_FAST_VALUE:
+            if dollars < 0:
+                append(negative_format(-dollars, int_cents))
+            else:
+                append(positive_format(dollars, int_cents))
+
+        else:
+            append(format_currency(dollars, use_parentheses, include_cents, positive))
+
+    return result
+
+
+def format_percentage_column(values, decimal_places=2):
+    """
+    Formats a whole column (a sequence or a NumPy array) like the
+    percentage filter and returns the list of strings.
+    """
+    values = column_values(values)
+    try:
+        places = int(decimal_places)
+    except (TypeError, ValueError):
+        places = -1
+
+    if not (0 <= places < len(PERCENTAGE_EXPONENTS) and use_fast_formatting()):
+        return [format_percentage(v, decimal_places) for v in values]
+
+    exponent = PERCENTAGE_EXPONENTS[places]
+    formatter = '{:f}%'.format
+
+    result = []
+    append = result.append
+    for value in values:
+        value_type = type(value)
+        if value_type is float or value_type is int:
+            percent = value * 100.0
+            if -MAX_FAST_VALUE < percent < MAX_FAST_VALUE:
+                append(formatter(Decimal(repr(percent)).quantize(exponent, ROUND_HALF_UP)))
+                continue
+        append(format_percentage(value, decimal_places))
+
+    return result
+
+
+def format_duration_column(values, units='seconds'):
+    """
+    Formats a whole column (a sequence or a NumPy array) like the
+    humanize_time filter and returns the list of strings.
+    """
+    unit_seconds = time_unit_seconds(units)
+    return [format_duration(v, units, unit_seconds) for v in column_values(values)]
+
+
+# The column formatters by the name of the filter they match, for the
+# format_column tag
+COLUMN_FORMATTERS = {
+    'currency': format_currency_column,
+    'intcurrency': partial(format_currency_column, include_cents=False),
+    'percentage': format_percentage_column,
+    'humanize_time': format_duration_column,
+}
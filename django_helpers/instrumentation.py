@@ -0,0 +1,297 @@
+"""
+Opt-in timing of the tags and filters in builtins. install() swaps every
+tag and filter registered in builtins.register for a timed wrapper and
+uninstall() puts the originals back, nothing is added to rendering until
+it's installed. Templates keep the tags and filters they were compiled
+with, so install before the templates to time are compiled (the
+RenderTimingMiddleware installs when it's created).
+
+Once installed, the calls made inside record_renders() are counted and
+timed per tag and per template:
+
+    with record_renders() as stats:
+        template.render(context)
+    stats.tags['currency'].count
+
+Times are inclusive, a block tag's time includes the tags inside it.
+Every recording is also added to the process wide totals reported by
+prometheus_snapshot().
+"""
+import functools
+import threading
+from time import perf_counter
+
+from django.template.base import Template
+
+from .builtins import register
+
+# The original tags, filters and Template._render while installed
+originals = {}
+
+# The recordings and the names of the templates being rendered, per thread
+local = threading.local()
+
+totals_lock = threading.Lock()
+
+
+class Timing(object):
+    """
+    The call count and the total and max time in seconds of a tag.
+    """
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+
+class RenderStats(object):
+    """
+    The Timings of the tags and filters, tags maps their names to Timings
+    and templates maps template names to the same for the calls made
+    while rendering that template. Templates built from strings are named
+    '<string>', calls made outside any template are under None.
+    """
+
+    def __init__(self):
+        self.tags = {}
+        self.templates = {}
+
+    def add(self, name, template, elapsed):
+        timing = self.tags.get(name)
+        if timing is None:
+            timing = self.tags[name] = Timing()
+        timing.add(elapsed)
+
+        template_tags = self.templates.get(template)
+        if template_tags is None:
+            template_tags = self.templates[template] = {}
+        timing = template_tags.get(name)
+        if timing is None:
+            timing = template_tags[name] = Timing()
+        timing.add(elapsed)
+
+    def merge(self, other):
+        for name, timing in other.tags.items():
+            self.tags.setdefault(name, Timing()).merge(timing)
+        for template, template_tags in other.templates.items():
+            tags = self.templates.setdefault(template, {})
+            for name, timing in template_tags.items():
+                tags.setdefault(name, Timing()).merge(timing)
+
+    def copy(self):
+        stats = RenderStats()
+        stats.merge(self)
+        return stats
+
+    def clear(self):
+        self.tags.clear()
+        self.templates.clear()
+
+    def by_total(self):
+        return sorted(self.tags.items(), key=lambda item: -item[1].total)
+
+    def summary(self):
+        """
+        Returns a line per tag, slowest first.
+        """
+        return '\n'.join(
+            '{}: {} calls, {:.3f}ms total, {:.3f}ms max'.format(
+                name, timing.count, timing.total * 1000, timing.max * 1000
+            )
+            for name, timing in self.by_total()
+        )
+
+    def server_timing(self):
+        """
+        Returns the tag times as a Server-Timing header value, in
+        milliseconds.
+        """
+        return ', '.join(
+            '{};dur={:.3f};desc="{} calls"'.format(name, timing.total * 1000, timing.count)
+            for name, timing in self.by_total()
+        )
+
+
+# Every finished recording, for prometheus_snapshot
+totals = RenderStats()
+
+
+def record(name, elapsed):
+    templates = local.templates
+    template = templates[-1] if templates else None
+    for stats in local.recordings:
+        stats.add(name, template, elapsed)
+
+
+def timed(func, name):
+    """
+    Wraps func so its calls are recorded under name while recording.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not getattr(local, 'recordings', None):
+            return func(*args, **kwargs)
+
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record(name, perf_counter() - start)
+
+    # Django checks the filter arguments against the wrapped function
+    wrapper._decorated_function = getattr(func, '_decorated_function', func)
+    return wrapper
+
+
+def timed_tag(compile_func, name):
+    """
+    Wraps a tag's compile function so the nodes it returns time their
+    render.
+    """
+    @functools.wraps(compile_func)
+    def wrapper(parser, token):
+        node = compile_func(parser, token)
+        node.render = timed(node.render, name)
+        return node
+    return wrapper
+
+
+def timed_template_render(template, context):
+    # Keeps track of the template being rendered so calls are recorded per template
+    if not getattr(local, 'recordings', None):
+        return originals['template'](template, context)
+
+    local.templates.append(template.name or '<string>')
+    try:
+        return originals['template'](template, context)
+    finally:
+        local.templates.pop()
+
+
+def install():
+    """
+    Wraps the tags and filters in builtins.register, does nothing if
+    they're already wrapped.
+    """
+    if originals:
+        return
+
+    originals['template'] = Template._render
+    originals['tags'] = dict(register.tags)
+    originals['filters'] = dict(register.filters)
+
+    Template._render = timed_template_render
+    for name, compile_func in originals['tags'].items():
+        register.tags[name] = timed_tag(compile_func, name)
+    for name, func in originals['filters'].items():
+        register.filters[name] = timed(func, name)
+
+
+def uninstall():
+    """
+    Puts the original tags and filters back. Templates compiled while
+    installed keep their wrappers, they just stop recording.
+    """
+    if not originals:
+        return
+
+    Template._render = originals.pop('template')
+    register.tags.update(originals.pop('tags'))
+    register.filters.update(originals.pop('filters'))
+
+
+def is_installed():
+    return bool(originals)
+
+
+def start_recording():
+    """
+    Starts recording the calls made in this thread and returns the
+    RenderStats they're recorded in. Recordings can be nested, calls are
+    recorded in every active one.
+    """
+    if not hasattr(local, 'recordings'):
+        local.recordings = []
+        local.templates = []
+
+    stats = RenderStats()
+    local.recordings.append(stats)
+    return stats
+
+
+def stop_recording(stats):
+    """
+    Stops recording in stats. When it's the last active recording its
+    calls are added to the totals.
+    """
+    recordings = local.recordings
+    recordings[:] = [recording for recording in recordings if recording is not stats]
+    if not recordings:
+        with totals_lock:
+            totals.merge(stats)
+
+
+class record_renders(object):
+    """
+    Context manager that records the calls made inside it, returns the
+    RenderStats.
+    """
+
+    def __enter__(self):
+        self.stats = start_recording()
+        return self.stats
+
+    def __exit__(self, *exc_info):
+        stop_recording(self.stats)
+
+
+def prometheus_label(value):
+    return '' if value is None else value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_snapshot(reset=False):
+    """
+    Returns the totals of every recording so far in the Prometheus text
+    format, per tag and template. With reset the totals start again from
+    zero.
+    """
+    with totals_lock:
+        stats = totals.copy()
+        if reset:
+            totals.clear()
+
+    series = sorted(
+        (prometheus_label(template), prometheus_label(name), timing)
+        for template, template_tags in stats.templates.items()
+        for name, timing in template_tags.items()
+    )
+
+    metrics = [
+        ('django_helpers_tag_calls_total', 'counter', 'Calls of the builtins tags and filters.',
+         lambda timing: str(timing.count)),
+        ('django_helpers_tag_seconds_total', 'counter', 'Time spent in the builtins tags and filters.',
+         lambda timing: repr(timing.total)),
+        ('django_helpers_tag_seconds_max', 'gauge', 'The slowest call of the builtins tags and filters.',
+         lambda timing: repr(timing.max)),
+    ]
+
+    lines = []
+    for metric, kind, help_text, value in metrics:
+        lines.append('# HELP {} {}'.format(metric, help_text))
+        lines.append('# TYPE {} {}'.format(metric, kind))
+        for template, name, timing in series:
+            lines.append('{}{{tag="{}",template="{}"}} {}'.format(metric, name, template, value(timing)))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,95 @@
+import logging
+import threading
+
+from .utils import resolve_request
+
+logger = logging.getLogger('django_helpers.instrumentation')
+
+# The recording of the request being handled, per thread
+local = threading.local()
+
+
+class ResolverMatchMiddleware(object):
+    """
+    Resolves the request path up front and stores the ResolverMatch on the
+    request so that template tags like active_path don't need to resolve it
+    themselves. Works with both MIDDLEWARE_CLASSES and MIDDLEWARE.
+    """
+
+    def __init__(self, get_response=None):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        self.process_request(request)
+        return self.get_response(request)
+
+    def process_request(self, request):
+        resolve_request(request)
+
+
+class RenderTimingMiddleware(object):
+    """
+    Times the builtins tags and filters per request (see instrumentation),
+    installing the timing when it's created. The times are added to the
+    response as a Server-Timing header, unless server_timing is False, and
+    a summary is logged to the django_helpers.instrumentation logger at
+    DEBUG level. Works with both MIDDLEWARE_CLASSES and MIDDLEWARE.
+
+    A request that raises stops its recording in process_exception, and one
+    that never got to process_response has its recording stopped when the
+    next request on the thread starts.
+    """
+
+    server_timing = True
+
+    def __init__(self, get_response=None):
+        from .instrumentation import install
+
+        self.get_response = get_response
+        install()
+
+    def __call__(self, request):
+        self.process_request(request)
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_request(self, request):
+        from .instrumentation import start_recording
+
+        self.stop_recording(getattr(local, 'stats', None))
+        request._render_stats = local.stats = start_recording()
+
+    def process_exception(self, request, exception):
+        self.stop_recording(getattr(request, '_render_stats', None), request)
+
+    def process_response(self, request, response):
+        stats = getattr(request, '_render_stats', None)
+        if stats is None:
+            return response
+
+        self.stop_recording(stats, request)
+        if not stats.tags:
+            return response
+
+        if self.server_timing:
+            timing = stats.server_timing()
+            if response.has_header('Server-Timing'):
+                timing = '{}, {}'.format(response['Server-Timing'], timing)
+            response['Server-Timing'] = timing
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Tag render times for %s\n%s', request.path, stats.summary())
+
+        return response
+
+    def stop_recording(self, stats, request=None):
+        from .instrumentation import stop_recording
+
+        if stats is None:
+            return
+
+        stop_recording(stats)
+        if getattr(local, 'stats', None) is stats:
+            local.stats = None
+        if request is not None and getattr(request, '_render_stats', None) is stats:
+            del request._render_stats
@@ -0,0 +1,334 @@
+"""
+Profiling for filtersets, to find the filter that makes a list page slow.
+profile_filterset() (or DefaultFilterSet.profile()) reports for every
+active filter the lookups it adds, the time it takes to build and the
+queries run while building it (e.g. TagFilter loading its slug to id map).
+With evaluate=True the base queryset is counted with only that filter
+applied, and the queries and their times are reported. The same is
+reported for the whole filtered qs.
+
+With explain=True the query plans are captured on SQLite (EXPLAIN QUERY
+PLAN) and PostgreSQL (EXPLAIN), the steps that scan a whole table or
+build a temporary B-tree (SQLite sorting, grouping or de-duplicating
+without an index) are listed in warnings.
+
+A DefaultFilterSet with Meta.profile = True (or 'explain') profiles itself
+the first time qs is used and keeps the report in profile_report. Reports
+made inside collect_profiles() are collected, FilterProfilePanel shows the
+ones for a request in django-debug-toolbar (when it's installed) and
+render_profiles() returns the same tables as HTML.
+"""
+import threading
+from collections import OrderedDict
+from time import perf_counter
+
+from django.db import connections
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.utils.html import format_html, format_html_join
+
+from .filters import TagFilter, SearchFilter, filter_q, filter_params
+
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:  # Django < 1.11
+    from django.db.models.sql.datastructures import EmptyResultSet
+
+try:
+    from debug_toolbar.panels import Panel
+except ImportError:
+    Panel = None
+
+# The prefix that gives the query plan, by database vendor
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+}
+
+# The active collect_profiles lists, per thread
+local = threading.local()
+
+
+def q_lookups(q):
+    """
+    Returns the lookups in a Q, e.g. ['tags__slug__in', 'price__gte'].
+    """
+    lookups = []
+    for child in q.children:
+        if isinstance(child, Q):
+            lookups.extend(q_lookups(child))
+        else:
+            lookups.append(child[0])
+    return lookups
+
+
+def filter_options(filter_):
+    if isinstance(filter_, TagFilter):
+        return OrderedDict([
+            ('tag_field', filter_.tag_field),
+            ('conjoined', filter_.conjoined),
+            ('subquery', filter_.subquery),
+            ('resolve_ids', filter_.resolve_ids),
+        ])
+    if isinstance(filter_, SearchFilter):
+        return OrderedDict([
+            ('search_fields', list(filter_.search_fields)),
+            ('exact', filter_.exact),
+            ('backend', type(filter_.backend).__name__ if filter_.backend is not None else None),
+        ])
+    return OrderedDict()
+
+
+def display_value(value):
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return str(value)
+
+
+def run_profiled(connection, func):
+    """
+    Returns the result of func, the time it took in seconds and the
+    queries it ran on connection.
+    """
+    with CaptureQueriesContext(connection) as context:
+        start = perf_counter()
+        result = func()
+        elapsed = perf_counter() - start
+
+    queries = [{'sql': query['sql'], 'time': float(query['time'])} for query in context.captured_queries]
+    return result, elapsed, queries
+
+
+def explain(queryset):
+    """
+    Returns the query plan of queryset as a list of lines and the warnings
+    for it (see plan_warnings). The plan is None on other databases than
+    SQLite and PostgreSQL and when the queryset can't match anything.
+    """
+    connection = connections[queryset.db]
+    prefix = EXPLAIN_PREFIXES.get(connection.vendor)
+    if prefix is None:
+        return None, []
+
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return None, []
+
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        # The step is the last column on SQLite and the only one on PostgreSQL
+        plan = [row[-1] for row in cursor.fetchall()]
+
+    return plan, plan_warnings(connection.vendor, plan)
+
+
+def plan_warnings(vendor, plan):
+    """
+    Returns the steps of a plan that read a whole table or build a
+    temporary B-tree as {'kind': ..., 'step': ...} dicts.
+    """
+    warnings = []
+    for step in plan:
+        step = step.strip()
+        if vendor == 'sqlite':
+            # 'SCAN test_item USING INDEX ...' reads an index, not the table
+            if step.startswith('SCAN ') and ' USING ' not in step and 'CONSTANT ROW' not in step:
+                warnings.append({'kind': 'sequential scan', 'step': step})
+            if 'TEMP B-TREE' in step:
+                warnings.append({'kind': 'temp b-tree', 'step': step})
+        elif 'Seq Scan on ' in step:
+            warnings.append({'kind': 'sequential scan', 'step': step.lstrip('-> ')})
+    return warnings
+
+
+def profile_queryset(queryset, explain_plan=False, evaluate=True):
+    """
+    Returns the SQL of queryset and, with evaluate, the row count and the
+    queries counting it ran. With explain_plan the plan and its warnings.
+    """
+    report = OrderedDict()
+    try:
+        report['sql'] = str(queryset.query)
+    except EmptyResultSet:
+        report['sql'] = None
+
+    if evaluate:
+        connection = connections[queryset.db]
+        report['rows'], report['time'], report['queries'] = run_profiled(connection, queryset.count)
+
+    report['plan'], report['warnings'] = explain(queryset) if explain_plan else (None, [])
+    return report
+
+
+def profile_filter(filter_, queryset, value, explain_plan=False, evaluate=True):
+    """
+    Returns the report for one filter applied to queryset, None when the
+    value doesn't filter. lookups is None for filters that can't give a Q
+    (see filter_q), e.g. a SearchFilter with a backend.
+    """
+    connection = connections[queryset.db]
+    filtered, build_time, build_queries = run_profiled(
+        connection, lambda: filter_.filter(queryset.all(), value)
+    )
+
+    q = filter_q(filter_, queryset.model, value)
+    if q is None:
+        return None
+
+    report = OrderedDict([
+        ('name', filter_.name),
+        ('filter', type(filter_).__name__),
+        ('value', display_value(value)),
+        ('options', filter_options(filter_)),
+        ('lookups', q_lookups(q) if isinstance(q, Q) else None),
+        ('build_time', build_time),
+        ('build_queries', build_queries),
+    ])
+    report.update(profile_queryset(filtered, explain_plan, evaluate))
+    return report
+
+
+def profile_filterset(filterset, explain_plan=False, evaluate=True):
+    """
+    Returns the report for a filterset: the reports of its active filters
+    (see profile_filter) each applied on its own to the base queryset, and
+    the time and queries of building qs, its SQL, row count and plan.
+    slowest is the name of the filter that took the longest to build and
+    count. The report is added to the active collect_profiles lists.
+    """
+    queryset = filterset.queryset
+    connection = connections[queryset.db]
+    valid = filterset.is_bound and filterset.form.is_valid()
+    params = dict(filter_params(filterset)) if filterset.is_bound else {}
+
+    filters = []
+    for name, filter_ in filterset.filters.items() if valid else ():
+        value = filterset.form.cleaned_data[name]
+        if value is None:
+            continue
+
+        report = profile_filter(filter_, queryset, value, explain_plan, evaluate)
+        if report is not None:
+            if name in params:
+                report['value'] = list(params[name])
+            filters.append(report)
+
+    qs, build_time, build_queries = run_profiled(connection, lambda: filterset.qs)
+
+    report = OrderedDict([
+        ('filterset', type(filterset).__name__),
+        ('model', queryset.model._meta.label),
+        ('valid', valid),
+        ('filters', filters),
+        ('slowest', None),
+        ('build_time', build_time),
+        ('build_queries', build_queries),
+    ])
+    report.update(profile_queryset(qs, explain_plan, evaluate))
+
+    if filters:
+        slowest = max(filters, key=lambda f: f['build_time'] + f.get('time', 0))
+        report['slowest'] = slowest['name']
+
+    for profiles in getattr(local, 'collectors', ()):
+        profiles.append(report)
+
+    return report
+
+
+class collect_profiles(object):
+    """
+    Context manager that collects the filterset reports made inside it in
+    the list it returns.
+    """
+
+    def __enter__(self):
+        if not hasattr(local, 'collectors'):
+            local.collectors = []
+
+        self.profiles = []
+        local.collectors.append(self.profiles)
+        return self.profiles
+
+    def __exit__(self, *exc_info):
+        local.collectors[:] = [profiles for profiles in local.collectors if profiles is not self.profiles]
+
+
+def milliseconds(seconds):
+    return '' if seconds is None else '{:.2f}'.format(seconds * 1000)
+
+
+PROFILE_ROW = (
+    '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td>'
+    '<td>{}</td><td><code>{}</code></td></tr>'
+)
+
+
+def profile_row(name, report):
+    return (
+        name,
+        ', '.join(report.get('lookups') or ()),
+        milliseconds(report['build_time']),
+        len(report['build_queries']) + len(report.get('queries', ())),
+        report.get('rows', ''),
+        milliseconds(report.get('time')),
+        '; '.join('{}: {}'.format(w['kind'], w['step']) for w in report['warnings']),
+        report['sql'] or '',
+    )
+
+
+def render_profile(report):
+    rows = [profile_row(f['name'], f) for f in report['filters']]
+    rows.append(profile_row('all filters', report))
+
+    plan = ''
+    if report['plan'] is not None:
+        plan = format_html('<pre>{}</pre>', '\n'.join(report['plan']))
+
+    return format_html(
+        '<h4>{} ({})</h4><table><thead><tr><th>Filter</th><th>Lookups</th><th>Build (ms)</th>'
+        '<th>Queries</th><th>Rows</th><th>Count (ms)</th><th>Plan warnings</th><th>SQL</th>'
+        '</tr></thead><tbody>{}</tbody></table>{}',
+        report['filterset'],
+        report['model'],
+        format_html_join('', PROFILE_ROW, rows),
+        plan,
+    )
+
+
+def render_profiles(profiles):
+    """
+    Returns the filterset reports as HTML tables, a row per filter.
+    """
+    return format_html_join('\n', '{}', ((render_profile(report),) for report in profiles))
+
+
+if Panel is not None:
+    class FilterProfilePanel(Panel):
+        """
+        django-debug-toolbar panel with the filtersets profiled during the
+        request. Add 'django_helpers.profiling.FilterProfilePanel' to
+        DEBUG_TOOLBAR_PANELS and set Meta.profile on the filtersets.
+        """
+
+        title = 'Filters'
+
+        @property
+        def nav_subtitle(self):
+            profiles = self.get_stats().get('profiles', [])
+            return '{} filtersets'.format(len(profiles))
+
+        def enable_instrumentation(self):
+            self.collector = collect_profiles()
+            self.profiles = self.collector.__enter__()
+
+        def disable_instrumentation(self):
+            self.collector.__exit__(None, None, None)
+
+        def generate_stats(self, request, response):
+            self.record_stats({'profiles': self.profiles})
+
+        @property
+        def content(self):
+            return render_profiles(self.get_stats().get('profiles', []))
@@ -0,0 +1,178 @@
+from abc import ABC, abstractmethod
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+
+
+class SearchBackend(ABC):
+    """
+    Base class for SearchFilter backends. A backend is passed to the filter,
+    e.g. SearchFilter(['name__icontains'], backend=SQLiteFTS5Backend(['name'])),
+    and replaces the default LIKE lookups with a full text search. Subclasses
+    have to implement search.
+    """
+
+    @abstractmethod
+    def search(self, qs, terms, search_filter):
+        """
+        Returns qs filtered to the rows that match all the terms and ordered
+        by how well they match. With SearchFilter(exact=True) terms is the
+        whole value as a single term.
+        """
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """
+    Searches a SQLite FTS5 shadow table of the fields. The shadow table is an
+    external content table over the model's table, so it only stores the
+    index, and it is kept in sync by triggers. Call create_table(Model) (e.g.
+    in a migration with RunPython) to build it. Every term is a prefix match
+    and results are ranked by bm25.
+    """
+
+    def __init__(self, fields, table=None):
+        self.fields = fields
+        self.table = table
+
+    def get_table(self, model):
+        return self.table or '{}_fts'.format(model._meta.db_table)
+
+    def get_columns(self, model):
+        return [model._meta.get_field(name).column for name in self.fields]
+
+    def create_table(self, model, using='default'):
+        """
+        Creates the shadow table and the triggers that keep it in sync with
+        the model's table, then indexes the existing rows.
+        """
+        qn = connections[using].ops.quote_name
+        table = self.get_table(model)
+        source = model._meta.db_table
+        pk = model._meta.pk.column
+        columns = self.get_columns(model)
+
+        def values(prefix):
+            return ', '.join(prefix + qn(c) for c in [pk] + columns)
+
+        names = ', '.join(['rowid'] + [qn(c) for c in columns])
+        delete = "INSERT INTO {table}({table}, {names}) VALUES ('delete', {old});"
+        insert = "INSERT INTO {table}({names}) VALUES ({new});"
+
+        statements = [
+            "CREATE VIRTUAL TABLE {table} USING fts5({columns}, content={source}, content_rowid={pk})",
+            "CREATE TRIGGER {ai} AFTER INSERT ON {source} BEGIN " + insert + " END",
+            "CREATE TRIGGER {ad} AFTER DELETE ON {source} BEGIN " + delete + " END",
+            "CREATE TRIGGER {au} AFTER UPDATE ON {source} BEGIN " + delete + " " + insert + " END",
+        ]
+
+        with connections[using].cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement.format(
+                    table=qn(table),
+                    source=qn(source),
+                    pk=qn(pk),
+                    columns=', '.join(qn(c) for c in columns),
+                    names=names,
+                    old=values('old.'),
+                    new=values('new.'),
+                    ai=qn(table + '_ai'),
+                    ad=qn(table + '_ad'),
+                    au=qn(table + '_au'),
+                ))
+
+        self.rebuild(model, using)
+
+    def rebuild(self, model, using='default'):
+        """
+        Rebuilds the index from the model's table, e.g. after rows were
+        changed with the triggers dropped.
+        """
+        qn = connections[using].ops.quote_name
+        table = qn(self.get_table(model))
+        with connections[using].cursor() as cursor:
+            cursor.execute("INSERT INTO {0}({0}) VALUES ('rebuild')".format(table))
+
+    def drop_table(self, model, using='default'):
+        qn = connections[using].ops.quote_name
+        table = self.get_table(model)
+        with connections[using].cursor() as cursor:
+            for suffix in ('_ai', '_ad', '_au'):
+                cursor.execute('DROP TRIGGER IF EXISTS {}'.format(qn(table + suffix)))
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(qn(table)))
+
+    def match_query(self, terms):
+        # Quote every term so user input can't use the FTS5 query syntax
+        return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+    def search(self, qs, terms, search_filter):
+        connection = connections[qs.db]
+        qn = connection.ops.quote_name
+        table = qn(self.get_table(qs.model))
+        pk = '{}.{}'.format(qn(qs.model._meta.db_table), qn(qs.model._meta.pk.column))
+        match = self.match_query(terms)
+
+        rank = RawSQL(
+            'SELECT bm25({0}) FROM {0} WHERE {0} MATCH %s AND {0}.rowid = {1}'.format(table, pk),
+            [match]
+        )
+        # pk__in=RawSQL(...) would wrap the subquery in a second set of
+        # parentheses which SQLite reads as a single value
+        matches = '{1} IN (SELECT rowid FROM {0} WHERE {0} MATCH %s)'.format(table, pk)
+
+        return qs.extra(where=[matches], params=[match]).annotate(
+            search_rank=rank
+        ).order_by('search_rank')
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Searches with PostgreSQL full text search (django.contrib.postgres,
+    Django 1.10+). By default the search vector is built from the fields on
+    the fly, for large tables store it in a SearchVectorField with a GIN
+    index and pass its name as vector_field, update_vectors fills it in.
+    Results are ranked by ts_rank.
+    """
+
+    def __init__(self, fields, config=None, vector_field=None):
+        self.fields = fields
+        self.config = config
+        self.vector_field = vector_field
+
+    def get_search(self):
+        try:
+            from django.contrib.postgres import search
+        except ImportError:
+            raise ImproperlyConfigured(
+                'PostgresSearchBackend needs django.contrib.postgres.search (Django 1.10+)'
+            )
+        return search
+
+    def get_vector(self):
+        if self.vector_field:
+            return F(self.vector_field)
+        return self.get_search().SearchVector(*self.fields, config=self.config)
+
+    def update_vectors(self, qs):
+        """
+        Fills in vector_field for the rows in qs from the fields.
+        """
+        search = self.get_search()
+        return qs.update(**{
+            self.vector_field: search.SearchVector(*self.fields, config=self.config)
+        })
+
+    def search(self, qs, terms, search_filter):
+        search = self.get_search()
+
+        query = None
+        for term in terms:
+            term_query = search.SearchQuery(term, config=self.config)
+            query = term_query if query is None else query & term_query
+
+        vector = self.get_vector()
+        return qs.annotate(
+            search_vector=vector,
+            search_rank=search.SearchRank(vector, query)
+        ).filter(search_vector=query).order_by('-search_rank')
@@ -0,0 +1,44 @@
+from django.db import connection, models
+from django.test import TestCase
+
+
+class Tag(models.Model):
+    name = models.CharField(max_length=128)
+    slug = models.SlugField(unique=True)
+
+    class Meta:
+        app_label = 'test'
+
+
+class Item(models.Model):
+    name = models.CharField(max_length=128)
+    price = models.IntegerField(default=0)
+    tags = models.ManyToManyField(Tag)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'test'
+
+
+class ModelTestCase(TestCase):
+    """
+    Creates the tables for the models in models before the tests run. The
+    test app isn't installed (and has no migrations) so the tables have to
+    be created by hand.
+    """
+
+    models = []
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.models:
+                editor.create_model(model)
+        super(ModelTestCase, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(ModelTestCase, cls).tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.models):
+                editor.delete_model(model)
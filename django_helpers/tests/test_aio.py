@@ -0,0 +1,181 @@
+import asyncio
+import threading
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse, QueryDict
+from django.test import TransactionTestCase
+from django.test.client import RequestFactory
+from . import settings
+
+import django_filters
+
+from .models import Tag, Item, ModelTestCase
+from ..aio import apaginate, aevaluate, acount, alist, can_run_concurrently, run_query
+from ..filters import DefaultFilterSet, TagFilter
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+class ItemFilterSet(DefaultFilterSet):
+    tags = TagFilter()
+    price = django_filters.MultipleChoiceFilter(choices=[
+        ('0', 'free'),
+        ('1', 'cheap'),
+        ('2', 'expensive')
+    ])
+
+    class Meta:
+        model = Item
+        fields = ['tags', 'price']
+
+
+async def item_list(request):
+    filterset = ItemFilterSet(request.GET, Item.objects.order_by('pk'))
+    page = await apaginate(request, filterset, 10)
+    return HttpResponse(','.join(item.name for item in page))
+
+
+class APaginateTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    def setUp(self):
+        foo = Tag.objects.create(name='Foo', slug='foo')
+        for i in range(25):
+            item = Item.objects.create(name='item {}'.format(i), price=i % 3)
+            if i % 2:
+                item.tags.add(foo)
+        self.items = Item.objects.order_by('pk')
+        cache.clear()
+
+    def get_page(self, page, items=None, **kwargs):
+        request = RequestFactory().get('/', {'page': page})
+        return run(apaginate(request, self.items if items is None else items, 10, **kwargs))
+
+    def test_page(self):
+        expected = list(self.items[10:20])
+        with self.assertNumQueries(2):
+            page = self.get_page(2)
+            self.assertEquals(list(page), expected)
+            self.assertEquals(page.paginator.count, 25)
+            self.assertEquals(page.paginator.num_pages, 3)
+            self.assertTrue(page.has_next())
+
+    def test_out_of_range(self):
+        with self.assertNumQueries(3):
+            page = self.get_page(10)
+        self.assertEquals(page.number, 3)
+        self.assertEquals(list(page), list(self.items[20:]))
+
+    def test_less_than_one(self):
+        with self.assertNumQueries(2):
+            page = self.get_page(0)
+        self.assertEquals(page.number, 3)
+
+    def test_not_an_integer(self):
+        page = self.get_page('foo')
+        self.assertEquals(page.number, 1)
+        self.assertEquals(len(page), 10)
+
+    def test_uncounted(self):
+        with self.assertNumQueries(1):
+            page = self.get_page(2, count=False)
+        self.assertEquals(list(page), list(self.items[10:20]))
+
+    def test_uncounted_empty_page(self):
+        with self.assertNumQueries(2):
+            page = self.get_page(10, count=False)
+        self.assertEquals(page.number, 1)
+
+    def test_cached_count(self):
+        self.get_page(1, count=60)
+        with self.assertNumQueries(1):
+            page = self.get_page(2, count=60)
+        self.assertEquals(page.paginator.count, 25)
+
+    def test_list(self):
+        page = self.get_page(3, items=list(range(25)))
+        self.assertEquals(list(page), list(range(20, 25)))
+
+    def test_view(self):
+        request = RequestFactory().get('/', {'tags': 'foo', 'page': 2})
+        response = run(item_list(request))
+        names = ['item {}'.format(i) for i in range(21, 25, 2)]
+        self.assertEquals(response.content.decode(), ','.join(names))
+
+    @mock.patch('django_helpers.aio.sync_to_async', None)
+    def test_run_query_in_transaction(self):
+        # Other threads' connections wouldn't see the uncommitted rows
+        self.assertEquals(run(run_query(threading.get_ident)), threading.get_ident())
+        self.assertEquals(run(alist(self.items)), list(self.items))
+
+    def test_sqlite_not_concurrent(self):
+        self.assertFalse(can_run_concurrently(self.items))
+        self.assertFalse(can_run_concurrently(list(self.items)))
+
+    def test_acount_and_alist(self):
+        filterset = ItemFilterSet(QueryDict('price=1'), Item.objects.order_by('pk'))
+        self.assertEquals(run(acount(filterset)), 8)
+        self.assertEquals(run(alist(filterset)), list(filterset.qs))
+        self.assertEquals(run(acount([1, 2])), 2)
+
+    def test_aevaluate(self):
+        filterset = ItemFilterSet(QueryDict('tags=foo'), Item.objects.order_by('pk'))
+        results, facets = run(aevaluate(filterset, facets=['price', 'tags']))
+        self.assertEquals(results, list(filterset.qs))
+        self.assertEquals(facets, filterset.facet_counts('price', 'tags'))
+
+
+class ConcurrentTestCase(TransactionTestCase):
+    """
+    Runs the queries on other threads' connections, which only see
+    committed rows, so this can't run in a transaction.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in [Tag, Item]:
+                editor.create_model(model)
+        super(ConcurrentTestCase, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(ConcurrentTestCase, cls).tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in [Item, Tag]:
+                editor.delete_model(model)
+
+    def setUp(self):
+        Item.objects.bulk_create(Item(name=str(i), price=i % 3) for i in range(25))
+
+    def tearDown(self):
+        Item.objects.all().delete()
+
+    def test_apaginate(self):
+        items = Item.objects.order_by('pk')
+        request = RequestFactory().get('/', {'page': 3})
+        page = run(apaginate(request, items, 10, concurrent=True))
+        self.assertEquals(page.paginator.count, 25)
+        self.assertEquals(list(page), list(items[20:]))
+
+        request = RequestFactory().get('/', {'page': 7})
+        page = run(apaginate(request, items, 10, concurrent=True))
+        self.assertEquals(page.number, 3)
+
+    @mock.patch('django_helpers.aio.sync_to_async', None)
+    def test_run_query_without_asgiref(self):
+        # The queries don't block the event loop's thread
+        self.assertNotEquals(run(run_query(threading.get_ident)), threading.get_ident())
+        items = Item.objects.order_by('pk')
+        self.assertEquals(run(alist(items)), list(items))
+        self.assertEquals(run(acount(items)), 25)
+
+    def test_aevaluate(self):
+        filterset = ItemFilterSet(QueryDict('price=2'), Item.objects.order_by('pk'))
+        results, facets = run(aevaluate(filterset, facets=['price'], concurrent=True))
+        self.assertEquals(results, list(filterset.qs))
+        self.assertEquals(facets['price'], {'0': 9, '1': 8, '2': 8})
@@ -1,11 +1,17 @@
+import json
+from unittest import mock
+
 from django.test import TestCase
 from django.test.utils import override_settings
 from django.conf.urls import url, include
 from django.views.generic.base import View
 from django.test.client import RequestFactory
 from django.http import QueryDict
-from django.template import Template, RequestContext
+from django.template import Template, Context, RequestContext, TemplateSyntaxError, engines
+from django.core.cache import cache
 
+from .. import utils
+from ..utils import invalidate_query_cache
 from ..builtins import (
     get_item,
     active_path,
@@ -19,6 +25,7 @@ from ..builtins import (
     active_query_by_key,
     query_by_key,
     query_toggle_by_key,
+    query_toggle_links,
     to_json
 )
 
@@ -112,6 +119,81 @@ class ActivePathTestCase(TestCase):
         self.assertEquals(output, 'my-active-class')
 
 
+@override_settings(ROOT_URLCONF=__name__)
+class ActivePathTagTestCase(TestCase):
+    """
+    The compiled active_path tag should give the same results as the
+    active_path function for both literal and variable arguments.
+    """
+
+    def render(self, template, request_path, **context):
+        request = RequestFactory().get(request_path)
+        return Template(template).render(RequestContext(request, dict(context, request=request)))
+
+    def test_exact_path_match(self):
+        output = self.render('{% active_path "/foo/bar/" exact=True %}', '/foo/bar/')
+        self.assertEquals(output, 'active')
+
+    def test_exact_path_no_match(self):
+        output = self.render('{% active_path "/foo/" True %}', '/foo/bar/')
+        self.assertEquals(output, '')
+
+    def test_partial_path_match(self):
+        output = self.render('{% active_path "/foo/" %}', '/foo/bar/')
+        self.assertEquals(output, 'active')
+
+    def test_url_match(self):
+        output = self.render('{% active_path "namespace:sub-view" %}', '/foo/bar/')
+        self.assertEquals(output, 'active')
+
+    def test_url_params_match(self):
+        output = self.render('{% active_path "namespace:sub-view-id" id=10 %}', '/foo/baz/10/')
+        self.assertEquals(output, 'active')
+
+    def test_url_params_no_match(self):
+        output = self.render('{% active_path "namespace:sub-view-id" id=5 %}', '/foo/baz/10/')
+        self.assertEquals(output, '')
+
+    def test_url_namespace_match(self):
+        output = self.render('{% active_path "namespace:" %}', '/foo/baz/')
+        self.assertEquals(output, 'active')
+
+    def test_bad_path(self):
+        output = self.render('{% active_path "namespace:sub-view" %}', '/this/does/not/exist/')
+        self.assertEquals(output, '')
+
+    def test_variables(self):
+        template = '{% active_path path active_class=cls id=obj_id %}'
+        output = self.render(template, '/foo/baz/10/', path='namespace:sub-view-id', cls='on', obj_id=10)
+        self.assertEquals(output, 'on')
+        output = self.render(template, '/foo/baz/10/', path='namespace:sub-view-id', cls='on', obj_id=5)
+        self.assertEquals(output, '')
+
+    def test_as_variable(self):
+        template = '{% active_path "/foo/" as is_active %}[{{ is_active }}]'
+        self.assertEquals(self.render(template, '/foo/bar/'), '[active]')
+
+    def test_raw_path_does_not_resolve(self):
+        with mock.patch.object(utils, 'resolve') as resolve:
+            output = self.render('{% active_path "/foo/" %}', '/foo/bar/')
+        self.assertEquals(output, 'active')
+        self.assertFalse(resolve.called)
+
+    def test_resolves_once_per_request(self):
+        request = RequestFactory().get('/foo/bar/')
+        template = Template('{% active_path "namespace:sub-view" %}{% active_path "namespace:view" %}')
+        with mock.patch.object(utils, 'resolve', wraps=utils.resolve) as resolve:
+            output = template.render(RequestContext(request, {'request': request}))
+        self.assertEquals(output, 'active')
+        self.assertEquals(resolve.call_count, 1)
+
+    def test_plain_context(self):
+        # Like the function, the request only has to be in the context
+        request = RequestFactory().get('/foo/bar/')
+        template = engines['django'].from_string('{% active_path "/foo/" %}{% active_path "namespace:view" %}')
+        self.assertEquals(template.render({'request': request}), 'active')
+
+
 @override_settings(ROOT_URLCONF=__name__)
 class ActiveQueryTestCase(TestCase):
     """
@@ -248,6 +330,113 @@ class QueryToggleTestCase(TestCase):
         self.assertIn('baz', GET.getlist('foo'))
 
 
+class QueryOutputTestCase(TestCase):
+    """
+    The query tags build their output from a shared snapshot of request.GET,
+    this checks the output is byte for byte what changing a copy of the
+    QueryDict gives.
+    """
+
+    def setUp(self):
+        request = RequestFactory().get(
+            '/?b=2&a=1&a=%C3%A9+x&tags=foo&tags=bar&q=a%26b%3Dc&empty='
+        )
+        self.GET = request.GET
+        self.context = {
+            'request': request
+        }
+
+    def expected_query(self, **kwargs):
+        updated = self.GET.copy()
+        for k, v in kwargs.items():
+            if v is None:
+                updated.pop(k, None)
+            else:
+                updated[k] = v
+        return updated.urlencode()
+
+    def expected_toggle(self, **kwargs):
+        updated = self.GET.copy()
+        for k, v in kwargs.items():
+            items = updated.getlist(k)
+            if str(v) in items:
+                items.remove(str(v))
+            else:
+                items.append(str(v))
+            updated.setlist(k, items)
+        return updated.urlencode()
+
+    def test_query(self):
+        cases = [
+            {},
+            {'a': 'new'},
+            {'b': None},
+            {'tags': 'baz', 'page': 2},
+            {'q': 'ü&=', 'zzz': None},
+            {'empty': None, 'new': ''},
+        ]
+        for kwargs in cases:
+            self.assertEquals(query(self.context, **kwargs), self.expected_query(**kwargs))
+
+    def test_query_toggle(self):
+        cases = [
+            {},
+            {'tags': 'foo'},
+            {'tags': 'baz'},
+            {'b': 2},
+            {'a': 'é x', 'page': 3},
+            {'tags': 'bar', 'new': 'ü'},
+        ]
+        for kwargs in cases:
+            self.assertEquals(query_toggle(self.context, **kwargs), self.expected_toggle(**kwargs))
+
+    def test_does_not_copy_get(self):
+        with mock.patch.object(type(self.GET), 'copy') as copy:
+            query(self.context, a='new')
+            query_toggle(self.context, tags='foo')
+            active_query(self.context, tags='foo')
+        self.assertFalse(copy.called)
+
+
+class QueryToggleLinksTestCase(TestCase):
+
+    def setUp(self):
+        request = RequestFactory().get('/?b=2&status=active&status=archived&q=my+search')
+        self.context = {
+            'request': request
+        }
+
+    def test_links(self):
+        values = ['active', 'paused', 'archived', 1]
+        links = query_toggle_links(self.context, 'status', values)
+
+        self.assertEquals(len(links), len(values))
+        for value, (link_value, query_string, is_active) in zip(values, links):
+            self.assertEquals(link_value, value)
+            self.assertEquals(query_string, query_toggle_by_key(self.context, 'status', value))
+            self.assertEquals(is_active, active_query_by_key(self.context, 'status', value) == 'active')
+
+    def test_new_key(self):
+        links = query_toggle_links(self.context, 'color', ['red', 'blue'])
+        self.assertEquals(links, [
+            ('red', query_toggle_by_key(self.context, 'color', 'red'), False),
+            ('blue', query_toggle_by_key(self.context, 'color', 'blue'), False),
+        ])
+
+    def test_template(self):
+        request = RequestFactory().get('/?status=active')
+        template = Template(
+            '{% query_toggle_links "status" values as links %}'
+            '{% for value, query_string, is_active in links %}'
+            '{{ value }}|{{ query_string }}|{{ is_active }};'
+            '{% endfor %}'
+        )
+        context = RequestContext(request, {'values': ['active', 'paused']})
+        context['request'] = request
+        rendered = template.render(context)
+        self.assertEquals(rendered, 'active||True;paused|status=active&amp;status=paused|False;')
+
+
 class QueryKeyExistsTestCase(TestCase):
     def setUp(self):
         self.template = Template('{% query_key_exists "search" %}IT WORKS{% endquery_key_exists %}')
@@ -364,7 +553,120 @@ class HumanizeTimeTestCase(TestCase):
         self.assertEquals(humanize_time(.1, 'years'), '1 month, 5 days, 14 hours, 24 minutes')
 
 
+class QueryCacheTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self, template, query_string, **context):
+        request = RequestFactory().get('/foo/?' + query_string)
+        return Template(template).render(RequestContext(request, dict(context, request=request)))
+
+    def test_cached(self):
+        template = "{% query_cache 'facets' 300 %}{{ value }}{% endquery_cache %}"
+        self.assertEquals(self.render(template, 'a=1&b=2', value='first'), 'first')
+        self.assertEquals(self.render(template, 'a=1&b=2', value='second'), 'first')
+        self.assertEquals(self.render(template, 'a=2&b=2', value='second'), 'second')
+
+    def test_normalized(self):
+        template = "{% query_cache 'facets' 300 %}{{ value }}{% endquery_cache %}"
+        self.render(template, 'a=1&b=2&b=3', value='first')
+        self.assertEquals(self.render(template, 'b=3&a=1&b=2', value='second'), 'first')
+        self.assertEquals(self.render(template, 'a=1&b=2', value='second'), 'second')
+
+    def test_only(self):
+        template = "{% query_cache 'facets' 300 only 'a' %}{{ value }}{% endquery_cache %}"
+        self.render(template, 'a=1&page=2', value='first')
+        self.assertEquals(self.render(template, 'a=1&page=3', value='second'), 'first')
+        self.assertEquals(self.render(template, 'page=3', value='second'), 'second')
+
+    def test_vary(self):
+        template = "{% query_cache 'facets' None vary user %}{{ value }}{% endquery_cache %}"
+        self.render(template, 'a=1', value='first', user=1)
+        self.assertEquals(self.render(template, 'a=1', value='second', user=1), 'first')
+        self.assertEquals(self.render(template, 'a=1', value='second', user=2), 'second')
+
+    def test_fragment_name(self):
+        first = "{% query_cache 'facets' 300 %}{{ value }}{% endquery_cache %}"
+        second = "{% query_cache 'header' 300 %}{{ value }}{% endquery_cache %}"
+        self.render(first, 'a=1', value='first')
+        self.assertEquals(self.render(second, 'a=1', value='second'), 'second')
+
+    def test_invalidate(self):
+        template = "{% query_cache 'facets' 300 %}{{ value }}{% endquery_cache %}"
+        self.render(template, 'a=1', value='first')
+        invalidate_query_cache('facets')
+        self.assertEquals(self.render(template, 'a=1', value='second'), 'second')
+        self.assertEquals(self.render(template, 'a=1', value='third'), 'second')
+        invalidate_query_cache('facets')
+        self.assertEquals(self.render(template, 'a=1', value='third'), 'third')
+
+    def test_syntax(self):
+        with self.assertRaises(TemplateSyntaxError):
+            Template("{% query_cache 'facets' %}{% endquery_cache %}")
+        with self.assertRaises(TemplateSyntaxError):
+            Template("{% query_cache 'facets' 300 'a' %}{% endquery_cache %}")
+
+
+class FormatColumnTestCase(TestCase):
+
+    def render(self, template, **context):
+        return Template(template).render(RequestContext(RequestFactory().get('/'), context))
+
+    def test_attribute(self):
+        rows = [mock.Mock(price=1234.5), mock.Mock(price=-2)]
+        rendered = self.render(
+            "{% format_column rows 'price' 'currency' as prices %}"
+            "{% for row, price in prices %}{{ price }};{% endfor %}",
+            rows=rows
+        )
+        self.assertEquals(rendered, '$1,234.50;($2.00);')
+
+    def test_key_and_argument(self):
+        rendered = self.render(
+            "{% format_column rows 'share' 'percentage' 1 as shares %}"
+            "{% for row, share in shares %}{{ row.name }} {{ share }};{% endfor %}",
+            rows=[{'name': 'a', 'share': 0.5}, {'name': 'b', 'share': 0.125}]
+        )
+        self.assertEquals(rendered, 'a 50.0%;b 12.5%;')
+
+    def test_values(self):
+        rendered = self.render(
+            "{% format_column rows None 'humanize_time' as times %}"
+            "{% for row, time in times %}{{ time }};{% endfor %}",
+            rows=[100, 0]
+        )
+        self.assertEquals(rendered, '1 minute, 40 seconds;;')
+
+    def test_unknown_formatter(self):
+        with self.assertRaisesRegex(TemplateSyntaxError, "'dollars', use one of currency, humanize_time"):
+            self.render("{% format_column rows None 'dollars' as values %}", rows=[1])
+
+
 class ToJsonTestCase(TestCase):
     def test_to_json(self):
-        value = to_json({'test': 1})
+        value = to_json({'test': 1}, 'json')
         self.assertEquals(value, '{"test": 1}')
+        self.assertEquals(json.loads(to_json({'test': 1})), {'test': 1})
+
+    def test_autoescaped(self):
+        template = Template('<div data-x="{{ data|to_json }}"></div>')
+        rendered = template.render(Context({'data': {'a': '" onmouseover=alert(1) x="'}}))
+        self.assertNotIn('" onmouseover', rendered)
+        self.assertEquals(rendered.count('"'), 2)
+
+    def test_script_block(self):
+        template = Template('{{ data|to_json_script:"my-data" }}')
+        rendered = template.render(Context({'data': {'name': '</script>"'}}))
+        start = '<script id="my-data" type="application/json">'
+        self.assertTrue(rendered.startswith(start))
+        self.assertTrue(rendered.endswith('</script>'))
+
+        encoded = rendered[len(start):-len('</script>')]
+        self.assertNotIn('<', encoded)
+        self.assertIn('"\\u003c/script\\u003e\\""', encoded)
+        self.assertEquals(json.loads(encoded), {'name': '</script>"'})
+
+    def test_script_block_id_escaped(self):
+        rendered = Template('{{ 1|to_json_script:id }}').render(Context({'id': '"><b'}))
+        self.assertEquals(rendered, '<script id="&quot;&gt;&lt;b" type="application/json">1</script>')
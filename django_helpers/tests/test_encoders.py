@@ -0,0 +1,114 @@
+import datetime
+import json
+import uuid
+from decimal import Decimal
+
+from django.test import TestCase
+from . import settings
+
+from .models import Tag, Item, ModelTestCase
+from ..encoders import (
+    JSON_BACKENDS,
+    JSONBackend,
+    StdlibJSONBackend,
+    get_json_backend,
+    dumps,
+    iter_dumps,
+    streaming_json_response
+)
+
+# The backends installed here
+backends = [name for name, backend in JSON_BACKENDS if backend is not None]
+
+
+class EncodersTestCase(TestCase):
+
+    def test_default_backend(self):
+        self.assertEquals(get_json_backend().name, backends[0])
+        self.assertIs(get_json_backend(), get_json_backend())
+
+    def test_named_backend(self):
+        self.assertIsInstance(get_json_backend('json'), StdlibJSONBackend)
+        backend = StdlibJSONBackend()
+        self.assertIs(get_json_backend(backend), backend)
+        with self.assertRaises(ValueError):
+            get_json_backend('simplejson')
+
+    def test_django_types(self):
+        value = {
+            'date': datetime.date(2016, 1, 2),
+            'datetime': datetime.datetime(2016, 1, 2, 3, 4, 5, 678901),
+            'time': datetime.time(3, 4, 5),
+            'uuid': uuid.UUID('12345678123456781234567812345678'),
+            'decimal': Decimal('1.10'),
+            'list': [1, 'a', None, True],
+        }
+        expected = json.loads(json.dumps(value, cls=StdlibJSONBackend().encoder))
+
+        for name in backends:
+            encoded = json.loads(dumps(value, name))
+            if name == 'ujson':
+                # ujson can't hook Decimals, they come out as numbers
+                encoded['decimal'] = str(Decimal(encoded['decimal']).quantize(Decimal('0.01')))
+            self.assertEquals(encoded, expected, name)
+
+    def test_html_safe(self):
+        value = {'html': '</script><!-- & \u2028\u2029'}
+        for name in backends:
+            encoded = dumps(value, name)
+            for char in '<>&\u2028\u2029':
+                self.assertNotIn(char, encoded, name)
+            self.assertEquals(json.loads(encoded), value, name)
+
+    def test_big_ints(self):
+        value = {'big': 2 ** 70, 'small': -2 ** 64}
+        for name in backends:
+            self.assertEquals(json.loads(dumps(value, name)), value, name)
+
+    def test_not_encodable(self):
+        for name in backends:
+            with self.assertRaises(TypeError):
+                dumps({'set': {1}}, name)
+
+    def test_iter_dumps(self):
+        values = [{'id': i, 'name': '<{}>'.format(i)} for i in range(25)]
+        for name in backends:
+            parts = list(iter_dumps(values, chunk_size=10, backend=name))
+            self.assertEquals(len(parts), 5)
+            self.assertNotIn('<', ''.join(parts))
+            self.assertEquals(json.loads(''.join(parts)), values, name)
+
+    def test_iter_dumps_generators(self):
+        self.assertEquals(''.join(iter_dumps(iter([]))), '[]')
+        self.assertEquals(json.loads(''.join(iter_dumps(i * 2 for i in range(5)))), [0, 2, 4, 6, 8])
+
+    def test_iter_dumps_single_values(self):
+        for value in [{'a': [1, 2]}, 'abc', 1, None]:
+            self.assertEquals(list(iter_dumps(value)), [dumps(value)])
+
+    def test_custom_backend(self):
+        class UpperBackend(JSONBackend):
+            def dumps(self, value):
+                return json.dumps(value).upper()
+
+        self.assertEquals(dumps(['<a>'], UpperBackend()), '["\\u003cA\\u003e"]')
+
+
+class StreamingTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    def setUp(self):
+        Item.objects.bulk_create(Item(name='item {}'.format(i), price=i) for i in range(30))
+
+    def test_queryset(self):
+        qs = Item.objects.order_by('pk').values('name', 'price')
+        with self.assertNumQueries(1):
+            encoded = ''.join(iter_dumps(qs, chunk_size=7))
+        self.assertEquals(json.loads(encoded), list(qs))
+
+    def test_response(self):
+        qs = Item.objects.order_by('pk').values_list('price', flat=True)
+        response = streaming_json_response(qs)
+        self.assertEquals(response['Content-Type'], 'application/json')
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEquals(json.loads(content), list(range(30)))
@@ -1,18 +1,49 @@
+from array import array
+from unittest import mock
+
 from django.test import TestCase
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.test.client import RequestFactory
 from django.http.request import QueryDict
 from django.db import models
+from django.db.models import Q
+from django.db.models.signals import post_save
 from . import settings
 
 import django_filters
-
-from ..filters import DefaultFilterSet, TagFilter, SearchFilter, get_filter_value_list
+from django_filters.filterset import STRICTNESS
+
+from .models import Tag, Item, ModelTestCase
+from ..utils import paginate
+from ..filters import (
+    DefaultFilterSet,
+    TagFilter,
+    SearchFilter,
+    get_filter_value_list,
+    parse_filter_values,
+    MAX_RANGE_ITEMS,
+    MAX_INT,
+    IdListFilter,
+    split_id_runs,
+    sqlite_json_support,
+    get_tag_ids,
+    tag_id_map_key,
+    tag_id_maps,
+    tag_id_signals,
+    filter_ids_signals,
+    filter_ids_version_key,
+    TAG_ID_MAP_TIMEOUT,
+    filter_params,
+    filter_q
+)
 
 
 class MockQuerySet(object):
 
     def __init__(self):
         self.filters = {}
+        self.filter_calls = 0
 
     def all(self):
         return self
@@ -27,13 +58,19 @@ class MockQuerySet(object):
         return self
 
     def filter(self, *args, **kwargs):
+        self.filter_calls += 1
         self.filters.update(kwargs)
         for arg in args:
-            for i in arg.children:
-                if isinstance(i, tuple):
-                    self.filters[i[0]] = i[1]
+            self.add_q(arg)
         return self
 
+    def add_q(self, q):
+        for i in q.children:
+            if isinstance(i, tuple):
+                self.filters[i[0]] = i[1]
+            else:
+                self.add_q(i)
+
 
 class MockModel(models.Model):
     name = models.CharField(max_length=128)
@@ -93,6 +130,114 @@ class DefaultFilterSetTestCase(TestCase):
         self.assertEquals(filter.data.getlist('status'), ['archived'])
 
 
+class CachedItemFilterSet(DefaultFilterSet):
+    tags = TagFilter()
+
+    class Meta:
+        model = Item
+        fields = ['tags', 'price']
+        order_by = ['name', '-name']
+        cache_timeout = 60
+
+
+class CachedIdsTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    def setUp(self):
+        cache.clear()
+        foo = Tag.objects.create(name='Foo', slug='foo')
+        bar = Tag.objects.create(name='Bar', slug='bar')
+        for i in range(15):
+            item = Item.objects.create(name='item {:02}'.format(i), price=i % 3)
+            item.tags.add(foo if i % 2 else bar)
+
+    def filterset(self, query_string):
+        return CachedItemFilterSet(QueryDict(query_string), Item.objects.all())
+
+    def test_ids(self):
+        filterset = self.filterset('tags=foo&o=-name')
+        self.assertEquals(filterset.cached_ids, list(filterset.qs.values_list('pk', flat=True)))
+
+    def test_cached(self):
+        ids = self.filterset('tags=foo&tags=bar&price=1').cached_ids
+        with self.assertNumQueries(0):
+            self.assertEquals(self.filterset('price=1&tags=bar&tags=foo&page=2').cached_ids, ids)
+
+    def test_different_params(self):
+        ids = self.filterset('tags=foo').cached_ids
+        self.assertNotEquals(self.filterset('tags=bar').cached_ids, ids)
+        self.assertEquals(filter_params(self.filterset('tags=foo&o=name')), (('o', ('name',)), ('tags', ('foo',))))
+
+    def test_single_valued_params(self):
+        # The form uses the last value of a single-valued filter
+        self.assertEquals(filter_params(self.filterset('price=2&price=3')), (('price', ('3',)),))
+        self.assertNotEquals(self.filterset('price=2&price=1').cached_ids, self.filterset('price=1&price=2').cached_ids)
+        self.assertEquals(filter_params(self.filterset('tags=foo&tags=bar&tags=foo')), (('tags', ('bar', 'foo')),))
+
+    def test_different_queryset(self):
+        ids = self.filterset('tags=foo').cached_ids
+        filterset = CachedItemFilterSet(QueryDict('tags=foo'), Item.objects.filter(price=0))
+        self.assertNotEquals(filterset.cached_ids, ids)
+
+    def test_invalidated(self):
+        self.filterset('tags=foo').cached_ids
+        item = Item.objects.create(name='new')
+        item.tags.add(Tag.objects.get(slug='foo'))
+        self.assertIn(item.pk, self.filterset('tags=foo').cached_ids)
+
+        item.delete()
+        self.assertNotIn(item.pk, self.filterset('tags=foo').cached_ids)
+
+    def test_invalidated_by_relations(self):
+        foo = Tag.objects.get(slug='foo')
+        item = Item.objects.create(name='new')
+
+        self.assertNotIn(item.pk, self.filterset('tags=foo').cached_ids)
+        item.tags.add(foo)
+        self.assertIn(item.pk, self.filterset('tags=foo').cached_ids)
+
+        item.tags.remove(foo)
+        self.assertNotIn(item.pk, self.filterset('tags=foo').cached_ids)
+
+        foo.item_set.add(item)
+        self.assertIn(item.pk, self.filterset('tags=foo').cached_ids)
+
+        item.tags.clear()
+        self.assertNotIn(item.pk, self.filterset('tags=foo').cached_ids)
+
+    def test_signals_connected_with_the_filterset(self):
+        # A process that only reads cached ids (or only saves rows) must
+        # still invalidate them, so the class connects the signals
+        post_save.disconnect(sender=Item, dispatch_uid=filter_ids_version_key(Item))
+        filter_ids_signals.discard(Item)
+
+        class ReadOnlyFilterSet(CachedItemFilterSet):
+            pass
+
+        self.assertIn(Item, filter_ids_signals)
+        version = cache.get(filter_ids_version_key(Item), 0)
+        Item.objects.create(name='new')
+        self.assertEquals(cache.get(filter_ids_version_key(Item)), version + 1)
+
+    def test_paginate(self):
+        filterset = self.filterset('o=name')
+        filterset.cached_ids
+        request = RequestFactory().get('/', {'page': 2})
+        with self.assertNumQueries(1):
+            page = paginate(request, filterset.cached_results(), 10)
+            self.assertEquals([item.name for item in page], ['item {:02}'.format(i) for i in range(10, 15)])
+
+    def test_deleted_rows(self):
+        results = self.filterset('o=name').cached_results()
+        Item.objects.get(name='item 01').delete()
+
+        self.assertEquals(results[0].name, 'item 00')
+        with self.assertRaises(IndexError):
+            results[1]
+        self.assertEquals([item.name for item in results[:3]], ['item 00', 'item 02'])
+        self.assertEquals(len(list(results)), 14)
+
+
 class TagFilterTestCase(TestCase):
 
     def test_no_op(self):
@@ -122,6 +267,177 @@ class TagFilterTestCase(TestCase):
         self.assertEquals(filter.qs.filters['tags__slug__in'], ['foo', 'bar'])
 
 
+class ItemTagFilterSet(DefaultFilterSet):
+    tags = TagFilter(resolve_ids=True)
+
+    class Meta:
+        model = Item
+        fields = ['tags']
+
+
+class TagFilterIdsTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    def setUp(self):
+        tag_id_maps.clear()
+        cache.clear()
+        self.foo = Tag.objects.create(name='Foo', slug='foo')
+        self.bar = Tag.objects.create(name='Bar', slug='bar')
+        self.item = Item.objects.create(name='item')
+        self.item.tags.add(self.foo)
+        Item.objects.create(name='other').tags.add(self.bar)
+
+    def test_filter_on_ids(self):
+        qs = ItemTagFilterSet({'tags': 'foo'}, Item.objects.all()).qs
+        self.assertEquals(list(qs), [self.item])
+        self.assertNotIn('test_tag', str(qs.query))
+
+    def test_map_is_cached(self):
+        get_tag_ids(Tag, ['foo'])
+        with self.assertNumQueries(0):
+            self.assertEquals(get_tag_ids(Tag, ['foo', 'bar']), [self.foo.pk, self.bar.pk])
+
+    def test_django_cache(self):
+        get_tag_ids(Tag, ['foo'], use_cache=True)
+        self.assertNotIn(tag_id_map_key(Tag), tag_id_maps)
+        with self.assertNumQueries(0):
+            self.assertEquals(get_tag_ids(Tag, ['foo'], use_cache=True), [self.foo.pk])
+
+    def test_unknown_slugs(self):
+        # Slugs that aren't in the loaded map are remembered as misses
+        get_tag_ids(Tag, ['foo', 'nope'])
+        with self.assertNumQueries(0):
+            for i in range(5):
+                qs = ItemTagFilterSet({'tags': 'nope'}, Item.objects.all()).qs
+                self.assertEquals(list(qs), [])
+
+    def test_unknown_slugs_looked_up_once(self):
+        for use_cache in (False, True):
+            get_tag_ids(Tag, ['foo'], use_cache)
+            with self.assertNumQueries(1):
+                for i in range(5):
+                    self.assertEquals(get_tag_ids(Tag, ['foo', 'nope'], use_cache), [self.foo.pk])
+
+    def test_unknown_slugs_cleared_on_save(self):
+        get_tag_ids(Tag, ['nope'])
+        nope = Tag.objects.create(name='Nope', slug='nope')
+        self.assertEquals(get_tag_ids(Tag, ['nope']), [nope.pk])
+
+    def test_unknown_slugs_limit(self):
+        with mock.patch('django_helpers.filters.MAX_TAG_ID_MISSES', 2):
+            get_tag_ids(Tag, ['a', 'b', 'c'])
+            self.assertEquals(tag_id_maps[tag_id_map_key(Tag)], {'foo': self.foo.pk, 'bar': self.bar.pk,
+                                                                 'a': None, 'b': None})
+            with self.assertNumQueries(1):
+                self.assertEquals(get_tag_ids(Tag, ['a', 'c']), [])
+
+    def test_tag_added_elsewhere(self):
+        # Another process added a tag: the saved signal never reached this map
+        for use_cache in (False, True):
+            get_tag_ids(Tag, ['foo'], use_cache)
+            Tag.objects.bulk_create([Tag(name='Baz', slug='baz')])
+            baz = Tag.objects.get(slug='baz')
+            self.assertEquals(get_tag_ids(Tag, ['foo', 'baz'], use_cache), [self.foo.pk, baz.pk])
+            with self.assertNumQueries(0):
+                self.assertEquals(get_tag_ids(Tag, ['baz'], use_cache), [baz.pk])
+            baz.delete()
+
+    def test_shared_map_expires(self):
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            get_tag_ids(Tag, ['foo'], use_cache=True)
+        self.assertEquals(cache_set.call_args[0][2], TAG_ID_MAP_TIMEOUT)
+
+    def test_signals_connected_with_the_filterset(self):
+        # Filtersets connect the signals when they're defined so a process
+        # reading the map from the django cache still invalidates it
+        post_save.disconnect(sender=Tag, dispatch_uid=tag_id_map_key(Tag))
+        tag_id_signals.discard(Tag)
+
+        class TagIdsFilterSet(DefaultFilterSet):
+            tags = TagFilter(resolve_ids=True)
+
+            class Meta:
+                model = Item
+                fields = ['tags']
+
+        self.assertIn(Tag, tag_id_signals)
+        cache.set(tag_id_map_key(Tag), {'foo': self.foo.pk})
+        Tag.objects.create(name='Qux', slug='qux')
+        self.assertIsNone(cache.get(tag_id_map_key(Tag)))
+
+    def test_invalidated_on_save(self):
+        get_tag_ids(Tag, ['foo'])
+        get_tag_ids(Tag, ['foo'], use_cache=True)
+        baz = Tag.objects.create(name='Baz', slug='baz')
+        self.assertEquals(get_tag_ids(Tag, ['baz']), [baz.pk])
+        self.assertEquals(get_tag_ids(Tag, ['baz'], use_cache=True), [baz.pk])
+
+    def test_invalidated_on_delete(self):
+        get_tag_ids(Tag, ['foo'])
+        self.bar.delete()
+        self.assertEquals(get_tag_ids(Tag, ['foo', 'bar']), [self.foo.pk])
+
+
+class TagFilterModesTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    def setUp(self):
+        tag_id_maps.clear()
+        foo = Tag.objects.create(name='Foo', slug='foo')
+        bar = Tag.objects.create(name='Bar', slug='bar')
+        self.both = Item.objects.create(name='both')
+        self.both.tags.add(foo, bar)
+        self.foo = Item.objects.create(name='foo')
+        self.foo.tags.add(foo)
+        self.bar = Item.objects.create(name='bar')
+        self.bar.tags.add(bar)
+        Item.objects.create(name='none')
+
+    def filter(self, data, **kwargs):
+        class ItemFilterSet(DefaultFilterSet):
+            tags = TagFilter(**kwargs)
+
+            class Meta:
+                model = Item
+                fields = ['tags']
+
+        return ItemFilterSet(data, Item.objects.order_by('pk')).qs
+
+    def test_join_duplicates(self):
+        qs = self.filter({'tags': ['foo', 'bar']})
+        self.assertEquals(len(qs), 4)
+
+    def test_subquery(self):
+        qs = self.filter({'tags': ['foo', 'bar']}, subquery=True)
+        with self.assertNumQueries(1):
+            self.assertEquals(list(qs), [self.both, self.foo, self.bar])
+        self.assertNotIn('DISTINCT', str(qs.query))
+
+    def test_conjoined(self):
+        qs = self.filter({'tags': ['foo', 'bar']}, conjoined=True)
+        with self.assertNumQueries(1):
+            self.assertEquals(list(qs), [self.both])
+        self.assertIn('HAVING', str(qs.query))
+
+    def test_conjoined_single_tag(self):
+        qs = self.filter({'tags': ['foo', 'foo']}, conjoined=True)
+        self.assertEquals(list(qs), [self.both, self.foo])
+
+    def test_conjoined_unknown_tag(self):
+        self.assertEquals(list(self.filter({'tags': ['foo', 'nope']}, conjoined=True)), [])
+
+    def test_conjoined_ids(self):
+        qs = self.filter({'tags': ['foo', 'bar']}, conjoined=True, resolve_ids=True)
+        self.assertEquals(list(qs), [self.both])
+        self.assertNotIn('test_tag"', str(qs.query))
+
+        # The unknown slug is only looked up the first time
+        self.filter({'tags': ['foo', 'nope']}, conjoined=True, resolve_ids=True)
+        with self.assertNumQueries(0):
+            qs = self.filter({'tags': ['foo', 'nope']}, conjoined=True, resolve_ids=True)
+            self.assertEquals(list(qs), [])
+
+
 class SearchFilterTestCase(TestCase):
 
     def test_no_op(self):
@@ -170,6 +486,52 @@ class SearchFilterTestCase(TestCase):
         self.assertEquals(filter.qs.filters['status__startswith'], 'bar')
 
 
+class SearchFilterJoinsTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    def setUp(self):
+        foo = Tag.objects.create(name='Red Foo', slug='foo')
+        bar = Tag.objects.create(name='Blue Bar', slug='bar')
+        self.red = Item.objects.create(name='red item')
+        self.red.tags.add(foo)
+        self.blue = Item.objects.create(name='blue item')
+        self.blue.tags.add(bar)
+        self.both = Item.objects.create(name='other')
+        self.both.tags.add(foo, bar)
+
+    def search(self, value):
+        class ItemFilterSet(DefaultFilterSet):
+            search = SearchFilter(
+                ['name__icontains', 'tags__name__icontains', 'tags__slug__icontains'],
+                exact=False
+            )
+
+            class Meta:
+                model = Item
+                fields = ['search']
+
+        return ItemFilterSet({'search': value}, Item.objects.order_by('pk')).qs
+
+    def test_join_count(self):
+        for value in ['red', 'red foo', 'red foo blue bar']:
+            sql = str(self.search(value).query)
+            outer = sql.split('IN (SELECT')[0]
+            self.assertEquals(outer.count('JOIN'), 0)
+            # Each term's subquery joins item_tags and tag once
+            self.assertEquals(sql.count('JOIN'), 2 * len(value.split()))
+
+    def test_results(self):
+        self.assertEquals(list(self.search('red')), [self.red, self.both])
+        self.assertEquals(list(self.search('item red')), [self.red])
+        self.assertEquals(list(self.search('red blue')), [self.both])
+        self.assertEquals(list(self.search('foo bar')), [self.both])
+        self.assertEquals(list(self.search('nope')), [])
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            list(self.search('red foo blue bar'))
+
+
 class TestGetFilterValueList(TestCase):
     def test_string(self):
         value = get_filter_value_list('a,b,c', 'key')
@@ -215,3 +577,297 @@ class TestGetFilterValueList(TestCase):
         data = QueryDict('key=')
         value = get_filter_value_list(data, 'key', is_int=True)
         self.assertIs(value, None)
+
+
+class TestParseFilterValues(TestCase):
+    def test_same_as_get_filter_value_list(self):
+        data = QueryDict('key=1,a,,2&key=&key=3,-4, 5')
+        self.assertEquals(parse_filter_values(data, 'key', is_int=True), [1, 2, 3, -4, 5])
+        self.assertEquals(parse_filter_values(data, 'key'), ['1', 'a', '2', '3', '-4', ' 5'])
+
+    def test_ranges(self):
+        data = QueryDict('key=1-3,7,-2--1,9-8,a-b')
+        value = parse_filter_values(data, 'key', is_int=True, ranges=True)
+        self.assertEquals(value, [1, 2, 3, 7, -2, -1])
+
+    def test_unique(self):
+        value = parse_filter_values('3,1,3,2,1', 'key', is_int=True, unique=True)
+        self.assertEquals(value, [3, 1, 2])
+
+    def test_max_items(self):
+        value = parse_filter_values('1-1000000000', 'key', is_int=True, ranges=True, max_items=3)
+        self.assertEquals(value, [1, 2, 3])
+
+        value = parse_filter_values('1,1,2,2,3', 'key', unique=True, max_items=2)
+        self.assertEquals(value, ['1', '2'])
+
+    def test_ranges_are_bounded(self):
+        value = parse_filter_values('1-1000000000', 'key', is_int=True, ranges=True)
+        self.assertEquals(len(value), MAX_RANGE_ITEMS)
+        self.assertEquals(value[-1], MAX_RANGE_ITEMS)
+
+    def test_compact(self):
+        value = parse_filter_values('1-100', 'key', is_int=True, ranges=True, compact=True)
+        self.assertEquals(value, range(1, 101))
+
+        # A single range isn't expanded
+        value = parse_filter_values('5-1000000000000', 'key', is_int=True, ranges=True, compact=True,
+                                    max_items=10 ** 12)
+        self.assertEquals(value, range(5, 10 ** 12 + 1))
+        value = parse_filter_values('5-1000000000000', 'key', is_int=True, ranges=True, compact=True)
+        self.assertEquals(value, range(5, 5 + MAX_RANGE_ITEMS))
+        self.assertIs(parse_filter_values('9-8', 'key', is_int=True, ranges=True, compact=True), None)
+
+        value = parse_filter_values('1,5,3', 'key', is_int=True, compact=True)
+        self.assertEquals(value, array('q', [1, 5, 3]))
+
+    def test_empty(self):
+        self.assertIs(parse_filter_values('a,b', 'key', is_int=True, compact=True), None)
+
+    def test_oversized_ints(self):
+        huge = '99999999999999999999'
+        value = parse_filter_values('1,3,' + huge, 'key', is_int=True, compact=True)
+        self.assertEquals(value, array('q', [1, 3]))
+        value = parse_filter_values('1,-' + huge, 'key', is_int=True)
+        self.assertEquals(value, [1])
+        value = parse_filter_values('2,{}-{}'.format(MAX_INT - 1, huge), 'key', is_int=True, ranges=True)
+        self.assertEquals(value, [2, MAX_INT - 1, MAX_INT])
+        value = parse_filter_values('{}-{}'.format(MAX_INT, huge), 'key', is_int=True, ranges=True, compact=True)
+        self.assertEquals(value, range(MAX_INT, MAX_INT + 1))
+        self.assertIs(parse_filter_values(huge + '-' + huge, 'key', is_int=True, ranges=True, compact=True), None)
+
+
+class IdListFilterTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    def setUp(self):
+        Item.objects.bulk_create(Item(name=str(i)) for i in range(300))
+        self.pks = list(Item.objects.order_by('pk').values_list('pk', flat=True))
+
+    def filter(self, ids, **kwargs):
+        class ItemFilterSet(DefaultFilterSet):
+            id = IdListFilter(**kwargs)
+
+            class Meta:
+                model = Item
+                fields = ['id']
+
+        data = QueryDict('', mutable=True)
+        data.setlist('id', [','.join(str(i) for i in ids)])
+        return ItemFilterSet(data, Item.objects.order_by('pk')).qs
+
+    def assertSameResults(self, ids, **kwargs):
+        qs = self.filter(ids, **kwargs)
+        self.assertEquals(list(qs), list(Item.objects.filter(pk__in=ids).order_by('pk')))
+        return str(qs.query)
+
+    def test_small_list(self):
+        sql = self.assertSameResults(self.pks[:5] + [999999])
+        self.assertIn(' IN (', sql)
+
+    def test_ranges(self):
+        ids = self.pks[10:50] + self.pks[60:62] + self.pks[100:200]
+        sql = self.assertSameResults(ids)
+        self.assertEquals(sql.count('BETWEEN'), 2)
+
+    def test_large_list(self):
+        ids = self.pks[::2]
+        sql = self.assertSameResults(ids, max_in=50)
+        self.assertIn('json_each', sql)
+
+    def test_large_list_with_ranges(self):
+        ids = self.pks[::2] + self.pks[1:40]
+        self.assertSameResults(ids, max_in=50, min_range=10)
+
+    def test_client_ranges_are_bounded(self):
+        self.assertEquals(IdListFilter(ranges=True).max_items, MAX_RANGE_ITEMS)
+        self.assertEquals(IdListFilter().max_items, MAX_RANGE_ITEMS)
+        self.assertIs(IdListFilter(max_items=None).max_items, None)
+
+        filter_ = IdListFilter(ranges=True, name='id')
+        filter_.parent = mock.Mock(data=QueryDict('id=1-999999999'))
+        self.assertEquals(filter_.get_ids(None), list(range(1, MAX_RANGE_ITEMS + 1)))
+
+    def test_large_list_without_json(self):
+        sqlite_json_support['default'] = False
+        try:
+            ids = self.pks[::3]
+            sql = self.assertSameResults(ids, max_in=20)
+            self.assertEquals(sql.count(' IN ('), 5)
+        finally:
+            sqlite_json_support.clear()
+
+    def test_large_list_across_relation(self):
+        tags = [Tag.objects.create(name=str(i), slug=str(i)) for i in range(60)]
+        items = Item.objects.order_by('pk')[:3]
+        items[0].tags.add(*tags[::2])
+        items[2].tags.add(tags[1])
+        ids = [tag.pk for tag in tags[1::2]] + [999999]
+
+        class ItemFilterSet(DefaultFilterSet):
+            tags__id = IdListFilter(max_in=10, min_range=5)
+
+            class Meta:
+                model = Item
+                fields = ['tags__id']
+
+        for json_support in (True, False):
+            sqlite_json_support['default'] = json_support
+            try:
+                data = QueryDict('tags__id=' + ','.join(str(i) for i in ids))
+                qs = ItemFilterSet(data, Item.objects.order_by('pk')).qs
+                self.assertEquals(list(qs), [items[2]])
+                self.assertEquals('json_each' in str(qs.query), json_support)
+            finally:
+                sqlite_json_support.clear()
+
+    def test_empty(self):
+        self.assertEquals(len(self.filter([])), 300)
+
+    def test_split_id_runs(self):
+        ranges, singles = split_id_runs([1, 2, 3, 4, 7, 9, 10, 11], 3)
+        self.assertEquals(ranges, [(1, 4), (9, 11)])
+        self.assertEquals(singles, [7])
+
+
+class FacetFilterSet(DefaultFilterSet):
+    tags = TagFilter()
+    price = django_filters.MultipleChoiceFilter(choices=[
+        ('0', 'free'),
+        ('1', 'cheap'),
+        ('2', 'expensive'),
+        ('3', 'luxury')
+    ])
+
+    class Meta:
+        model = Item
+        fields = ['tags', 'price']
+
+
+class FacetCountsTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    def setUp(self):
+        foo = Tag.objects.create(name='Foo', slug='foo')
+        bar = Tag.objects.create(name='Bar', slug='bar')
+        for i in range(12):
+            item = Item.objects.create(name=str(i), price=i % 3)
+            if i % 2:
+                item.tags.add(foo)
+            if i % 3 == 0:
+                item.tags.add(bar)
+
+    def facets(self, query_string):
+        filterset = FacetFilterSet(QueryDict(query_string), Item.objects.all())
+        return filterset.facet_counts('price', 'tags')
+
+    def test_no_filters(self):
+        with self.assertNumQueries(2):
+            facets = self.facets('')
+        self.assertEquals(facets['price'], {'0': 4, '1': 4, '2': 4, '3': 0})
+        self.assertEquals(list(facets['price']), ['0', '1', '2', '3'])
+        self.assertEquals(facets['tags'], {'bar': 4, 'foo': 6})
+
+    def test_own_filter_excluded(self):
+        facets = self.facets('price=1&tags=foo')
+        # Price counts only have the tags filter applied and vice versa
+        self.assertEquals(facets['price'], {'0': 2, '1': 2, '2': 2, '3': 0})
+        self.assertEquals(facets['tags'], {'foo': 2})
+
+    def test_matches_counts(self):
+        facets = self.facets('tags=bar')
+        for value, count in facets['price'].items():
+            filterset = FacetFilterSet(QueryDict('tags=bar&price=' + value), Item.objects.all())
+            self.assertEquals(filterset.qs.distinct().count(), count)
+
+    def test_faceted(self):
+        filterset = FacetFilterSet(QueryDict('price=2'), Item.objects.all())
+        qs, facets = filterset.faceted('tags')
+        self.assertEquals(qs.count(), 4)
+        self.assertEquals(facets['tags'], {'foo': 2})
+
+    def test_strictness(self):
+        data = QueryDict('tags=foo&price=7')
+
+        qs, facets = FacetFilterSet(data, Item.objects.all()).faceted('price', 'tags')
+        self.assertEquals(qs.count(), 0)
+        self.assertEquals(facets['price'], {'0': 0, '1': 0, '2': 0, '3': 0})
+        self.assertEquals(facets['tags'], {})
+
+        # The invalid price is skipped by the facets like it is by qs
+        filterset = FacetFilterSet(data, Item.objects.all(), strict=STRICTNESS.IGNORE)
+        qs, facets = filterset.faceted('price', 'tags')
+        self.assertEquals(qs.count(), 6)
+        self.assertEquals(facets['price'], {'0': 2, '1': 2, '2': 2, '3': 0})
+        self.assertEquals(facets['tags'], {'bar': 4, 'foo': 6})
+
+        filterset = FacetFilterSet(data, Item.objects.all(), strict=STRICTNESS.RAISE_VALIDATION_ERROR)
+        with self.assertRaises(ValidationError):
+            filterset.facet_counts('tags')
+
+
+class CombinedFilterSet(DefaultFilterSet):
+    tags = TagFilter()
+    name = SearchFilter(['name__icontains'])
+    price = django_filters.MultipleChoiceFilter(choices=[
+        ('0', 'free'),
+        ('1', 'cheap'),
+        ('2', 'expensive')
+    ])
+    min_price = django_filters.NumberFilter(name='price', lookup_expr='gte')
+    id = IdListFilter(max_in=5)
+
+    class Meta:
+        model = Item
+        fields = ['tags', 'name', 'price', 'min_price', 'id']
+        combine_filters = True
+
+
+class SeparateFilterSet(CombinedFilterSet):
+    class Meta(CombinedFilterSet.Meta):
+        combine_filters = False
+
+
+class CombinedFiltersTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    def setUp(self):
+        foo = Tag.objects.create(name='Foo', slug='foo')
+        for i in range(30):
+            item = Item.objects.create(name='item {}'.format(i), price=i % 3)
+            if i % 2:
+                item.tags.add(foo)
+
+    def assertSameResults(self, query_string):
+        combined = CombinedFilterSet(QueryDict(query_string), Item.objects.order_by('pk')).qs
+        separate = SeparateFilterSet(QueryDict(query_string), Item.objects.order_by('pk')).qs
+        self.assertEquals(list(combined), list(separate))
+        return combined
+
+    def test_results(self):
+        self.assertSameResults('')
+        self.assertSameResults('tags=foo&price=1&price=2')
+        self.assertSameResults('name=item+1&min_price=1')
+        self.assertSameResults('tags=foo&tags=bar')
+        pks = Item.objects.values_list('pk', flat=True)
+        self.assertSameResults('tags=foo&id=' + ','.join(str(pk) for pk in pks[::2]))
+
+    def test_single_filter_call(self):
+        qs = MockQuerySet()
+        filterset = CombinedFilterSet(QueryDict('tags=foo&name=item&price=1&min_price=1'), qs)
+        filterset.qs
+        self.assertEquals(qs.filter_calls, 1)
+        self.assertEquals(qs.filters['price__gte'], 1)
+
+    def test_large_id_list_applied_separately(self):
+        pks = Item.objects.values_list('pk', flat=True)
+        qs = self.assertSameResults('price=1&id=' + ','.join(str(pk) for pk in pks[::2]))
+        self.assertIn('json_each', str(qs.query))
+
+    def test_filter_q(self):
+        filter_ = django_filters.NumberFilter(name='price', lookup_expr='gte')
+        self.assertEquals(str(filter_q(filter_, Item, 2)), str(Q(price__gte=2)))
+        self.assertIsNone(filter_q(filter_, Item, None))
+
+        filter_ = django_filters.NumberFilter(name='price', exclude=True)
+        self.assertIs(filter_q(filter_, Item, 2), NotImplemented)
@@ -0,0 +1,202 @@
+import random
+from unittest import skipIf
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.template.defaultfilters import floatformat
+from django.contrib.humanize.templatetags.humanize import intcomma
+from . import settings
+
+from ..formatting import (
+    numpy,
+    format_currency,
+    format_percentage,
+    format_currency_column,
+    format_percentage_column,
+    format_duration_column
+)
+
+
+def reference_percentage(value, decimal_places=2):
+    # The percentage filter before the fast path
+    if value is None or value == "":
+        return ""
+
+    return '{}%'.format(floatformat(value * 100.0, decimal_places))
+
+
+def reference_currency(dollars, use_parentheses=True, include_cents=True, positive=False):
+    # The currency filter before the fast path
+    if dollars is None or dollars == "":
+        return ""
+
+    dollars = Decimal(dollars)
+
+    if not include_cents:
+        whole_dollars = abs(int(dollars.quantize(0, ROUND_HALF_UP)))
+        cents = ""
+    else:
+        whole_dollars = abs(int(dollars))
+        cents = ("%0.2f" % dollars)[-3:]
+
+    formatter = "${}{}"
+
+    if dollars < 0.0:
+        formatter = "${}{}"
+        if use_parentheses:
+            formatter = "(${}{})"
+        elif not positive:
+            formatter = "-${}{}"
+
+    return formatter.format(intcomma(whole_dollars), cents)
+
+
+def random_values(count=3000, seed=0):
+    """
+    Yields ints, floats and Decimals of every magnitude, with a bias
+    towards the values rounding is sensitive to (halves, x.xx5 etc).
+    """
+    rng = random.Random(seed)
+    for _ in range(count):
+        kind = rng.randrange(6)
+        magnitude = 10 ** rng.randrange(0, 16)
+        sign = rng.choice([1, -1])
+
+        if kind == 0:
+            yield sign * rng.randrange(magnitude)
+        elif kind == 1:
+            yield sign * rng.random() * magnitude
+        elif kind == 2:
+            yield sign * (rng.randrange(magnitude) + rng.choice([0.5, 0.005, 0.125, 0.995, 0.0049]))
+        elif kind == 3:
+            yield sign * rng.randrange(100000) / rng.choice([10, 100, 1000, 10000, 200, 8])
+        elif kind == 4:
+            places = rng.randrange(0, 8)
+            yield Decimal(sign * rng.randrange(magnitude * 10 ** places)) / 10 ** places
+        else:
+            yield sign * rng.random() / rng.choice([1, 100, 10000, 10 ** 8])
+
+    edge_cases = [
+        0, 0.0, -0.0, Decimal('0'), Decimal('-0.00'), 1, -1, 0.5, -0.5, 1.005, 2.675,
+        0.999, -0.999, 999.995, 1e15 - 1, -(1e15 - 1), 10 ** 15, 1e16, -1e20, 10 ** 20,
+        float('inf'), float('-inf'), Decimal('1e20'), Decimal('0.5'), Decimal('-2.5'),
+        '12.5', '-1234.567', 1e-10, 5e-324,
+    ]
+    for value in edge_cases:
+        yield value
+
+
+def outcome(func, *args):
+    try:
+        return func(*args)
+    except Exception as e:
+        return type(e)
+
+
+class FormattingPropertyTestCase(TestCase):
+    """
+    The fast paths have to give exactly the same output (or error) as the
+    original filters, compare them over a lot of random values.
+    """
+
+    def assertSameOutput(self, func, reference, cases):
+        mismatches = [
+            (args, outcome(func, *args), outcome(reference, *args))
+            for args in cases
+            if outcome(func, *args) != outcome(reference, *args)
+        ]
+        self.assertEquals(mismatches, [])
+
+    def test_currency(self):
+        cases = [
+            (value, use_parentheses, include_cents, positive)
+            for value in random_values()
+            for use_parentheses in (True, False)
+            for include_cents in (True, False)
+            for positive in (True, False)
+        ]
+        self.assertSameOutput(format_currency, reference_currency, cases)
+
+    def test_percentage(self):
+        cases = [
+            (value, decimal_places)
+            for value in random_values(seed=1)
+            for decimal_places in (0, 1, 2, 3, 5, -1, '2')
+        ]
+        self.assertSameOutput(format_percentage, reference_percentage, cases)
+
+    def test_nan(self):
+        self.assertEquals(format_percentage(float('nan')), reference_percentage(float('nan')))
+        with self.assertRaises(ValueError):
+            format_currency(float('nan'))
+        with self.assertRaises(ValueError):
+            format_currency(Decimal('nan'))
+
+    def test_not_a_number(self):
+        for value in (None, ''):
+            self.assertEquals(format_currency(value), '')
+            self.assertEquals(format_percentage(value), '')
+
+    @override_settings(USE_L10N=True, USE_THOUSAND_SEPARATOR=True)
+    def test_localized(self):
+        values = list(random_values(count=200, seed=2))
+        self.assertSameOutput(format_currency, reference_currency, [(v,) for v in values])
+        self.assertSameOutput(format_percentage, reference_percentage, [(v,) for v in values])
+
+
+class ColumnFormattersTestCase(TestCase):
+    """
+    The column formatters have to give the same output as formatting the
+    values one by one.
+    """
+
+    def test_currency_column(self):
+        # Without the values that raise (inf)
+        values = [v for v in random_values(count=500, seed=3) if isinstance(outcome(format_currency, v), str)]
+        values += [None, '']
+        for kwargs in ({}, {'use_parentheses': False}, {'include_cents': False},
+                       {'use_parentheses': False, 'positive': True}):
+            self.assertEquals(
+                format_currency_column(values, **kwargs),
+                [format_currency(v, **kwargs) for v in values]
+            )
+
+    def test_percentage_column(self):
+        values = [v for v in random_values(count=500, seed=4) if isinstance(v, (int, float))]
+        values += [None, '']
+        for decimal_places in (0, 2, 3, -1, '1'):
+            # Without the values that raise (tiny floats with floatformat)
+            column = [v for v in values if isinstance(outcome(format_percentage, v, decimal_places), str)]
+            self.assertEquals(
+                format_percentage_column(column, decimal_places),
+                [format_percentage(v, decimal_places) for v in column]
+            )
+
+    def test_duration_column(self):
+        values = [0, .1, 100, 290304001, 29030399, None]
+        self.assertEquals(
+            format_duration_column(values),
+            ['', 'less than a second', '1 minute, 40 seconds', '10 years, 1 second',
+             '11 months, 3 weeks, 6 days, 23 hours, 59 minutes, 59 seconds', '']
+        )
+        self.assertEquals(format_duration_column([1, .1], 'years'),
+                          ['1 year', '1 month, 5 days, 14 hours, 24 minutes'])
+        with self.assertRaises(ValueError):
+            format_duration_column([1], 'fortnights')
+
+    @override_settings(USE_L10N=True)
+    def test_localized(self):
+        values = [1234.5, -1, 0.125]
+        self.assertEquals(format_currency_column(values), [format_currency(v) for v in values])
+        self.assertEquals(format_percentage_column(values), [format_percentage(v) for v in values])
+
+    @skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy(self):
+        values = numpy.array([1234.5, -0.5, 1e6, 0.125])
+        self.assertEquals(format_currency_column(values),
+                          ['$1,234.50', '($0.50)', '$1,000,000.00', '$0.12'])
+        self.assertEquals(format_percentage_column(values, 1),
+                          ['123450.0%', '-50.0%', '100000000.0%', '12.5%'])
+        self.assertEquals(format_currency_column(numpy.array([1, -2000]), include_cents=False),
+                          ['$1', '($2,000)'])
@@ -0,0 +1,200 @@
+import logging
+import subprocess
+import sys
+
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.http import HttpResponse
+from django.template import Template, Context, RequestContext, Engine
+from . import settings
+
+from ..builtins import register, currency
+from ..middleware import RenderTimingMiddleware
+from ..instrumentation import (
+    install,
+    uninstall,
+    is_installed,
+    record_renders,
+    local,
+    totals,
+    prometheus_snapshot
+)
+
+
+class InstrumentationTestCase(TestCase):
+
+    def setUp(self):
+        install()
+        totals.clear()
+
+    def tearDown(self):
+        uninstall()
+        totals.clear()
+
+    def render(self, source, **context):
+        return Template(source).render(Context(context))
+
+    def test_install(self):
+        self.assertTrue(is_installed())
+        self.assertIsNot(register.filters['currency'], currency)
+        self.assertIs(register.filters['currency'].__wrapped__, currency)
+        # Installing again doesn't wrap twice
+        install()
+        self.assertIs(register.filters['currency'].__wrapped__, currency)
+
+        uninstall()
+        self.assertFalse(is_installed())
+        self.assertIs(register.filters['currency'], currency)
+
+    def test_not_recording(self):
+        self.assertEquals(self.render('{{ value|currency }}', value=1), '$1.00')
+        self.assertEquals(totals.tags, {})
+
+    def test_filters(self):
+        template = Template('{% for value in values %}{{ value|currency }} {{ value|percentage:1 }} {% endfor %}')
+        with record_renders() as stats:
+            output = template.render(Context({'values': [1, 2, 3]}))
+
+        self.assertEquals(output, '$1.00 100.0% $2.00 200.0% $3.00 300.0% ')
+        self.assertEquals(sorted(stats.tags), ['currency', 'percentage'])
+        self.assertEquals(stats.tags['currency'].count, 3)
+        self.assertEquals(stats.tags['percentage'].count, 3)
+        self.assertGreater(stats.tags['currency'].total, 0)
+        self.assertGreaterEqual(stats.tags['currency'].total, stats.tags['currency'].max)
+        self.assertEquals(list(stats.templates), ['<string>'])
+
+    def test_tags(self):
+        template = Template(
+            '{% query_key_exists "a" %}{% query b=1 %}{% active_query a="1" %}{% endquery_key_exists %}'
+        )
+        request = RequestFactory().get('/', {'a': '1'})
+        with record_renders() as stats:
+            output = template.render(RequestContext(request, {'request': request}))
+
+        self.assertEquals(output, 'a=1&amp;b=1active')
+        self.assertEquals({name: timing.count for name, timing in stats.tags.items()},
+                          {'query_key_exists': 1, 'query': 1, 'active_query': 1})
+        # Block tags include the tags inside them
+        self.assertGreaterEqual(stats.tags['query_key_exists'].total, stats.tags['query'].total)
+
+    def test_templates(self):
+        engine = Engine(
+            loaders=[('django.template.loaders.locmem.Loader', {
+                'page.html': '{{ 1|currency }}{% include "row.html" %}{{ 2|currency }}',
+                'row.html': '{{ 0.5|percentage }}',
+            })],
+            builtins=['django_helpers.builtins']
+        )
+        template = engine.get_template('page.html')
+        with record_renders() as stats:
+            self.assertEquals(template.render(Context()), '$1.0050.00%$2.00')
+            self.assertEquals(currency(1), '$1.00')
+
+        self.assertEquals(stats.templates['page.html']['currency'].count, 2)
+        self.assertEquals(list(stats.templates['row.html']), ['percentage'])
+        # Calls made directly aren't timed
+        self.assertEquals(stats.tags['currency'].count, 2)
+
+    def test_nested(self):
+        with record_renders() as outer:
+            self.render('{{ 1|currency }}')
+            with record_renders() as inner:
+                self.render('{{ 1|currency }}')
+            self.assertEquals(totals.tags, {})
+
+        self.assertEquals(inner.tags['currency'].count, 1)
+        self.assertEquals(outer.tags['currency'].count, 2)
+        self.assertEquals(totals.tags['currency'].count, 2)
+
+    def test_compiled_before_install(self):
+        uninstall()
+        template = Template('{{ 1|currency }}')
+        install()
+        with record_renders() as stats:
+            template.render(Context())
+        self.assertEquals(stats.tags, {})
+
+    def test_prometheus_snapshot(self):
+        with record_renders():
+            self.render('{{ 1|currency }}{{ 2|currency }}{{ 1|percentage }}')
+
+        lines = prometheus_snapshot().splitlines()
+        self.assertIn('# TYPE django_helpers_tag_calls_total counter', lines)
+        self.assertIn('django_helpers_tag_calls_total{tag="currency",template="<string>"} 2', lines)
+        self.assertIn('django_helpers_tag_calls_total{tag="percentage",template="<string>"} 1', lines)
+        self.assertIn('# TYPE django_helpers_tag_seconds_max gauge', lines)
+        self.assertEquals(len([line for line in lines if line.startswith('django_helpers_tag_seconds_total')]), 2)
+
+        prometheus_snapshot(reset=True)
+        self.assertNotIn('currency', prometheus_snapshot())
+
+
+class RenderTimingMiddlewareTestCase(TestCase):
+
+    def tearDown(self):
+        uninstall()
+        totals.clear()
+
+    def view(self, request):
+        return HttpResponse(Template('{{ 1|currency }}{{ 2|intcurrency }}').render(Context()))
+
+    def test_server_timing(self):
+        middleware = RenderTimingMiddleware(self.view)
+        self.assertTrue(is_installed())
+
+        response = middleware(RequestFactory().get('/'))
+        self.assertEquals(response.content, b'$1.00$2')
+        timings = response['Server-Timing'].split(', ')
+        self.assertEquals(sorted(timing.split(';')[0] for timing in timings), ['currency', 'intcurrency'])
+        self.assertIn('desc="1 calls"', timings[0])
+
+    def test_old_style(self):
+        middleware = RenderTimingMiddleware()
+        request = RequestFactory().get('/')
+        middleware.process_request(request)
+        response = middleware.process_response(request, self.view(request))
+        self.assertIn('currency;dur=', response['Server-Timing'])
+        self.assertFalse(hasattr(request, '_render_stats'))
+
+    def test_exception(self):
+        middleware = RenderTimingMiddleware(self.view)
+        request = RequestFactory().get('/')
+        middleware.process_request(request)
+        self.assertEquals(len(local.recordings), 1)
+
+        middleware.process_exception(request, ValueError())
+        self.assertEquals(local.recordings, [])
+        self.assertFalse(hasattr(request, '_render_stats'))
+        self.assertFalse(middleware.process_response(request, HttpResponse()).has_header('Server-Timing'))
+
+    def test_unfinished_request(self):
+        middleware = RenderTimingMiddleware(self.view)
+        middleware.process_request(RequestFactory().get('/'))
+
+        # The next request on the thread only records its own renders
+        request = RequestFactory().get('/')
+        middleware.process_request(request)
+        self.assertEquals(local.recordings, [request._render_stats])
+        response = middleware.process_response(request, self.view(request))
+        self.assertIn('desc="1 calls"', response['Server-Timing'])
+        self.assertEquals(local.recordings, [])
+
+    def test_lazy_import(self):
+        # Using only ResolverMatchMiddleware doesn't load the instrumentation
+        code = 'import sys, django_helpers.middleware; print("django_helpers.instrumentation" in sys.modules)'
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEquals(output.strip(), b'False')
+
+    def test_no_tags(self):
+        middleware = RenderTimingMiddleware(lambda request: HttpResponse('ok'))
+        self.assertFalse(middleware(RequestFactory().get('/')).has_header('Server-Timing'))
+
+    def test_log(self):
+        middleware = RenderTimingMiddleware(self.view)
+        middleware.server_timing = False
+        with self.assertLogs('django_helpers.instrumentation', logging.DEBUG) as logs:
+            response = middleware(RequestFactory().get('/test/'))
+
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertIn('Tag render times for /test/', logs.output[0])
+        self.assertIn('currency: 1 calls', logs.output[0])
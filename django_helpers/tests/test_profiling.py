@@ -0,0 +1,186 @@
+import json
+
+from django.test import TestCase
+from django.http.request import QueryDict
+from django.db.models import Q
+import django_filters
+from . import settings
+
+from .models import Tag, Item, ModelTestCase
+from ..filters import DefaultFilterSet, TagFilter, SearchFilter, tag_id_maps
+from ..search import SearchBackend
+from ..profiling import (
+    q_lookups,
+    plan_warnings,
+    explain,
+    collect_profiles,
+    render_profiles
+)
+
+
+class ProfiledFilterSet(DefaultFilterSet):
+    tags = TagFilter(resolve_ids=True)
+    search = SearchFilter(['name__icontains', 'tags__name__icontains'], exact=False)
+    price = django_filters.MultipleChoiceFilter(choices=[('0', '0'), ('1', '1'), ('2', '2')])
+
+    class Meta:
+        model = Item
+        fields = ['tags', 'search', 'price']
+
+
+class AutoProfiledFilterSet(ProfiledFilterSet):
+    class Meta(ProfiledFilterSet.Meta):
+        profile = 'explain'
+
+
+class ProfilingTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    def setUp(self):
+        foo = Tag.objects.create(name='Foo', slug='foo')
+        Tag.objects.create(name='Bar', slug='bar')
+        for i in range(20):
+            item = Item.objects.create(name='item {}'.format(i), price=i % 3)
+            if i % 2:
+                item.tags.add(foo)
+
+    def test_report(self):
+        filterset = ProfiledFilterSet(QueryDict('tags=foo&search=item+1&price=1'), Item.objects.order_by('pk'))
+        report = filterset.profile()
+        self.assertIs(filterset.profile_report, report)
+
+        self.assertEquals(report['filterset'], 'ProfiledFilterSet')
+        self.assertEquals(report['model'], 'test.Item')
+        self.assertEquals([f['name'] for f in report['filters']], ['tags', 'search', 'price'])
+        self.assertEquals(report['rows'], len(filterset.qs))
+        self.assertEquals(len(report['queries']), 1)
+        self.assertIn('COUNT', report['queries'][0]['sql'])
+        self.assertIn(report['slowest'], ['tags', 'search', 'price'])
+
+        tags, search, price = report['filters']
+        self.assertEquals(tags['value'], ['foo'])
+        self.assertEquals(tags['lookups'], ['tags__in'])
+        self.assertTrue(tags['options']['resolve_ids'])
+        self.assertEquals(tags['rows'], 10)
+        self.assertEquals(search['value'], ['item 1'])
+        self.assertEquals(search['lookups'], ['name__icontains', 'pk__in', 'name__icontains', 'pk__in'])
+        self.assertEquals(search['rows'], 11)
+        self.assertEquals(price['lookups'], ['price'])
+        self.assertGreater(tags['build_time'], 0)
+        self.assertEquals(tags['plan'], None)
+
+        # The report can be serialized
+        json.dumps(report)
+
+    def test_build_queries(self):
+        tag_id_maps.clear()
+        report = ProfiledFilterSet(QueryDict('tags=foo'), Item.objects.all()).profile()
+        # Loading the slug to id map
+        self.assertEquals(len(report['filters'][0]['build_queries']), 1)
+        self.assertIn('slug', report['filters'][0]['build_queries'][0]['sql'])
+
+    def test_inactive_filters(self):
+        report = ProfiledFilterSet(QueryDict(''), Item.objects.all()).profile()
+        self.assertEquals(report['filters'], [])
+        self.assertEquals(report['slowest'], None)
+        self.assertEquals(report['rows'], 20)
+
+        report = ProfiledFilterSet(QueryDict('price=7'), Item.objects.all()).profile()
+        self.assertFalse(report['valid'])
+
+    def test_without_evaluate(self):
+        with self.assertNumQueries(0):
+            report = ProfiledFilterSet(QueryDict('search=item'), Item.objects.all()).profile(evaluate=False)
+        self.assertNotIn('rows', report)
+        self.assertNotIn('queries', report['filters'][0])
+
+    def test_explain(self):
+        report = ProfiledFilterSet(QueryDict('search=item'), Item.objects.order_by('name')).profile(explain=True)
+        self.assertTrue(report['plan'])
+        kinds = set(warning['kind'] for warning in report['warnings'])
+        self.assertEquals(kinds, {'sequential scan', 'temp b-tree'})
+
+        search = report['filters'][0]
+        self.assertIn('sequential scan', [warning['kind'] for warning in search['warnings']])
+
+    def test_explain_empty(self):
+        self.assertEquals(explain(Item.objects.filter(pk__in=[])), (None, []))
+
+    def test_meta_profile(self):
+        filterset = AutoProfiledFilterSet(QueryDict('price=1'), Item.objects.all())
+        self.assertEquals(filterset.qs.count(), 7)
+        self.assertEquals(filterset.profile_report['rows'], 7)
+        self.assertTrue(filterset.profile_report['plan'])
+
+        # Only the first time
+        with self.assertNumQueries(0):
+            filterset.qs
+
+    def test_backend_search(self):
+        class NameBackend(SearchBackend):
+            def search(self, queryset, terms, search_filter):
+                return queryset.filter(name__in=terms)
+
+        class BackendFilterSet(DefaultFilterSet):
+            search = SearchFilter([], backend=NameBackend())
+
+            class Meta:
+                model = Item
+                fields = ['search']
+
+        report = BackendFilterSet(QueryDict('search=item+3'), Item.objects.all()).profile()
+        search = report['filters'][0]
+        self.assertEquals(search['lookups'], None)
+        self.assertEquals(search['options']['backend'], 'NameBackend')
+        self.assertEquals(search['rows'], 1)
+
+    def test_collect_profiles(self):
+        with collect_profiles() as outer:
+            ProfiledFilterSet(QueryDict('price=1'), Item.objects.all()).profile()
+            with collect_profiles() as inner:
+                AutoProfiledFilterSet(QueryDict('price=2'), Item.objects.all()).qs
+        ProfiledFilterSet(QueryDict('price=1'), Item.objects.all()).profile()
+
+        self.assertEquals(len(outer), 2)
+        self.assertEquals(len(inner), 1)
+        self.assertEquals(inner[0]['filterset'], 'AutoProfiledFilterSet')
+
+    def test_render_profiles(self):
+        report = ProfiledFilterSet(
+            QueryDict('search=<b>&price=1'), Item.objects.order_by('name')
+        ).profile(explain=True)
+        html = render_profiles([report])
+        self.assertIn('<h4>ProfiledFilterSet (test.Item)</h4>', html)
+        self.assertIn('<td>name__icontains, pk__in</td>', html)
+        self.assertIn('<td>all filters</td>', html)
+        self.assertIn('temp b-tree', html)
+        self.assertNotIn('<b>', html)
+
+
+class PlanWarningsTestCase(TestCase):
+
+    def test_sqlite(self):
+        plan = [
+            'SCAN test_item',
+            'SEARCH test_item_tags USING INDEX idx (item_id=?)',
+            'SCAN test_tag USING COVERING INDEX slug',
+            'USE TEMP B-TREE FOR ORDER BY',
+        ]
+        self.assertEquals(plan_warnings('sqlite', plan), [
+            {'kind': 'sequential scan', 'step': 'SCAN test_item'},
+            {'kind': 'temp b-tree', 'step': 'USE TEMP B-TREE FOR ORDER BY'},
+        ])
+
+    def test_postgresql(self):
+        plan = [
+            'Sort  (cost=1.5..1.6 rows=20 width=8)',
+            '  ->  Seq Scan on test_item  (cost=0.00..1.20 rows=20 width=8)',
+            '  ->  Index Scan using test_tag_pkey on test_tag  (cost=0.1..8.2 rows=1 width=4)',
+        ]
+        self.assertEquals(plan_warnings('postgresql', plan), [
+            {'kind': 'sequential scan', 'step': 'Seq Scan on test_item  (cost=0.00..1.20 rows=20 width=8)'},
+        ])
+
+    def test_q_lookups(self):
+        q = Q(a=1) & (Q(b__in=[1]) | ~Q(c__gte=2))
+        self.assertEquals(q_lookups(q), ['a', 'b__in', 'c__gte'])
@@ -0,0 +1,94 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase
+from . import settings
+
+from .models import Tag, Item, ModelTestCase
+from ..filters import DefaultFilterSet, SearchFilter
+from ..search import SearchBackend, SQLiteFTS5Backend, PostgresSearchBackend
+
+backend = SQLiteFTS5Backend(['name'])
+
+
+class ItemFilterSet(DefaultFilterSet):
+    search = SearchFilter(['name__icontains'], exact=False, backend=backend)
+
+    class Meta:
+        model = Item
+        fields = ['search']
+
+
+class SQLiteFTS5BackendTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    @classmethod
+    def setUpClass(cls):
+        super(SQLiteFTS5BackendTestCase, cls).setUpClass()
+        backend.create_table(Item)
+
+    @classmethod
+    def tearDownClass(cls):
+        backend.drop_table(Item)
+        super(SQLiteFTS5BackendTestCase, cls).tearDownClass()
+
+    def setUp(self):
+        self.red = Item.objects.create(name='red car')
+        self.blue = Item.objects.create(name='blue car')
+        self.red_red = Item.objects.create(name='red red red')
+
+    def search(self, value):
+        return ItemFilterSet({'search': value}, Item.objects.all()).qs
+
+    def test_search(self):
+        self.assertEquals(set(self.search('car')), {self.red, self.blue})
+        self.assertEquals(list(self.search('red car')), [self.red])
+        self.assertEquals(list(self.search('nope')), [])
+
+    def test_prefix(self):
+        self.assertEquals(list(self.search('blu')), [self.blue])
+
+    def test_ranked(self):
+        self.assertEquals(list(self.search('red')), [self.red_red, self.red])
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEquals(list(self.search('"red OR NOT')), [])
+
+    def test_sync(self):
+        self.blue.name = 'green car'
+        self.blue.save()
+        Item.objects.create(name='green bike')
+        self.red.delete()
+
+        self.assertEquals(set(self.search('green')), {self.blue, Item.objects.get(name='green bike')})
+        self.assertEquals(list(self.search('blue')), [])
+        self.assertEquals(list(self.search('car')), [self.blue])
+
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO test_item_fts(test_item_fts) VALUES ('delete-all')")
+        self.assertEquals(list(self.search('car')), [])
+        backend.rebuild(Item)
+        self.assertEquals(set(self.search('car')), {self.red, self.blue})
+
+
+class SearchBackendTestCase(TestCase):
+
+    def test_search_required(self):
+        class NoSearchBackend(SearchBackend):
+            pass
+
+        with self.assertRaises(TypeError):
+            NoSearchBackend()
+
+
+class PostgresSearchBackendTestCase(TestCase):
+
+    def test_requires_contrib_postgres(self):
+        try:
+            import django.contrib.postgres.search  # noqa
+        except ImportError:
+            with self.assertRaises(ImproperlyConfigured):
+                PostgresSearchBackend(['name']).search(Item.objects.all(), ['foo'], None)
+        else:
+            qs = PostgresSearchBackend(['name']).search(Item.objects.all(), ['foo'], None)
+            self.assertIn('search_rank', qs.query.annotations)
@@ -1,8 +1,32 @@
+from unittest import mock
+
 from django.test import TestCase
+from django.core.cache import cache
+from django.test.utils import override_settings
 from django.test.client import RequestFactory
+from django.conf.urls import url
+from django.http import QueryDict
+from django.views.generic.base import View
 from . import settings
 
-from ..utils import paginate, redirect_or_next
+from .models import Tag, Item, ModelTestCase
+from .. import utils
+from ..filters import DefaultFilterSet
+from ..utils import (
+    paginate,
+    redirect_or_next,
+    resolve_request,
+    get_query_state,
+    QueryState,
+    decode_cursor,
+    encode_cursor,
+    chunked_iterator
+)
+from ..middleware import ResolverMatchMiddleware
+
+urlpatterns = [
+    url(r'^foo/$', View.as_view(), name="foo")
+]
 
 
 class PaginateTestCase(TestCase):
@@ -26,6 +50,179 @@ class PaginateTestCase(TestCase):
         self.assertEquals(page[0], 11)
 
 
+class KeysetPaginateTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    def setUp(self):
+        # Lots of ties on price so the pk has to break them
+        for i in range(25):
+            Item.objects.create(name='item {}'.format(i), price=i % 4)
+        self.items = Item.objects.all()
+        self.expected = list(Item.objects.order_by('-price', 'pk'))
+
+    def get_page(self, cursor=None):
+        params = {'cursor': cursor} if cursor else {}
+        request = RequestFactory().get('/', params)
+        return paginate(request, self.items, 10, keyset=['-price'])
+
+    def test_first_page(self):
+        page = self.get_page()
+        self.assertEquals(list(page), self.expected[:10])
+        self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+        self.assertIs(page.previous_cursor, None)
+
+    def test_walk_forward_and_back(self):
+        pages = [self.get_page()]
+        while pages[-1].has_next():
+            pages.append(self.get_page(pages[-1].next_cursor))
+
+        self.assertEquals(len(pages), 3)
+        self.assertEquals(sum((list(p) for p in pages), []), self.expected)
+        self.assertIs(pages[-1].next_cursor, None)
+
+        page = self.get_page(pages[-1].previous_cursor)
+        self.assertEquals(list(page), self.expected[10:20])
+        self.assertTrue(page.has_previous())
+
+        page = self.get_page(page.previous_cursor)
+        self.assertEquals(list(page), self.expected[:10])
+        self.assertFalse(page.has_previous())
+
+    def test_invalid_cursor(self):
+        self.assertEquals(list(self.get_page('not-a-cursor')), self.expected[:10])
+
+    def test_tampered_cursor(self):
+        # Well formed cursors with values that don't fit the ordering fields
+        for values in (['abc', 1], [1, {'a': 1}], [[1], 2], ['next', 'abc'], [None, 'x']):
+            for direction in ('next', 'previous'):
+                page = self.get_page(encode_cursor(direction, values))
+                self.assertEquals(list(page), self.expected[:10], values)
+
+    def test_queryset_ordering(self):
+        request = RequestFactory().get('/')
+        page = paginate(request, Item.objects.order_by('name'), 10, keyset=True)
+        self.assertEquals(page.ordering, ['name', 'pk'])
+        self.assertEquals(list(page), list(Item.objects.order_by('name')[:10]))
+
+    def test_decode_cursor(self):
+        self.assertEquals(decode_cursor(None, 2), ('next', None))
+        self.assertEquals(decode_cursor('e30', 2), ('next', None))
+
+
+class CountPaginateTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    def setUp(self):
+        for i in range(25):
+            Item.objects.create(name='item {}'.format(i), price=i)
+        self.items = Item.objects.order_by('pk')
+        cache.clear()
+
+    def get_page(self, page, **kwargs):
+        request = RequestFactory().get('/', {'page': page})
+        return paginate(request, self.items, 10, **kwargs)
+
+    def test_uncounted(self):
+        expected = list(self.items[10:20])
+        with self.assertNumQueries(1):
+            page = self.get_page(2, count=False)
+            self.assertEquals(list(page), expected)
+            self.assertTrue(page.has_next())
+            self.assertTrue(page.has_previous())
+            self.assertEquals(page.next_page_number(), 3)
+            self.assertEquals(page.start_index(), 11)
+            self.assertEquals(page.end_index(), 20)
+
+    def test_uncounted_last_page(self):
+        with self.assertNumQueries(1):
+            page = self.get_page(3, count=False)
+            self.assertEquals(len(page), 5)
+            self.assertFalse(page.has_next())
+
+    def test_uncounted_empty_page(self):
+        # Out of range pages fall back to the first page without a count
+        with self.assertNumQueries(2):
+            page = self.get_page(10, count=False)
+            self.assertEquals(page.number, 1)
+            self.assertEquals(len(page), 10)
+
+        with self.assertNumQueries(1):
+            page = self.get_page(0, count=False)
+            self.assertEquals(page.number, 1)
+
+    def test_uncounted_not_an_integer(self):
+        page = self.get_page('foo', count=False)
+        self.assertEquals(page.number, 1)
+
+    def test_cached_count(self):
+        expected = list(self.items[10:20])
+        with self.assertNumQueries(2):
+            page = self.get_page(2, count=60)
+            self.assertEquals(page.paginator.count, 25)
+            self.assertEquals(list(page), expected)
+
+        with self.assertNumQueries(1):
+            page = self.get_page(2, count=60)
+            self.assertEquals(page.paginator.num_pages, 3)
+            self.assertEquals(list(page), expected)
+
+    def test_cached_count_empty_page(self):
+        self.get_page(1, count=60)
+        with self.assertNumQueries(1):
+            page = self.get_page(10, count=60)
+            self.assertEquals(page.number, 3)
+            self.assertEquals(len(page), 5)
+
+    def test_cached_count_key(self):
+        self.get_page(1, count=60)
+        self.items = Item.objects.filter(price__lt=5).order_by('pk')
+        self.assertEquals(self.get_page(1, count=60).paginator.count, 5)
+
+    def test_cached_count_list(self):
+        request = RequestFactory().get('/', {'page': 2})
+        page = paginate(request, list(range(25)), 10, count=60)
+        self.assertEquals(page[0], 10)
+
+
+class ItemFilterSet(DefaultFilterSet):
+    class Meta:
+        model = Item
+        fields = ['price']
+        order_by = ['name']
+
+
+class ChunkedIteratorTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    def setUp(self):
+        for i in range(25):
+            Item.objects.create(name='item {}'.format(24 - i), price=i % 2)
+
+    def test_chunks(self):
+        with self.assertNumQueries(3):
+            items = list(chunked_iterator(Item.objects.order_by('name'), chunk_size=10))
+        self.assertEquals(items, list(Item.objects.order_by('pk')))
+
+    def test_exact_chunks(self):
+        # The last chunk is full so one more query finds there are no more rows
+        with self.assertNumQueries(6):
+            items = list(chunked_iterator(Item.objects.all(), chunk_size=5))
+        self.assertEquals(len(items), 25)
+
+    def test_values_list(self):
+        rows = list(chunked_iterator(Item.objects.all(), chunk_size=10, values_list=['name', 'price']))
+        self.assertEquals(rows, list(Item.objects.order_by('pk').values_list('name', 'price')))
+
+        names = list(chunked_iterator(Item.objects.all(), chunk_size=10, values_list=['name'], flat=True))
+        self.assertEquals(names, list(Item.objects.order_by('pk').values_list('name', flat=True)))
+
+    def test_filterset(self):
+        filterset = ItemFilterSet({'price': '1', 'o': 'name'}, Item.objects.all())
+        items = list(chunked_iterator(filterset, chunk_size=5))
+        self.assertEquals(items, list(Item.objects.filter(price=1).order_by('pk')))
+
+
 class RedirectOrNextTestCase(TestCase):
 
     def test_next(self):
@@ -37,3 +234,64 @@ class RedirectOrNextTestCase(TestCase):
         request = RequestFactory().get('/', {})
         redirect = redirect_or_next(request, 'http://www.ebay.com')
         self.assertEquals(redirect.url, 'http://www.ebay.com')
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class ResolveRequestTestCase(TestCase):
+
+    def test_resolve(self):
+        request = RequestFactory().get('/foo/')
+        match = resolve_request(request)
+        self.assertEquals(match.url_name, 'foo')
+
+    def test_no_match(self):
+        request = RequestFactory().get('/bar/')
+        self.assertIs(resolve_request(request), None)
+
+    def test_resolves_once(self):
+        request = RequestFactory().get('/foo/')
+        with mock.patch.object(utils, 'resolve', wraps=utils.resolve) as resolve:
+            resolve_request(request)
+            resolve_request(request)
+        self.assertEquals(resolve.call_count, 1)
+
+    def test_no_match_resolves_once(self):
+        request = RequestFactory().get('/bar/')
+        with mock.patch.object(utils, 'resolve', wraps=utils.resolve) as resolve:
+            resolve_request(request)
+            resolve_request(request)
+        self.assertEquals(resolve.call_count, 1)
+
+    def test_path_changed(self):
+        request = RequestFactory().get('/foo/')
+        resolve_request(request)
+        request.path = '/bar/'
+        self.assertIs(resolve_request(request), None)
+
+    def test_middleware(self):
+        request = RequestFactory().get('/foo/')
+        ResolverMatchMiddleware().process_request(request)
+        with mock.patch.object(utils, 'resolve') as resolve:
+            match = resolve_request(request)
+        self.assertFalse(resolve.called)
+        self.assertEquals(match.url_name, 'foo')
+
+
+class QueryStateTestCase(TestCase):
+
+    def test_cached_on_request(self):
+        request = RequestFactory().get('/', {'foo': 'bar'})
+        self.assertIs(get_query_state(request), get_query_state(request))
+
+    def test_get_replaced(self):
+        request = RequestFactory().get('/', {'foo': 'bar'})
+        get_query_state(request)
+        request.GET = QueryDict('foo=baz')
+        self.assertEquals(get_query_state(request).getlist('foo'), ('baz',))
+
+    def test_urlencode(self):
+        state = QueryState(QueryDict('a=1&b=2&b=3'))
+        self.assertEquals(state.urlencode(), 'a=1&b=2&b=3')
+        self.assertEquals(state.urlencode({'a': None}), 'b=2&b=3')
+        self.assertEquals(state.urlencode({'a': ['x y'], 'c': ['4']}), 'a=x+y&b=2&b=3&c=4')
+        self.assertEquals(state.urlencode({'b': []}), 'a=1')
@@ -0,0 +1,117 @@
+from django.http import HttpResponse, QueryDict
+from django.test.client import RequestFactory
+from django.views.generic.base import View
+from . import settings
+
+import django_filters
+
+from .models import Tag, Item, ModelTestCase
+from ..filters import DefaultFilterSet, TagFilter, filter_state_key
+from ..views import filter_etag, filter_etag_condition, FilterETagMixin
+
+
+class ItemFilterSet(DefaultFilterSet):
+    tags = TagFilter()
+    ids = django_filters.CharFilter(action=lambda qs, value: qs)
+
+    class Meta:
+        model = Item
+        fields = ['tags', 'price', 'ids']
+        order_by = ['name', '-name']
+        defaults = {
+            'price': '1'
+        }
+        comma_separated = ['ids']
+
+
+class FilterStateKeyTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    def key(self, query_string):
+        return filter_state_key(ItemFilterSet(QueryDict(query_string), Item.objects.all()))
+
+    def test_defaults(self):
+        self.assertEquals(self.key(''), 'price=1')
+        self.assertEquals(self.key(''), self.key('price=1'))
+
+    def test_multiple_values(self):
+        self.assertEquals(self.key('tags=b&tags=a'), self.key('tags=a&tags=b&tags=a'))
+        self.assertEquals(self.key('tags=b&tags=a'), 'price=1&tags=a&tags=b')
+
+    def test_comma_separated(self):
+        self.assertEquals(self.key('ids=1,2,3'), self.key('ids=3&ids=1,2'))
+        self.assertEquals(self.key('ids=1,2,3'), self.key('ids=1,,2,3,'))
+
+    def test_single_value_keeps_last(self):
+        self.assertEquals(self.key('price=2&price=3'), 'price=3')
+        self.assertNotEquals(self.key('price=2&price=3'), self.key('price=3&price=2'))
+
+    def test_ignores_other_params(self):
+        self.assertEquals(self.key('tags=a&page=2&foo=bar'), self.key('tags=a'))
+
+
+def item_list(request):
+    item_list.calls += 1
+    return HttpResponse('items')
+
+
+item_list.calls = 0
+
+
+class ItemListView(FilterETagMixin, View):
+    filterset_class = ItemFilterSet
+
+    def get(self, request):
+        return HttpResponse(str(len(self.get_filterset().qs)))
+
+
+class FilterETagTestCase(ModelTestCase):
+    models = [Tag, Item]
+
+    def setUp(self):
+        self.item = Item.objects.create(name='foo', price=1)
+        Item.objects.create(name='bar', price=1)
+
+    def etag(self, query_string):
+        return filter_etag(ItemFilterSet(QueryDict(query_string), Item.objects.all()))
+
+    def test_etag(self):
+        etag = self.etag('tags=a&tags=b')
+        self.assertEquals(etag, self.etag('tags=b&tags=a&page=3'))
+        self.assertNotEquals(etag, self.etag('tags=b'))
+
+    def test_etag_changes(self):
+        etag = self.etag('')
+        self.item.name = 'baz'
+        self.item.save()
+        self.assertNotEquals(self.etag(''), etag)
+
+        etag = self.etag('')
+        self.item.delete()
+        self.assertNotEquals(self.etag(''), etag)
+
+    def test_decorator(self):
+        view = filter_etag_condition(ItemFilterSet)(item_list)
+        response = view(RequestFactory().get('/', {'price': '1'}))
+        self.assertEquals(response.status_code, 200)
+        # A single quoted entity-tag (RFC 7232)
+        self.assertRegex(response['ETag'], r'^"[0-9a-f]{32}"$')
+        calls = item_list.calls
+
+        request = RequestFactory().get('/', {'price': '1'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        response = view(request)
+        self.assertEquals(response.status_code, 304)
+        self.assertEquals(item_list.calls, calls)
+
+    def test_mixin(self):
+        view = ItemListView.as_view()
+        response = view(RequestFactory().get('/'))
+        self.assertEquals(response.content, b'2')
+        self.assertRegex(response['ETag'], r'^"[0-9a-f]{32}"$')
+
+        request = RequestFactory().get('/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEquals(view(request).status_code, 304)
+
+        Item.objects.create(name='new', price=1)
+        request = RequestFactory().get('/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEquals(view(request).content, b'3')
@@ -1,10 +1,46 @@
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+from collections.abc import Sequence
+
 from django.shortcuts import redirect
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator, Page, EmptyPage, PageNotAnInteger
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.urlresolvers import resolve, Resolver404
+from django.db.models import Q
+from django.http import QueryDict
+
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:  # Django < 1.11
+    from django.db.models.sql.datastructures import EmptyResultSet
 
 
-def paginate(request, items, page_size):
+def paginate(request, items, page_size, keyset=None, count=True):
+    """
+    Returns the page of items for the 'page' param in request.GET. Out of
+    range pages return the last page and invalid pages return the first.
 
-    paginator = Paginator(items, page_size)
+    count=False skips the COUNT query (see UncountedPaginator), finding the
+    last page would need one so out of range pages return the first. An int
+    count caches the count for that many seconds (see CachedCountPaginator).
+    When keyset is set the items (a queryset) are paginated by seeking on
+    the keyset ordering instead of with an OFFSET and the page is picked by
+    the opaque 'cursor' param instead, see paginate_keyset.
+    """
+    if keyset is not None:
+        return paginate_keyset(request, items, page_size, keyset)
+
+    if count is True:
+        paginator = Paginator(items, page_size)
+    elif count is False:
+        paginator = UncountedPaginator(items, page_size)
+    else:
+        paginator = CachedCountPaginator(items, page_size, timeout=count)
     page = request.GET.get('page')
 
     try:
@@ -12,13 +48,497 @@ def paginate(request, items, page_size):
     except PageNotAnInteger:
         page = paginator.page(1)
     except EmptyPage:
-        page = paginator.page(paginator.num_pages)
+        if count is False:
+            page = paginator.page(1)
+        else:
+            page = paginator.page(paginator.num_pages)
+
+    return page
+
+
+class UncountedPaginator(Paginator):
+    """
+    A Paginator that doesn't run a COUNT query to build a page. Each page
+    fetches one extra row to know if there is a next page. Anything that
+    needs the count (num_pages, page_range etc) still counts.
+    """
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+
+        if not object_list and number > 1:
+            raise EmptyPage('That page contains no results')
+
+        return UncountedPage(
+            object_list[:self.per_page], number, self,
+            has_next=len(object_list) > self.per_page
+        )
+
+
+class UncountedPage(Page):
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super(UncountedPage, self).__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def __repr__(self):
+        return '<Page {}>'.format(self.number)
+
+    def has_next(self):
+        return self._has_next
+
+    def next_page_number(self):
+        if not self.has_next():
+            raise EmptyPage('That page contains no results')
+        return self.number + 1
+
+    def start_index(self):
+        if not self.object_list:
+            return 0
+        return (self.number - 1) * self.paginator.per_page + 1
+
+    def end_index(self):
+        return self.start_index() + len(self) - 1 if self.object_list else 0
+
+
+class CachedCountPaginator(Paginator):
+    """
+    A Paginator that caches the count of a queryset in the django cache for
+    timeout seconds. The cache key is built from the queryset's SQL and
+    params so it is shared by every request for the same query.
+    """
+
+    def __init__(self, object_list, per_page, timeout=None, **kwargs):
+        super(CachedCountPaginator, self).__init__(object_list, per_page, **kwargs)
+        self.timeout = timeout
+        self._cached_count = None
+
+    @property
+    def count(self):
+        if self._cached_count is None:
+            key = count_cache_key(self.object_list)
+            if key is None:
+                self._cached_count = super(CachedCountPaginator, self).count
+            else:
+                self._cached_count = cache.get(key)
+                if self._cached_count is None:
+                    self._cached_count = self.object_list.count()
+                    cache.set(key, self._cached_count, self.timeout)
+        return self._cached_count
+
+
+def count_cache_key(qs):
+    """
+    Returns the cache key for the count of a queryset, None when qs is not a
+    queryset or its SQL can't be built (e.g. an empty __in).
+    """
+    key = queryset_key(qs)
+    if key is None:
+        return None
+    return 'django_helpers.count.{}'.format(key)
+
+
+def queryset_key(qs):
+    """
+    Returns a hash of a queryset's database, SQL and params for use in cache
+    keys, None when qs is not a queryset or its SQL can't be built.
+    """
+    query = getattr(qs, 'query', None)
+    if query is None or not hasattr(query, 'sql_with_params'):
+        return None
+
+    try:
+        sql, params = query.sql_with_params()
+    except EmptyResultSet:
+        return None
+
+    key = repr((qs.db, sql, params)).encode('utf-8')
+    return hashlib.md5(key).hexdigest()
+
+
+def paginate_keyset(request, items, page_size, ordering=True):
+    """
+    Paginates a queryset by seeking on an (indexed) ordering, e.g.
+    ['-created', 'pk'], rather than using an OFFSET so every page costs the
+    same no matter how deep it is. ordering=True uses the queryset's own
+    ordering. The primary key is added to the end of the ordering when it is
+    not already in it so that ties are broken consistently, the ordering
+    fields should not be nullable.
+
+    The page is picked by the opaque 'cursor' param in request.GET, a
+    missing or invalid cursor returns the first page. Returns a KeysetPage.
+    """
+    if ordering is True:
+        ordering = items.query.order_by or items.model._meta.ordering
+
+    ordering = list(ordering)
+    pk_names = ('pk', items.model._meta.pk.name)
+    if not any(field.lstrip('-') in pk_names for field in ordering):
+        ordering.append('pk')
+
+    direction, values = decode_cursor(request.GET.get('cursor'), len(ordering))
+    page = keyset_page(items, page_size, ordering, direction, values)
+
+    if direction == 'previous' and not page:
+        # Nothing before the cursor (the rows were removed), start over
+        page = keyset_page(items, page_size, ordering, 'next', None)
 
     return page
 
 
+def keyset_page(items, page_size, ordering, direction, values):
+    if direction == 'previous':
+        # Seek backwards by reversing the ordering, the page is flipped back
+        # around once it has been fetched
+        seek_ordering = [reverse_ordering(field) for field in ordering]
+    else:
+        seek_ordering = ordering
+
+    qs = items.order_by(*seek_ordering)
+    if values is None:
+        object_list = list(qs[:page_size + 1])
+    else:
+        try:
+            object_list = list(qs.filter(keyset_seek(seek_ordering, values))[:page_size + 1])
+        except (ValueError, TypeError, ValidationError):
+            # A well formed cursor with values that don't fit the ordering
+            # fields (it was tampered with), start over like any bad cursor
+            return keyset_page(items, page_size, ordering, 'next', None)
+
+    has_more = len(object_list) > page_size
+    object_list = object_list[:page_size]
+
+    if direction == 'previous':
+        object_list.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, values is not None
+
+    return KeysetPage(object_list, ordering, has_next, has_previous)
+
+
+def keyset_seek(ordering, values):
+    """
+    Returns a Q that matches the rows after values in the ordering, i.e.
+    (a > 1) OR (a = 1 AND b > 2) OR ... for ['a', 'b', ...].
+    """
+    seek = Q()
+    for i, field in enumerate(ordering):
+        lookup = '{}__lt' if field.startswith('-') else '{}__gt'
+        q = Q(**{lookup.format(field.lstrip('-')): values[i]})
+        for prev_field, prev_value in zip(ordering[:i], values[:i]):
+            q &= Q(**{prev_field.lstrip('-'): prev_value})
+        seek |= q
+    return seek
+
+
+def reverse_ordering(field):
+    return field[1:] if field.startswith('-') else '-' + field
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder rounds times to milliseconds, a cursor needs the exact
+    value to seek on.
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super(CursorEncoder, self).default(o)
+
+
+# The JSON types a cursor value can have, lists and objects are never valid
+CURSOR_VALUE_TYPES = (str, int, float)
+
+
+def encode_cursor(direction, values):
+    data = json.dumps([direction] + list(values), cls=CursorEncoder)
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """
+    Returns the (direction, values) for a cursor, ('next', None) when the
+    cursor is missing or invalid.
+    """
+    if cursor:
+        try:
+            cursor = cursor.encode('ascii')
+            data = json.loads(base64.urlsafe_b64decode(cursor + b'=' * (-len(cursor) % 4)).decode('utf-8'))
+        except (ValueError, TypeError, UnicodeError, binascii.Error):
+            data = None
+
+        if (isinstance(data, list) and len(data) == length + 1 and data[0] in ('next', 'previous') and
+                all(value is None or isinstance(value, CURSOR_VALUE_TYPES) for value in data[1:])):
+            return data[0], data[1:]
+
+    return 'next', None
+
+
+class KeysetPage(Sequence):
+    """
+    A page from paginate_keyset. It works like a django Page but instead of
+    page numbers it has next_cursor and previous_cursor, the values for the
+    'cursor' param of the next and previous pages (or None).
+    """
+
+    def __init__(self, object_list, ordering, has_next, has_previous):
+        self.object_list = object_list
+        self.ordering = ordering
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Keyset page of {} items>'.format(len(self))
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def cursor_values(self, obj):
+        values = []
+        for field in self.ordering:
+            value = obj
+            for name in field.lstrip('-').split('__'):
+                value = value[name] if isinstance(value, dict) else getattr(value, name)
+            values.append(value)
+        return values
+
+    @property
+    def next_cursor(self):
+        if not self.has_next() or not self.object_list:
+            return None
+        return encode_cursor('next', self.cursor_values(self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous() or not self.object_list:
+            return None
+        return encode_cursor('previous', self.cursor_values(self.object_list[0]))
+
+
+def chunked_iterator(items, chunk_size=1000, values_list=None, flat=False):
+    """
+    Yields every row of a queryset (or of a FilterSet's qs) while only
+    holding chunk_size rows in memory. The rows are fetched in primary key
+    ranges (pk > the last pk seen) so every chunk costs the same, unlike
+    paging with an OFFSET. Rows come back in primary key order.
+
+    Pass a list of field names as values_list to yield tuples instead of
+    model instances, flat=True yields the single value for one field.
+    """
+    if hasattr(items, 'qs'):
+        items = items.qs
+
+    qs = items.order_by('pk')
+    if values_list is not None:
+        qs = qs.values_list('pk', *values_list)
+
+    last_pk = None
+    while True:
+        chunk = qs if last_pk is None else qs.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            return
+
+        if values_list is None:
+            last_pk = rows[-1].pk
+            for row in rows:
+                yield row
+        else:
+            last_pk = rows[-1][0]
+            for row in rows:
+                yield row[1] if flat else row[1:]
+
+        if len(rows) < chunk_size:
+            return
+
+
 def redirect_or_next(request, url_name, *args, **kwargs):
     if 'next' in request.GET:
         return redirect(request.GET['next'])
     else:
         return redirect(url_name, *args, **kwargs)
+
+
+def resolve_request(request):
+    """
+    Resolves request.path and caches the ResolverMatch on the request so the
+    url resolver only runs once per request no matter how many times this is
+    called (e.g. by active_path in a large nav). Returns None when the path
+    does not resolve, and that miss is cached as well.
+    """
+    cached = getattr(request, '_resolver_match_cache', None)
+
+    # The cache is keyed on the path in case the request is modified after
+    # it was first resolved.
+    if cached is None or cached[0] != request.path:
+        try:
+            match = resolve(request.path)
+        except Resolver404:
+            match = None
+
+        cached = (request.path, match)
+        request._resolver_match_cache = cached
+
+    return cached[1]
+
+
+def get_query_state(request):
+    """
+    Returns a QueryState snapshot of request.GET. The snapshot is cached on
+    the request so all the query tags on a page share it instead of each
+    copying the QueryDict.
+    """
+    cached = getattr(request, '_query_state_cache', None)
+
+    if cached is None or cached[0] is not request.GET:
+        cached = (request.GET, QueryState(request.GET))
+        request._query_state_cache = cached
+
+    return cached[1]
+
+
+class QueryState(object):
+    """
+    An immutable snapshot of a QueryDict. Query strings with some keys
+    changed are built from the snapshot by re-encoding only the changed keys,
+    the encoded form of every other key is computed once and reused. The
+    output is the same as changing a copy of the QueryDict and calling
+    urlencode() on it.
+    """
+
+    def __init__(self, query_dict):
+        self.encoding = query_dict.encoding
+        self.keys = tuple(query_dict.keys())
+        self.lists = dict((k, tuple(v)) for k, v in query_dict.lists())
+        self._encoded = {}
+
+    def __contains__(self, key):
+        return key in self.lists
+
+    def getlist(self, key):
+        return self.lists.get(key, ())
+
+    def encode(self, key, values):
+        """
+        Returns the urlencoded params for a key and a list of values.
+        """
+        query_dict = QueryDict(mutable=True, encoding=self.encoding)
+        query_dict.setlist(key, values)
+        return query_dict.urlencode()
+
+    def encoded(self, key):
+        """
+        Returns the (cached) urlencoded params for a key in the snapshot.
+        """
+        try:
+            return self._encoded[key]
+        except KeyError:
+            segment = self._encoded[key] = self.encode(key, self.lists[key])
+            return segment
+
+    def urlencode_around(self, key):
+        """
+        Returns the urlencoded snapshot split around key as a (before, after)
+        tuple, key itself is left out. When key isn't in the snapshot all the
+        params are in before since new keys are added at the end.
+        """
+        try:
+            return self._encoded[key, 'around']
+        except KeyError:
+            pass
+
+        index = self.keys.index(key) if key in self.lists else len(self.keys)
+        around = (
+            '&'.join(s for s in map(self.encoded, self.keys[:index]) if s),
+            '&'.join(s for s in map(self.encoded, self.keys[index + 1:]) if s)
+        )
+        self._encoded[key, 'around'] = around
+        return around
+
+    def urlencode(self, changes=None):
+        """
+        Returns the urlencoded snapshot with changes applied. changes maps
+        keys to their new list of values, a value of None (or an empty list)
+        removes the key. Changed keys keep their position and new keys are
+        added at the end in the order of changes.
+        """
+        changes = changes or {}
+        segments = []
+
+        for key in self.keys:
+            if key in changes:
+                values = changes[key]
+                segment = self.encode(key, values) if values else ''
+            else:
+                segment = self.encoded(key)
+
+            if segment:
+                segments.append(segment)
+
+        for key, values in changes.items():
+            if key not in self.lists and values:
+                segments.append(self.encode(key, values))
+
+        return '&'.join(segments)
+
+
+def query_cache_key(name, state, only=None, vary=()):
+    """
+    Returns the cache key for a fragment cached with the query_cache tag.
+    The params in the QueryState are normalized (sorted keys and values) so
+    the same params in a different order share the key, with only set the
+    other keys are left out. vary is a list of any other values the
+    fragment depends on.
+    """
+    params = tuple(sorted(
+        (key, tuple(sorted(values)))
+        for key, values in state.lists.items()
+        if only is None or key in only
+    ))
+    version = cache.get(query_cache_version_key(name), 0)
+    key = repr((params, tuple(vary))).encode('utf-8')
+
+    return 'django_helpers.query_cache.{}.{}.{}'.format(
+        hashlib.md5(name.encode('utf-8')).hexdigest(), version, hashlib.md5(key).hexdigest()
+    )
+
+
+def query_cache_version_key(name):
+    return 'django_helpers.query_cache_version.{}'.format(hashlib.md5(name.encode('utf-8')).hexdigest())
+
+
+def invalidate_query_cache(name):
+    """
+    Invalidates every cached copy of the query_cache fragment name by
+    bumping its version.
+    """
+    key = query_cache_version_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
@@ -0,0 +1,72 @@
+import hashlib
+
+import django
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+from .filters import filter_state_key
+
+
+def filter_etag(filterset, updated_field='updated_at'):
+    """
+    Returns an ETag for the results of a filterset built from its filter
+    state (see filter_state_key), the newest updated_field and the number of
+    rows in its filtered queryset. Any change to the filters or to the rows
+    (including deletes) gives a new ETag. Before Django 1.11 condition()
+    quotes the ETag itself so it is returned unquoted there.
+    """
+    stats = filterset.qs.order_by().aggregate(
+        newest=Max(updated_field),
+        count=Count('pk')
+    )
+    key = repr((filter_state_key(filterset), stats['newest'], stats['count']))
+    etag = hashlib.md5(key.encode('utf-8')).hexdigest()
+    if django.VERSION < (1, 11):
+        return etag
+    return '"{}"'.format(etag)
+
+
+def filter_etag_condition(filterset_class, queryset=None, updated_field='updated_at'):
+    """
+    View decorator that answers conditional GETs for a filtered list with a
+    304 without calling the view when nothing changed, see filter_etag.
+    queryset can be a callable that takes the request.
+
+        @filter_etag_condition(ItemFilterSet)
+        def item_list(request):
+            ...
+    """
+    def etag_func(request, *args, **kwargs):
+        qs = queryset(request) if callable(queryset) else queryset
+        if qs is not None:
+            qs = qs.all()
+        return filter_etag(filterset_class(request.GET, qs), updated_field)
+
+    return condition(etag_func=etag_func)
+
+
+class FilterETagMixin(object):
+    """
+    Class based view mixin that answers conditional GETs with a 304 without
+    rendering when the filtered results haven't changed, see filter_etag.
+    The filterset is built once by get_filterset and can be reused by the
+    view.
+    """
+
+    filterset_class = None
+    etag_updated_field = 'updated_at'
+
+    def get_filterset_queryset(self):
+        return None
+
+    def get_filterset(self):
+        if not hasattr(self, 'filterset'):
+            self.filterset = self.filterset_class(self.request.GET, self.get_filterset_queryset())
+        return self.filterset
+
+    def dispatch(self, request, *args, **kwargs):
+        def etag_func(request, *args, **kwargs):
+            return filter_etag(self.get_filterset(), self.etag_updated_field)
+
+        dispatch = super(FilterETagMixin, self).dispatch
+        return condition(etag_func=etag_func)(dispatch)(request, *args, **kwargs)
@@ -12,7 +12,7 @@ setup(
     url='https://github.com/ShowroomLogic/django-helpers',
     author=__author__,
     author_email=__author_email__,
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     install_requires=[
         'django-filter==0.13.0'
     ],